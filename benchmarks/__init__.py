@@ -0,0 +1,6 @@
+"""
+Paquete de pruebas de rendimiento del recomendador de coches.
+
+Genera catálogos y valoraciones sintéticos con la misma forma que los datos reales y mide
+cada etapa de la recomendación sin acceso a la red (ver benchmarks/run.py).
+"""
@@ -0,0 +1,271 @@
+"""
+Pruebas de rendimiento reproducibles de cada etapa de la recomendación.
+
+Para cada tamaño de catálogo genera datos sintéticos en un directorio temporal y mide la
+carga de datos, el entrenamiento del modelo colaborativo, la similitud de contenido, la
+penalización geográfica y la recomendación completa, en memoria, por fragmentos y en
+paralelo. Para cada etapa informa de los percentiles de latencia, las filas por segundo y
+el pico de memoria, y guarda los resultados en JSON para poder comparar ejecuciones.
+Nominatim se sustituye por un geocodificador local, así que no se necesita acceso a la red.
+
+Uso:
+    python -m benchmarks.run --sizes 50000 500000 5000000 --output resultados.json
+    python -m benchmarks.run --sizes 50000 --compare resultados.json
+"""
+
+import argparse
+import datetime
+import json
+import os
+import platform
+import shutil
+import sys
+import tempfile
+import time
+import tracemalloc
+import numpy as np
+import pandas as pd
+
+from modules.collaborative_filter import CollaborativeFilter
+from modules.content_filter import ContentFilter
+from modules.data_loader import DataLoader
+from modules.geo_utils import GeoUtils
+from modules.hybrid_recommender import HybridRecommender
+from modules.sharding import ShardedCatalog
+from modules.streaming import CatalogStream
+from .synthetic import OfflineGeocoder, generate_catalog, generate_ratings
+
+DEFAULT_SIZES = [50_000, 500_000, 5_000_000]
+
+# Consultas representativas que se repiten de forma cíclica en cada etapa
+QUERIES = [
+    ({'make': 'SEAT', 'price': 15000, 'fuel': 'Diesel', 'year': 2018, 'kms': None,
+      'power': None, 'doors': 5, 'shift': 'Manual', 'color': None},
+     {'make': 5, 'price': 8, 'fuel': 3, 'year': 2, 'kms': 0, 'power': 0, 'doors': 1,
+      'shift': 4, 'color': 0, 'distance': 6}, 'Madrid'),
+    ({'make': 'BMW', 'price': 40000, 'fuel': None, 'year': None, 'kms': 20000, 'power': 190,
+      'doors': None, 'shift': 'Automatico', 'color': 'Negro'},
+     {'make': 9, 'price': 2, 'fuel': 0, 'year': 0, 'kms': 3, 'power': 4, 'doors': 0,
+      'shift': 1, 'color': 2, 'distance': 1}, 'Galicia'),
+    ({'make': None, 'price': 9000, 'fuel': 'Gasolina', 'year': 2010, 'kms': None,
+      'power': None, 'doors': None, 'shift': None, 'color': None},
+     {'price': 5, 'fuel': 5, 'year': 5, 'distance': 10}, 'Valencia'),
+]
+
+
+def measure(function, repeat: int, rows: int) -> dict:
+    """
+    Mide la latencia y el pico de memoria de una función.
+
+    La función se ejecuta repeat veces para medir el tiempo y una vez más con tracemalloc
+    activo para medir el pico de memoria, de forma que el seguimiento de memoria no
+    distorsione los tiempos.
+
+    Args:
+        function (callable): Función a medir. Recibe el número de repetición.
+        repeat (int): Número de ejecuciones cronometradas.
+        rows (int): Número de filas procesadas en cada ejecución.
+
+    Returns:
+        dict: Percentiles de latencia en milisegundos, filas por segundo y pico de memoria.
+    """
+    samples = []
+    for iteration in range(repeat):
+        start = time.perf_counter()
+        function(iteration)
+        samples.append(time.perf_counter() - start)
+
+    tracemalloc.start()
+    function(repeat)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    samples = np.array(samples)
+    return {
+        'runs': repeat,
+        'rows': rows,
+        'mean_ms': float(samples.mean() * 1000),
+        'p50_ms': float(np.percentile(samples, 50) * 1000),
+        'p90_ms': float(np.percentile(samples, 90) * 1000),
+        'p99_ms': float(np.percentile(samples, 99) * 1000),
+        'min_ms': float(samples.min() * 1000),
+        'rows_per_sec': float(rows / samples.mean()) if samples.mean() > 0 else None,
+        'peak_memory_mb': peak / 2 ** 20
+    }
+
+
+def benchmark_size(n_rows: int, repeat: int, train_repeat: int, workdir: str,
+                   seed: int, workers: int = None) -> dict:
+    """
+    Ejecuta todas las etapas para un catálogo sintético de n_rows coches.
+
+    Args:
+        n_rows (int): Número de coches del catálogo.
+        repeat (int): Número de ejecuciones cronometradas de cada etapa de consulta.
+        train_repeat (int): Número de entrenamientos cronometrados del modelo colaborativo.
+        workdir (str): Directorio en el que se escriben los datos sintéticos.
+        seed (int): Semilla de los datos sintéticos.
+        workers (int): Número de procesos de la recomendación en paralelo.
+                       Por defecto, uno por núcleo.
+
+    Returns:
+        dict: Resultados de cada etapa.
+    """
+    cars_path = os.path.join(workdir, f'coches_{n_rows}.csv')
+    ratings_path = os.path.join(workdir, f'car_ratings_{n_rows}.csv')
+    cache_path = os.path.join(workdir, 'distance_cache.csv')
+    shutil.copy('data/distance_cache.csv', cache_path)
+
+    print(f"Generando {n_rows} coches sintéticos...")
+    cars = generate_catalog(n_rows, seed=seed)
+    cars.to_csv(cars_path, index=False)
+    n_ratings = max(1000, n_rows // 2)
+    generate_ratings(n_ratings, cars['model_id'], seed=seed).to_csv(ratings_path, index=False)
+    del cars
+
+    stages = {}
+    loader = DataLoader(cars_path, ratings_path)
+
+    def load_cold(_):
+        # Sin instantáneas: se interpretan los CSV y se escriben las instantáneas
+        for snapshot in (loader.cars_snapshot, loader.ratings_snapshot):
+            if os.path.exists(snapshot.snapshot_path):
+                os.remove(snapshot.snapshot_path)
+        loader.load_data()
+
+    stages['load_data_cold'] = measure(load_cold, 1, n_rows)
+    stages['load_data'] = measure(lambda _: loader.load_data(), repeat, n_rows)
+
+    def train(iteration):
+        model_path = os.path.join(workdir, f'model_{n_rows}_{iteration}.bin')
+        if os.path.exists(model_path):
+            os.remove(model_path)
+        CollaborativeFilter(model_path).train_model(ratings_path)
+
+    stages['train_model'] = measure(train, train_repeat, n_ratings)
+
+    catalog = loader.load_catalog()
+    collaborative_model = CollaborativeFilter(os.path.join(workdir, f'model_{n_rows}_0.bin'))
+    collaborative_model.train_model(ratings_path)
+    geocoder = OfflineGeocoder()
+    geo_calculator = GeoUtils(cache_file=cache_path, geolocator=geocoder)
+    recommender = HybridRecommender(collaborative_model, geo_calculator)
+
+    def query(iteration):
+        return QUERIES[iteration % len(QUERIES)]
+
+    def content(iteration):
+        user_input, feature_weights, _ = query(iteration)
+        ContentFilter.calculate_content_similarity(user_input, catalog, dict(feature_weights))
+
+    def penalty(iteration):
+        _, feature_weights, location = query(iteration)
+        car_data = catalog.data.copy(deep=False)
+        geo_calculator.apply_penalty(car_data, location, feature_weights['distance'])
+
+    def recommend(iteration):
+        user_input, feature_weights, location = query(iteration)
+        recommender.recommend(f'user_{iteration}', user_input, dict(feature_weights),
+                              location, catalog, top_k=10)
+
+    stages['content_similarity'] = measure(content, repeat, n_rows)
+    stages['apply_penalty'] = measure(penalty, repeat, n_rows)
+    stages['recommend'] = measure(recommend, repeat, n_rows)
+    stages['recommend']['geocoder_calls'] = geocoder.calls
+
+    # Misma consulta recorriendo la instantánea por fragmentos: el pico de memoria depende
+    # del tamaño de fragmento y no del catálogo
+    stream = CatalogStream(cars_path)
+
+    def recommend_stream(iteration):
+        user_input, feature_weights, location = query(iteration)
+        recommender.recommend_stream(f'user_{iteration}', user_input, feature_weights,
+                                     location, stream, top_k=10)
+
+    stages['recommend_stream'] = measure(recommend_stream, repeat, n_rows)
+
+    # Misma consulta repartida entre varios procesos con el catálogo en memoria compartida
+    with ShardedCatalog(catalog, workers=workers) as shards:
+        def recommend_sharded(iteration):
+            user_input, feature_weights, location = query(iteration)
+            recommender.recommend_sharded(f'user_{iteration}', user_input, feature_weights,
+                                          location, shards, top_k=10)
+
+        stages['recommend_sharded'] = measure(recommend_sharded, repeat, n_rows)
+        stages['recommend_sharded']['workers'] = shards.workers
+    return stages
+
+
+def compare(results: dict, baseline: dict) -> None:
+    """
+    Muestra la variación de la latencia media respecto a una ejecución anterior.
+
+    Args:
+        results (dict): Resultados de la ejecución actual.
+        baseline (dict): Resultados de la ejecución anterior.
+    """
+    print("\nComparación con la ejecución anterior (latencia media):")
+    for size, stages in results['sizes'].items():
+        for stage, result in stages.items():
+            previous = baseline.get('sizes', {}).get(size, {}).get(stage)
+            if previous and previous['mean_ms'] > 0:
+                ratio = result['mean_ms'] / previous['mean_ms']
+                print(f"  {size:>9} {stage:<22} {previous['mean_ms']:10.2f} ms -> "
+                      f"{result['mean_ms']:10.2f} ms  (x{ratio:.2f})")
+
+
+def main():
+    """
+    Punto de entrada de las pruebas de rendimiento.
+    """
+    parser = argparse.ArgumentParser(description="Pruebas de rendimiento del recomendador.")
+    parser.add_argument('--sizes', type=int, nargs='+', default=DEFAULT_SIZES,
+                        help="Tamaños de catálogo a medir.")
+    parser.add_argument('--repeat', type=int, default=10,
+                        help="Ejecuciones cronometradas de cada etapa de consulta.")
+    parser.add_argument('--train-repeat', type=int, default=1,
+                        help="Entrenamientos cronometrados del modelo colaborativo.")
+    parser.add_argument('--seed', type=int, default=0, help="Semilla de los datos sintéticos.")
+    parser.add_argument('--workers', type=int,
+                        help="Procesos de la recomendación en paralelo (por defecto, uno por "
+                             "núcleo).")
+    parser.add_argument('--output', default='benchmark_results.json',
+                        help="Archivo JSON en el que se guardan los resultados.")
+    parser.add_argument('--compare', metavar='JSON',
+                        help="Resultados de una ejecución anterior con los que comparar.")
+    args = parser.parse_args()
+
+    results = {
+        'timestamp': datetime.datetime.now().isoformat(timespec='seconds'),
+        'python': sys.version.split()[0],
+        'platform': platform.platform(),
+        'numpy': np.__version__,
+        'pandas': pd.__version__,
+        'seed': args.seed,
+        'sizes': {}
+    }
+    with tempfile.TemporaryDirectory(prefix='car_benchmark_') as workdir:
+        for n_rows in args.sizes:
+            results['sizes'][str(n_rows)] = benchmark_size(
+                n_rows, args.repeat, args.train_repeat, workdir, args.seed, args.workers
+            )
+
+    print(f"\n{'Tamaño':>9} {'Etapa':<22} {'p50 ms':>10} {'p90 ms':>10} {'p99 ms':>10} "
+          f"{'filas/s':>14} {'pico MB':>9}")
+    for size, stages in results['sizes'].items():
+        for stage, result in stages.items():
+            print(f"{size:>9} {stage:<22} {result['p50_ms']:10.2f} {result['p90_ms']:10.2f} "
+                  f"{result['p99_ms']:10.2f} {result['rows_per_sec'] or 0:14.0f} "
+                  f"{result['peak_memory_mb']:9.1f}")
+
+    with open(args.output, 'w', encoding='utf-8') as output_file:
+        json.dump(results, output_file, indent=2)
+    print(f"\nResultados guardados en {args.output}")
+
+    if args.compare:
+        with open(args.compare, encoding='utf-8') as baseline_file:
+            compare(results, json.load(baseline_file))
+
+
+if __name__ == '__main__':
+    main()
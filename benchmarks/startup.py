@@ -0,0 +1,215 @@
+"""
+Pruebas del tiempo de arranque de las aplicaciones.
+
+Cada comando se ejecuta en un intérprete nuevo, de modo que se mide el arranque en frío
+del proceso (importaciones, carga de datos y modelos y, en su caso, la primera consulta)
+con los archivos de datos ya en el caché del sistema operativo. Para cada comando informa
+de los percentiles del tiempo total y del desglose del tiempo de importación por paquete
+(python -X importtime), e indica qué dependencias pesadas se han importado. El tiempo de
+arranque de car_recommender_cli.py con una consulta completa sin red se guarda como
+'cold_start_ms', y --budget hace que la prueba falle si lo supera.
+
+Uso:
+    python -m benchmarks.startup --repeat 10 --output arranque.json
+    python -m benchmarks.startup --compare arranque.json --budget 1500
+"""
+
+import argparse
+import datetime
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+
+import numpy as np
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Respuestas de la aplicación de terminal para una consulta completa
+QUERY_ANSWERS = '\n'.join([
+    'SEAT', '15000', 'Diesel', '2018', '', '', '5', 'Manual', '', 'Madrid',  # Preferencias
+    '5', '8', '3', '2', '1', '4',  # Pesos de las características indicadas
+    '6'  # Peso de la distancia
+]) + '\n'
+
+# Archivos de datos que necesita una consulta completa
+DATA_FILES = ['data/coches.csv', 'data/car_ratings.csv', 'data/distance_cache.csv']
+
+# Comandos medidos: argumentos del intérprete, entrada estándar y archivos necesarios
+COMMANDS = {
+    'cli_help': (['car_recommender_cli.py', '--help'], None, []),
+    'cli_query': (['car_recommender_cli.py', '--offline'], QUERY_ANSWERS, DATA_FILES),
+    'gui_import': (['-c', 'import car_recommender'], None, []),
+    'service_import': (['-c', 'import modules.service'], None, []),
+}
+
+# Dependencias cuya importación se señala en los resultados
+HEAVY_MODULES = ['numpy', 'pandas', 'surprise', 'geopy', 'tkinter']
+
+
+def run_command(arguments: list, stdin: str = None, importtime: bool = False) -> tuple:
+    """
+    Ejecuta un comando en un intérprete nuevo desde la raíz del proyecto.
+
+    Args:
+        arguments (list): Argumentos del intérprete.
+        stdin (str): Entrada estándar del comando.
+        importtime (bool): Si es True, se ejecuta con -X importtime.
+
+    Returns:
+        tuple: El tiempo total en segundos y la salida de error del comando.
+
+    Raises:
+        RuntimeError: Si el comando termina con error.
+    """
+    command = [sys.executable] + (['-X', 'importtime'] if importtime else []) + arguments
+    start = time.perf_counter()
+    process = subprocess.run(command, cwd=ROOT, input=stdin, capture_output=True,
+                             text=True, check=False)
+    elapsed = time.perf_counter() - start
+    if process.returncode != 0:
+        raise RuntimeError(f"{' '.join(arguments)} terminó con el código "
+                           f"{process.returncode}:\n{process.stderr[-2000:]}")
+    return elapsed, process.stderr
+
+
+def import_breakdown(stderr: str) -> tuple:
+    """
+    Agrupa la salida de python -X importtime por paquete.
+
+    Args:
+        stderr (str): Salida de error de un comando ejecutado con -X importtime.
+
+    Returns:
+        tuple: Milisegundos de importación acumulados de cada paquete importado
+        directamente por el comando, de mayor a menor, y el conjunto de todos los paquetes
+        importados, también los que importan otros paquetes.
+    """
+    packages = {}
+    imported = set()
+    for line in stderr.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        _, cumulative, name = line[len('import time:'):].split('|')
+        package = name.strip().split('.')[0]
+        imported.add(package)
+        # Las importaciones de primer nivel (sin sangría tras el separador) ya incluyen
+        # las que anidan
+        if len(name) - len(name.lstrip()) == 1:
+            packages[package] = packages.get(package, 0.0) + int(cumulative) / 1000
+    return dict(sorted(packages.items(), key=lambda item: item[1], reverse=True)), imported
+
+
+def benchmark_command(arguments: list, stdin: str, repeat: int) -> dict:
+    """
+    Mide el arranque de un comando.
+
+    El comando se ejecuta una vez sin medir (para que se construyan las instantáneas y
+    el modelo guardado si faltan), repeat veces cronometradas y una vez más con
+    -X importtime para el desglose, de forma que el registro de importaciones no
+    distorsione los tiempos.
+
+    Args:
+        arguments (list): Argumentos del intérprete.
+        stdin (str): Entrada estándar del comando.
+        repeat (int): Número de ejecuciones cronometradas.
+
+    Returns:
+        dict: Percentiles del tiempo total en milisegundos, desglose de importaciones y
+        dependencias pesadas importadas.
+    """
+    run_command(arguments, stdin)
+    samples = np.array([run_command(arguments, stdin)[0] for _ in range(repeat)]) * 1000
+    imports, imported = import_breakdown(run_command(arguments, stdin, importtime=True)[1])
+    return {
+        'p50_ms': float(np.percentile(samples, 50)),
+        'p90_ms': float(np.percentile(samples, 90)),
+        'mean_ms': float(samples.mean()),
+        'import_ms': imports,
+        'heavy_modules': [module for module in HEAVY_MODULES if module in imported]
+    }
+
+
+def compare(results: dict, baseline: dict) -> None:
+    """
+    Muestra la variación del tiempo mediano de arranque respecto a una ejecución anterior.
+
+    Args:
+        results (dict): Resultados de la ejecución actual.
+        baseline (dict): Resultados de la ejecución anterior.
+    """
+    print("\nComparación con la ejecución anterior (tiempo mediano):")
+    for name, result in results['commands'].items():
+        previous = baseline.get('commands', {}).get(name)
+        if previous and previous['p50_ms'] > 0:
+            ratio = result['p50_ms'] / previous['p50_ms']
+            print(f"  {name:<16} {previous['p50_ms']:10.1f} ms -> "
+                  f"{result['p50_ms']:10.1f} ms  (x{ratio:.2f})")
+
+
+def main():
+    """
+    Punto de entrada de las pruebas de arranque.
+    """
+    parser = argparse.ArgumentParser(description="Pruebas del tiempo de arranque.")
+    parser.add_argument('--commands', nargs='+', choices=list(COMMANDS),
+                        default=list(COMMANDS), help="Comandos a medir.")
+    parser.add_argument('--repeat', type=int, default=10,
+                        help="Ejecuciones cronometradas de cada comando.")
+    parser.add_argument('--top', type=int, default=8,
+                        help="Paquetes que se muestran en el desglose de importaciones.")
+    parser.add_argument('--output', default='startup_results.json',
+                        help="Archivo JSON en el que se guardan los resultados.")
+    parser.add_argument('--compare', metavar='JSON',
+                        help="Resultados de una ejecución anterior con los que comparar.")
+    parser.add_argument('--budget', type=float, metavar='MS',
+                        help="Tiempo máximo de arranque en frío (cli_query) en milisegundos.")
+    args = parser.parse_args()
+
+    results = {
+        'timestamp': datetime.datetime.now().isoformat(timespec='seconds'),
+        'python': sys.version.split()[0],
+        'platform': platform.platform(),
+        'repeat': args.repeat,
+        'commands': {}
+    }
+    for name in args.commands:
+        arguments, stdin, files = COMMANDS[name]
+        missing = [path for path in files if not os.path.exists(os.path.join(ROOT, path))]
+        if missing:
+            print(f"Se omite {name}: faltan los archivos {', '.join(missing)}")
+            continue
+        results['commands'][name] = benchmark_command(arguments, stdin, args.repeat)
+    if 'cli_query' in results['commands']:
+        results['cold_start_ms'] = results['commands']['cli_query']['p50_ms']
+
+    print(f"{'Comando':<16} {'p50 ms':>10} {'p90 ms':>10}  Dependencias pesadas")
+    for name, result in results['commands'].items():
+        print(f"{name:<16} {result['p50_ms']:10.1f} {result['p90_ms']:10.1f}  "
+              f"{', '.join(result['heavy_modules']) or '-'}")
+    for name, result in results['commands'].items():
+        print(f"\nImportaciones de {name} (ms):")
+        for package, milliseconds in list(result['import_ms'].items())[:args.top]:
+            print(f"  {package:<28} {milliseconds:10.1f}")
+
+    with open(args.output, 'w', encoding='utf-8') as output_file:
+        json.dump(results, output_file, indent=2)
+    print(f"\nResultados guardados en {args.output}")
+
+    if args.compare:
+        with open(args.compare, encoding='utf-8') as baseline_file:
+            compare(results, json.load(baseline_file))
+
+    if args.budget is not None and 'cold_start_ms' in results:
+        if results['cold_start_ms'] > args.budget:
+            print(f"\nEl arranque en frío ({results['cold_start_ms']:.1f} ms) supera el "
+                  f"presupuesto de {args.budget:.1f} ms.")
+            sys.exit(1)
+        print(f"\nArranque en frío dentro del presupuesto: {results['cold_start_ms']:.1f} ms "
+              f"<= {args.budget:.1f} ms.")
+
+
+if __name__ == '__main__':
+    main()
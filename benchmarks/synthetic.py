@@ -0,0 +1,119 @@
+"""
+Este módulo genera catálogos de coches y valoraciones sintéticos con la misma forma que
+data/coches.csv y data/car_ratings.csv, para medir el rendimiento con distintos tamaños.
+"""
+
+from collections import namedtuple
+import hashlib
+import numpy as np
+import pandas as pd
+
+# Objeto compatible con los resultados de geocode de geopy (solo latitud y longitud)
+Location = namedtuple('Location', ['latitude', 'longitude'])
+
+
+def generate_catalog(n_rows: int, template_path: str = 'data/coches.csv',
+                     seed: int = 0) -> pd.DataFrame:
+    """
+    Genera un catálogo sintético con las mismas columnas que el catálogo de plantilla.
+
+    Las combinaciones de marca, modelo y model_id, la provincia, el combustible, el cambio,
+    el color y las puertas se muestrean de la plantilla, de modo que las cardinalidades y
+    frecuencias son realistas. Las columnas numéricas se muestrean de la plantilla con una
+    pequeña variación aleatoria.
+
+    Args:
+        n_rows (int): Número de coches a generar.
+        template_path (str): Ruta al catálogo real que sirve de plantilla.
+        seed (int): Semilla del generador aleatorio.
+
+    Returns:
+        pd.DataFrame: El catálogo sintético.
+    """
+    rng = np.random.default_rng(seed)
+    template = pd.read_csv(template_path)
+    rows = rng.integers(0, len(template), n_rows)
+
+    catalog = pd.DataFrame({'make': template['make'].to_numpy()[rows],
+                            'model': template['model'].to_numpy()[rows]})
+    catalog['price'] = np.maximum(
+        100, (template['price'].to_numpy()[rows] * rng.uniform(0.9, 1.1, n_rows)).round(-1)
+    ).astype(np.int64)
+    catalog['fuel'] = rng.choice(template['fuel'].to_numpy(), n_rows)
+    catalog['year'] = np.clip(
+        template['year'].to_numpy()[rows] + rng.integers(-1, 2, n_rows),
+        template['year'].min(), template['year'].max()
+    )
+    catalog['kms'] = (template['kms'].to_numpy()[rows] * rng.uniform(0.8, 1.2, n_rows)).astype(
+        np.int64)
+    catalog['power'] = template['power'].to_numpy()[rows]
+    catalog['doors'] = template['doors'].to_numpy()[rows]
+    catalog['shift'] = rng.choice(template['shift'].to_numpy(), n_rows)
+    catalog['color'] = rng.choice(template['color'].to_numpy(), n_rows)
+    catalog['province'] = rng.choice(template['province'].to_numpy(), n_rows)
+    catalog['model_id'] = template['model_id'].to_numpy()[rows]
+    catalog['id'] = np.arange(n_rows)
+    return catalog[template.columns]
+
+
+def generate_ratings(n_ratings: int, model_ids, n_users: int = None,
+                     seed: int = 0) -> pd.DataFrame:
+    """
+    Genera valoraciones sintéticas (user_id, model_id, rating) para los modelos dados.
+
+    Cada modelo tiene una calidad latente y cada usuario un sesgo, de forma que el modelo
+    colaborativo tenga una señal que aprender.
+
+    Args:
+        n_ratings (int): Número de valoraciones a generar.
+        model_ids (array-like): IDs de los modelos del catálogo.
+        n_users (int): Número de usuarios distintos. Por defecto, n_ratings // 20.
+        seed (int): Semilla del generador aleatorio.
+
+    Returns:
+        pd.DataFrame: Las valoraciones sintéticas.
+    """
+    rng = np.random.default_rng(seed)
+    model_ids = np.unique(np.asarray(model_ids))
+    n_users = n_users or max(1, n_ratings // 20)
+    quality = rng.normal(0, 0.8, len(model_ids))
+    bias = rng.normal(0, 0.5, n_users)
+
+    users = rng.integers(0, n_users, n_ratings)
+    items = rng.integers(0, len(model_ids), n_ratings)
+    ratings = np.clip(np.rint(3 + quality[items] + bias[users] + rng.normal(0, 0.7, n_ratings)),
+                      1, 5).astype(np.int64)
+    return pd.DataFrame({
+        'user_id': np.char.add('user_', users.astype(str)),
+        'model_id': model_ids[items],
+        'rating': ratings
+    })
+
+
+class OfflineGeocoder:
+    """
+    OfflineGeocoder sustituye a Nominatim en las pruebas de rendimiento: devuelve unas
+    coordenadas deterministas dentro de la península para cualquier ubicación, sin
+    acceder a la red.
+
+    Atributos:
+        calls (int): Número de llamadas a geocode realizadas.
+    """
+    def __init__(self):
+        self.calls = 0
+
+    def geocode(self, query):
+        """
+        Devuelve unas coordenadas deterministas para una ubicación.
+
+        Args:
+            query (str): Nombre de la ubicación.
+
+        Returns:
+            Location: Latitud y longitud de la ubicación.
+        """
+        self.calls += 1
+        digest = hashlib.sha256(str(query).lower().encode('utf-8')).digest()
+        latitude = 36.0 + 7.5 * digest[0] / 255
+        longitude = -9.0 + 12.0 * digest[1] / 255
+        return Location(latitude, longitude)
@@ -5,13 +5,11 @@ Este módulo proporciona una interfaz gráfica para recomendar coches a los usua
 basándose en sus preferencias y ubicación.
 """
 
+import argparse
 import os
 import tkinter as tk
 from tkinter import ttk, messagebox
-from modules.hybrid_recommender import HybridRecommender
-from modules.collaborative_filter import CollaborativeFilter
-from modules.geo_utils import GeoUtils
-from modules.data_loader import DataLoader
+from modules.background import BackgroundJob
 
 
 # Rutas
@@ -20,11 +18,96 @@ RATINGS_PATH = 'data/car_ratings.csv'
 DISTANCE_CACHE = 'data/distance_cache.csv'
 USER_ID = 'new_user'
 
-# Cargar clases para el modelo y los datos
-cars_df, ratings_df = DataLoader(CARS_PATH, RATINGS_PATH).load_data()
-collaborative_model = CollaborativeFilter()
-collaborative_model.train_model(RATINGS_PATH)
-geo_calculator = GeoUtils()
+# Recomendaciones que se muestran y columnas de la tabla de resultados
+RESULT_ROWS = 10
+RESULT_COLUMNS = ["make", "model", "price", "fuel", "year", "kms", "power", "doors",
+                  "shift", "color", "province", "distance"]
+
+# Etapas de la recomendación cuyo final se muestra como progreso, con la descripción de
+# cada una (ver BackgroundJob.track_stages)
+RECOMMEND_STAGES = {
+    'content_score': "Calculando la similitud con tus preferencias...",
+    'geo_penalty': "Calculando las distancias...",
+    'collaborative_predict': "Calculando las valoraciones estimadas...",
+    'rank': "Ordenando los coches...",
+    'build_results': "Preparando los resultados..."
+}
+
+# Milisegundos entre dos consultas de los eventos de las tareas en segundo plano
+POLL_INTERVAL = 50
+
+
+def load_service(job, server=None):
+    """
+    Carga los datos y modelos del servicio de recomendación en este proceso, o se conecta
+    al servicio indicado. Se ejecuta en segundo plano mientras el formulario ya se puede
+    usar; también el recomendador (pandas, NumPy) se importa aquí y no al arrancar.
+
+    Args:
+        job (BackgroundJob): La tarea en la que se ejecuta la carga.
+        server (str): URL de un servicio ya iniciado, o None para cargarlo aquí.
+
+    Returns:
+        RecommenderService | RecommenderClient: El servicio de recomendación.
+    """
+    job.progress(0.0, "Cargando el recomendador...")
+    # pylint: disable-next=import-outside-toplevel
+    from modules.service import RecommenderClient, RecommenderService
+    if server:
+        job.progress(0.0, f"Conectando con {server}...")
+        return RecommenderClient(server)
+    return RecommenderService(CARS_PATH, RATINGS_PATH, DISTANCE_CACHE, progress=job.progress)
+
+
+def run_recommendation(job, service_job, user_input, feature_weights, user_location):
+    """
+    Genera las recomendaciones en segundo plano, esperando antes si hace falta a que
+    termine la carga del servicio. Si el servicio se ejecuta en este proceso, la consulta
+    se prepara como una sesión (ver RecommenderService.session), de modo que si después
+    solo cambian los pesos basta con volver a ordenar los coches.
+
+    Args:
+        job (BackgroundJob): La tarea en la que se ejecuta la recomendación.
+        service_job (BackgroundJob): La tarea que carga el servicio.
+        user_input (dict): Características y valores proporcionados por el usuario.
+        feature_weights (dict): Pesos asignados a cada característica.
+        user_location (str): Ubicación del usuario.
+
+    Returns:
+        tuple: Los valores de las columnas RESULT_COLUMNS de las mejores recomendaciones
+        (ver result_rows) y la sesión de la consulta, o None si el servicio se ejecuta en
+        otro proceso.
+    """
+    job.progress(0.0, "Esperando a que terminen de cargarse los datos...")
+    while not service_job.wait(0.1):
+        job.progress(0.0, "Esperando a que terminen de cargarse los datos...")
+    if service_job.error is not None:
+        raise service_job.error
+
+    service = service_job.result
+    job.progress(0.0, RECOMMEND_STAGES['content_score'])
+    with job.track_stages(RECOMMEND_STAGES):
+        # El cliente de un servicio en otro proceso no mantiene sesiones
+        if not hasattr(service, 'session'):
+            recommendations = service.recommend(
+                USER_ID, user_input, feature_weights, user_location, top_k=RESULT_ROWS
+            )
+            return result_rows(recommendations), None
+        session = service.session(USER_ID, user_input, user_location)
+        return result_rows(session.recommend(feature_weights, top_k=RESULT_ROWS)), session
+
+
+def result_rows(recommendations):
+    """
+    Extrae las filas que se muestran en la tabla de resultados.
+
+    Args:
+        recommendations (pd.DataFrame): Los coches recomendados.
+
+    Returns:
+        list: Los valores de las columnas RESULT_COLUMNS de las mejores recomendaciones.
+    """
+    return recommendations[RESULT_COLUMNS].head(RESULT_ROWS).values.tolist()
 
 
 class CarRecommenderApp(tk.Tk):
@@ -32,13 +115,17 @@ class CarRecommenderApp(tk.Tk):
     CarRecommenderApp es una aplicación con interfaz gráfica que recomienda coches
     a los usuarios basándose en sus preferencias y ubicación.
 
+    Los datos y modelos se cargan en segundo plano (ver load_service) mientras el formulario
+    ya se puede rellenar, y el avance de la carga se muestra en la barra de estado.
+
     Atributos:
         user_input (dict): Diccionario con las características y valores
         proporcionados por el usuario.
         feature_weights (dict): Diccionario con los pesos asignados a cada característica.
         user_location (str): Ubicación del usuario en formato de texto
+        service_job (BackgroundJob): Tarea que carga el servicio de recomendación.
     """
-    def __init__(self):
+    def __init__(self, server=None):
         super().__init__()
         self.title("Recomendador de Coches")
         self.geometry("1400x700")  # Tamaño ajustado
@@ -47,6 +134,7 @@ class CarRecommenderApp(tk.Tk):
         self.user_input = {}
         self.feature_weights = {}
         self.user_location = ""
+        self.service_job = None
 
         # Verificar archivos necesarios
         if not self.check_csv_files():
@@ -59,6 +147,11 @@ class CarRecommenderApp(tk.Tk):
         # Crear estilos personalizados
         self.setup_styles()
 
+        # Crear barra de estado y cargar los datos en segundo plano
+        self.create_status_bar()
+        self.service_job = BackgroundJob(load_service, server).start()
+        self.watch(self.service_job, self.on_service_event)
+
         # Crear pestañas
         self.notebook = ttk.Notebook(self, style="CustomNotebook.TNotebook")
         self.notebook.pack(expand=True, fill="both", padx=20, pady=10)
@@ -104,6 +197,57 @@ class CarRecommenderApp(tk.Tk):
         )
         title.pack()
 
+    def create_status_bar(self):
+        """Crea la barra de estado con el progreso de la carga de los datos."""
+        status_bar = tk.Frame(self, bg="#edf2f7")
+        status_bar.pack(fill="x", side="bottom", padx=20, pady=(0, 10))
+
+        self.status_label = ttk.Label(status_bar, text="Cargando los datos...",
+                                      style="Custom.TLabel")
+        self.status_label.pack(side="left")
+        self.status_progress = ttk.Progressbar(status_bar, mode="determinate",
+                                               maximum=1.0, length=200)
+        self.status_progress.pack(side="right")
+
+    def watch(self, job, handler):
+        """
+        Entrega a handler, desde el hilo de la interfaz, los eventos de una tarea en
+        segundo plano hasta su evento final.
+
+        Args:
+            job (BackgroundJob): La tarea.
+            handler (callable): Función que recibe el tipo y el valor de cada evento.
+        """
+        def poll():
+            for kind, value in job.events():
+                handler(job, kind, value)
+                if kind in BackgroundJob.FINAL_EVENTS:
+                    return
+            self.after(POLL_INTERVAL, poll)
+
+        self.after(POLL_INTERVAL, poll)
+
+    def on_service_event(self, _job, kind, value):
+        """
+        Muestra el avance de la carga de los datos.
+
+        Args:
+            _job (BackgroundJob): La tarea de carga.
+            kind (str): Tipo del evento.
+            value: Valor del evento.
+        """
+        if kind == 'progress':
+            fraction, message = value
+            self.status_progress["value"] = fraction
+            self.status_label.configure(text=message)
+        elif kind == 'result':
+            self.status_progress.pack_forget()
+            self.status_label.configure(text="Datos cargados.")
+        elif kind == 'error':
+            self.status_progress.pack_forget()
+            self.status_label.configure(text="No se pudieron cargar los datos.")
+            messagebox.showerror("Error", f"Error al cargar los datos: {value}")
+
     def setup_styles(self):
         """Configura los estilos personalizados para la interfaz."""
         style = ttk.Style()
@@ -400,21 +544,40 @@ class ResultsPage(tk.Frame):
     ResultsPage muestra las recomendaciones de coches basadas en las preferencias
     y ubicación del usuario.
 
+    Las recomendaciones se generan en segundo plano (ver run_recommendation); mientras
+    tanto se muestra su avance y se pueden cancelar. Si después solo cambian los pesos,
+    los coches se vuelven a ordenar al momento con la sesión de la consulta anterior.
+
     Atributos:
         parent (tk.Tk): La ventana principal de la aplicación.
         results_area (ttk.LabelFrame): Contenedor para mostrar las recomendaciones.
         tree (ttk.Treeview): Tabla para mostrar las recomendaciones de coches.
+        job (BackgroundJob): Tarea de la recomendación en curso, o None.
+        session (RecommendationSession): Sesión de la última consulta, o None.
     """
     def __init__(self, parent):
         super().__init__(parent, bg="#ffffff")
         self.parent = parent
+        self.job = None
+        self.session = None
         self.results_area = ttk.LabelFrame(self, text="Recomendaciones",
                                            padding=20, style="Custom.TFrame")
         self.results_area.pack(fill="both", expand=True, padx=20, pady=20)
 
-        self.tree = ttk.Treeview(self.results_area, columns=(
-            "make", "model", "price", "fuel", "year", "kms",
-            "power", "doors", "shift", "color", "province", "distance"),
+        # Avance de la recomendación en curso
+        self.progress_area = ttk.Frame(self.results_area)
+        self.progress_area.pack(fill="x", side="top", pady=(0, 10))
+        self.progress_label = ttk.Label(self.progress_area, text="", style="Custom.TLabel")
+        self.progress_label.pack(side="left")
+        self.cancel_button = ttk.Button(self.progress_area, text="Cancelar",
+                                        command=self.cancel_recommendations,
+                                        state="disabled")
+        self.cancel_button.pack(side="right")
+        self.progress_bar = ttk.Progressbar(self.progress_area, mode="determinate",
+                                            maximum=1.0, length=200)
+        self.progress_bar.pack(side="right", padx=10)
+
+        self.tree = ttk.Treeview(self.results_area, columns=RESULT_COLUMNS,
                                  show="headings", height=15)
         self.tree.pack(fill="both", expand=True)
 
@@ -431,34 +594,94 @@ class ResultsPage(tk.Frame):
             self.tree.heading(col, text=col.capitalize())
             self.tree.column(col, width=100, anchor="center")
 
+        exit_button = ttk.Button(self, text="Salir", command=self.parent.destroy,
+                                 style="Custom.TButton")
+        exit_button.pack(pady=20)
+
     def generate_recommendations(self):
-        """Genera recomendaciones basadas en los datos y pesos proporcionados por el usuario."""
-        try:
-            recommender = HybridRecommender(collaborative_model, geo_calculator)
-            recommendations = recommender.recommend(
-                USER_ID, self.parent.user_input, self.parent.feature_weights,
-                self.parent.user_location, cars_df
-            )
+        """
+        Genera recomendaciones basadas en los datos y pesos proporcionados por el usuario
+        en segundo plano. Si había una recomendación en curso, se cancela.
+        """
+        if self.job is not None:
+            self.job.cancel()
+            self.job = None
+        for row in self.tree.get_children():
+            self.tree.delete(row)
+
+        if self.session is not None and self.session.matches(self.parent.user_input,
+                                                             self.parent.user_location):
+            # Solo han cambiado los pesos: basta con volver a ordenar los coches
+            self.cancel_button.configure(state="disabled")
+            self.show_results(result_rows(self.session.recommend(
+                dict(self.parent.feature_weights), top_k=RESULT_ROWS
+            )))
+            return
 
-            top_recommendations = recommendations[["make", "model", "price", "fuel",
-                                                   "year", "kms", "power", "doors",
-                                                   "shift", "color", "province",
-                                                   "distance"]].head(10)
+        self.job = BackgroundJob(
+            run_recommendation, self.parent.service_job, dict(self.parent.user_input),
+            dict(self.parent.feature_weights), self.parent.user_location
+        ).start()
+        self.progress_bar["value"] = 0.0
+        self.progress_label.configure(text="Generando recomendaciones...")
+        self.cancel_button.configure(state="normal")
+        self.parent.watch(self.job, self.on_recommendation_event)
+
+    def cancel_recommendations(self):
+        """Cancela la recomendación en curso."""
+        if self.job is not None:
+            self.job.cancel()
+            self.job = None
+        self.progress_label.configure(text="Recomendación cancelada.")
+        self.cancel_button.configure(state="disabled")
+
+    def on_recommendation_event(self, job, kind, value):
+        """
+        Muestra el avance y el resultado de una recomendación. Los eventos de una
+        recomendación cancelada o sustituida por otra se ignoran.
 
-            for row in self.tree.get_children():
-                self.tree.delete(row)
+        Args:
+            job (BackgroundJob): La tarea de la recomendación.
+            kind (str): Tipo del evento.
+            value: Valor del evento.
+        """
+        if job is not self.job:
+            return
+        if kind == 'progress':
+            fraction, message = value
+            self.progress_bar["value"] = fraction
+            self.progress_label.configure(text=message)
+            return
 
-            for _, row in top_recommendations.iterrows():
-                self.tree.insert("", "end", values=row.tolist())
+        self.job = None
+        self.cancel_button.configure(state="disabled")
+        if kind == 'result':
+            rows, self.session = value
+            self.show_results(rows)
+        elif kind == 'error':
+            self.progress_label.configure(text="")
+            messagebox.showerror("Error", f"Error al generar recomendaciones: {value}")
 
-        except (ValueError, KeyError, TypeError) as exception:
-            messagebox.showerror("Error", f"Error al generar recomendaciones: {exception}")
+    def show_results(self, rows):
+        """
+        Muestra las recomendaciones en la tabla de resultados.
 
-        exit_button = ttk.Button(self, text="Salir", command=self.parent.destroy,
-                                 style="Custom.TButton")
-        exit_button.pack(pady=20)
+        Args:
+            rows (list): Los valores de cada recomendación (ver result_rows).
+        """
+        # Solo se insertan en la tabla las filas que se muestran
+        for row in rows[:RESULT_ROWS]:
+            self.tree.insert("", "end", values=row)
+        self.progress_bar["value"] = 1.0
+        self.progress_label.configure(text=f"{len(rows)} recomendaciones.")
 
 
 if __name__ == '__main__':
-    app = CarRecommenderApp()
+    parser = argparse.ArgumentParser(description="Recomendador de coches con interfaz gráfica.")
+    parser.add_argument("--server", metavar="URL",
+                        help="Usa un servicio ya iniciado, por ejemplo http://127.0.0.1:8765.")
+    args = parser.parse_args()
+
+    # Los datos y modelos se cargan, o se conecta con el servicio indicado, en segundo plano
+    app = CarRecommenderApp(server=args.server)
     app.mainloop()
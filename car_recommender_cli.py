@@ -5,12 +5,14 @@ Este módulo proporciona una interfaz de línea de comandos para recomendar coch
 basándose en sus preferencias y ubicación.
 """
 
+import argparse
 import os
 import sys
-from modules.hybrid_recommender import HybridRecommender
-from modules.collaborative_filter import CollaborativeFilter
-from modules.geo_utils import GeoUtils
-from modules.data_loader import DataLoader
+from modules.metrics import MetricsRecorder
+
+# modules.service (pandas, NumPy y el resto del recomendador) se importa solo en los
+# caminos que recomiendan o sirven consultas, de modo que --help y los errores de
+# argumentos responden sin esperar a esas importaciones
 
 
 class CarRecommenderApp:
@@ -23,15 +25,21 @@ class CarRecommenderApp:
         ratings_path (str): Ruta al archivo CSV que contiene las valoraciones de los usuarios.
         distance_cache (str): Ruta al archivo CSV que contiene el caché de distancias.
         user_id (str): Identificador del usuario para el que se generan las recomendaciones.
+        offline (bool): Indica si las distancias se calculan sin consultar el geocodificador.
     """
-    def __init__(self):
+    def __init__(self, offline=False):
         """
         Inicializa una instancia de la clase CarRecommenderApp.
+
+        Args:
+            offline (bool): Si es True, las distancias se calculan solo con el caché y el
+                            nomenclátor, sin acceder a la red.
         """
         self.cars_path = 'data/coches.csv'
         self.ratings_path = 'data/car_ratings.csv'
         self.distance_cache = 'data/distance_cache.csv'
         self.user_id = 'new_user'
+        self.offline = offline
 
     def check_csv_files(self):
         """
@@ -124,7 +132,7 @@ class CarRecommenderApp:
         # Solicitar importancia de la distancia (obligatoria)
         while True:
             try:
-                distance_weight = int(input("¿Qué importancia le das a la distancia?"/
+                distance_weight = int(input("¿Qué importancia le das a la distancia? "
                                             "(debe ser entre 1 y 10): "))
                 if 1 <= distance_weight <= 10:
                     break
@@ -141,32 +149,88 @@ class CarRecommenderApp:
 
         return user_input, feature_weights, user_location
 
-    def run(self):
+    def create_service(self, retrain_interval=None, cache_dir=None, watch_interval=None):
         """
-        Ejecuta la aplicación de recomendación de coches.
+        Carga los datos y modelos necesarios para recomendar.
+
+        Args:
+            retrain_interval (float): Segundos mínimos entre dos entrenamientos completos
+                                      del modelo colaborativo con las valoraciones nuevas.
+            cache_dir (str): Directorio en el que se guardan también las recomendaciones
+                             calculadas, o None para guardarlas solo en memoria.
+            watch_interval (float): Segundos entre dos comprobaciones del CSV de coches
+                                    para aplicar sus cambios, o None para no vigilarlo.
+
+        Returns:
+            RecommenderService: El servicio con el catálogo, el modelo colaborativo
+            y el calculador de distancias cargados.
         """
         # Verificar si los archivos CSV necesarios existen
         if not self.check_csv_files():
             sys.exit()
 
-        # Cargar datos de coches y valoraciones
-        cars_df, _ = DataLoader(self.cars_path, self.ratings_path).load_data()
+        # pylint: disable=import-outside-toplevel
+        from modules.result_cache import ResultCache
+        from modules.service import RecommenderService
+        return RecommenderService(self.cars_path, self.ratings_path, self.distance_cache,
+                                  offline=self.offline, retrain_interval=retrain_interval,
+                                  result_cache=ResultCache(disk_path=cache_dir),
+                                  watch_interval=watch_interval)
 
-        # Entrenar el modelo de filtrado colaborativo
-        collaborative_model = CollaborativeFilter()
-        collaborative_model.train_model(self.ratings_path)
+    def serve(self, host, port, retrain_interval=None, cache_dir=None, watch_interval=None):
+        """
+        Ejecuta la aplicación como servicio local: carga los datos y modelos una sola vez
+        y atiende las consultas de los clientes hasta que se interrumpe.
+
+        Args:
+            host (str): Dirección en la que escucha el servicio.
+            port (int): Puerto en el que escucha el servicio.
+            retrain_interval (float): Segundos mínimos entre dos entrenamientos completos
+                                      del modelo colaborativo con las valoraciones nuevas.
+            cache_dir (str): Directorio del caché de recomendaciones en disco.
+            watch_interval (float): Segundos entre dos comprobaciones del CSV de coches.
+        """
+        from modules.service import create_server  # pylint: disable=import-outside-toplevel
+        service = self.create_service(retrain_interval, cache_dir, watch_interval)
+        server = create_server(service, host, port)
+        print(f"Servicio de recomendación escuchando en http://{host}:{port}")
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            print("Servicio detenido.")
+        finally:
+            server.server_close()
+
+    def run(self, server_url=None, profile=False):
+        """
+        Ejecuta la aplicación de recomendación de coches.
 
-        # Inicializar el calculador de distancias geográficas
-        geo_calculator = GeoUtils()
+        Args:
+            server_url (str): Dirección de un servicio de recomendación ya iniciado. Si se
+                              indica, la aplicación actúa como cliente y no carga los datos.
+            profile (bool): Si es True, muestra el desglose por etapas de la recomendación
+                            (tiempo, filas, memoria y contadores del caché de distancias).
+        """
+        if server_url:
+            from modules.service import RecommenderClient  # pylint: disable=import-outside-toplevel
+            recommender = RecommenderClient(server_url)
+        else:
+            # Cargar el catálogo, el modelo colaborativo y el calculador de distancias
+            recommender = self.create_service()
 
         # Obtener las preferencias del usuario
         user_input, feature_weights, user_location = self.get_user_input()
 
-        # Inicializar el recomendador híbrido
-        recommender = HybridRecommender(collaborative_model, geo_calculator)
-        # Obtener recomendaciones
-        recommendations = recommender.recommend(self.user_id, user_input,
-                                                feature_weights, user_location, cars_df)
+        # Obtener recomendaciones, midiendo cada etapa si se ha pedido el desglose
+        recorder = MetricsRecorder(track_memory=True)
+        if profile and not server_url:
+            with recorder:
+                recommendations = recommender.recommend(self.user_id, user_input,
+                                                        feature_weights, user_location,
+                                                        top_k=10)
+        else:
+            recommendations = recommender.recommend(self.user_id, user_input,
+                                                    feature_weights, user_location, top_k=10)
 
         # Mostrar las 10 mejores recomendaciones
         top_5 = recommendations[['make', 'model', 'price', 'fuel', 'year', 'kms',
@@ -176,8 +240,52 @@ class CarRecommenderApp:
         print("Hemos encontrado estos coches para ti:")
         print(top_5.to_string(index=False))
 
+        if profile:
+            if server_url:
+                print("\nEl desglose por etapas solo está disponible sin --server.")
+            else:
+                print("\nDesglose por etapas:")
+                print(recorder.report())
+
+
+def parse_args():
+    """
+    Interpreta los argumentos de la línea de comandos.
+
+    Returns:
+        argparse.Namespace: Los argumentos de la aplicación.
+    """
+    parser = argparse.ArgumentParser(description="Recomendador de coches en modo terminal.")
+    parser.add_argument("--serve", action="store_true",
+                        help="Inicia el servicio local de recomendación con los modelos cargados.")
+    parser.add_argument("--host", default="127.0.0.1",
+                        help="Dirección en la que escucha el servicio (por defecto 127.0.0.1).")
+    parser.add_argument("--port", type=int, default=8765,
+                        help="Puerto en el que escucha el servicio (por defecto 8765).")
+    parser.add_argument("--retrain-interval", type=float, metavar="SEGUNDOS",
+                        help="Con --serve, vuelve a entrenar el modelo colaborativo con las "
+                             "valoraciones nuevas como mucho una vez cada SEGUNDOS.")
+    parser.add_argument("--cache-dir", metavar="DIRECTORIO",
+                        help="Con --serve, guarda también las recomendaciones calculadas en "
+                             "DIRECTORIO para reutilizarlas entre ejecuciones.")
+    parser.add_argument("--watch-catalog", type=float, metavar="SEGUNDOS",
+                        help="Con --serve, comprueba cada SEGUNDOS si el CSV de coches ha "
+                             "cambiado y aplica los cambios sin reiniciar el servicio.")
+    parser.add_argument("--server", metavar="URL",
+                        help="Usa un servicio ya iniciado, por ejemplo http://127.0.0.1:8765.")
+    parser.add_argument("--offline", action="store_true",
+                        help="Calcula las distancias sin consultar el geocodificador en la red.")
+    parser.add_argument("--profile", action="store_true",
+                        help="Muestra el tiempo, la memoria y los contadores de cada etapa.")
+    return parser.parse_args()
+
 
 if __name__ == "__main__":
+    args = parse_args()
     # Crear una instancia de la aplicación y ejecutarla
-    app = CarRecommenderApp()
-    app.run()
+    app = CarRecommenderApp(offline=args.offline)
+    if args.serve:
+        app.serve(args.host, args.port, args.retrain_interval, args.cache_dir,
+                  args.watch_catalog)
+    else:
+        app.run(args.server, args.profile)
@@ -0,0 +1,164 @@
+"""
+Este módulo contiene la clase BackgroundJob, que ejecuta una tarea larga (cargar los datos
+y modelos, generar una recomendación) en un hilo aparte y comunica su progreso y su
+resultado a través de una cola, para que la interfaz gráfica no se bloquee mientras tanto.
+"""
+
+import contextlib
+import queue
+import threading
+from . import metrics
+
+
+class JobCancelled(Exception):
+    """
+    Excepción con la que se interrumpe una tarea cancelada.
+    """
+
+
+class BackgroundJob:
+    """
+    BackgroundJob ejecuta una función en un hilo en segundo plano.
+
+    La función recibe la propia tarea como primer argumento y puede llamar a progress para
+    informar de su avance; progress lanza JobCancelled si la tarea se ha cancelado, de modo
+    que la cancelación se atiende en el siguiente punto de control. El hilo nunca toca la
+    interfaz: los eventos se guardan en una cola y el hilo de la interfaz los recoge con
+    events, por ejemplo desde un temporizador after() de Tk.
+
+    Los eventos son tuplas (tipo, valor): ('progress', (fracción, mensaje)) y, al terminar,
+    uno de los eventos finales ('result', resultado), ('error', excepción) o
+    ('cancelled', None).
+
+    Atributos:
+        result: Valor devuelto por la función, disponible cuando la tarea termina.
+        error (Exception): Excepción lanzada por la función, o None.
+    """
+    FINAL_EVENTS = ('result', 'error', 'cancelled')
+
+    def __init__(self, target, *args, **kwargs):
+        """
+        Inicializa una instancia de la clase BackgroundJob.
+
+        Args:
+            target (callable): Función a ejecutar; recibe la tarea, args y kwargs.
+            *args: Argumentos posicionales de la función.
+            **kwargs: Argumentos con nombre de la función.
+        """
+        self.result = None
+        self.error = None
+        self._target = target
+        self._args = args
+        self._kwargs = kwargs
+        self._events = queue.Queue()
+        self._cancelled = threading.Event()
+        self._finished = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def start(self) -> 'BackgroundJob':
+        """
+        Inicia la tarea.
+
+        Returns:
+            BackgroundJob: La propia tarea.
+        """
+        self._thread.start()
+        return self
+
+    def cancel(self) -> None:
+        """
+        Pide la cancelación de la tarea. La función se interrumpe la próxima vez que
+        informe de su progreso.
+        """
+        self._cancelled.set()
+
+    @property
+    def cancelled(self) -> bool:
+        """
+        Indica si se ha pedido la cancelación de la tarea.
+
+        Returns:
+            bool: True si la tarea se ha cancelado.
+        """
+        return self._cancelled.is_set()
+
+    def wait(self, timeout: float = None) -> bool:
+        """
+        Espera a que la tarea termine.
+
+        Args:
+            timeout (float): Segundos máximos de espera, o None para esperar sin límite.
+
+        Returns:
+            bool: True si la tarea ha terminado.
+        """
+        return self._finished.wait(timeout)
+
+    def progress(self, fraction: float, message: str = '') -> None:
+        """
+        Informa del avance de la tarea. Se llama desde la función de la tarea.
+
+        Args:
+            fraction (float): Fracción completada, entre 0 y 1.
+            message (str): Descripción del paso en curso.
+
+        Raises:
+            JobCancelled: Si la tarea se ha cancelado.
+        """
+        if self.cancelled:
+            raise JobCancelled()
+        self._events.put(('progress', (fraction, message)))
+
+    @contextlib.contextmanager
+    def track_stages(self, stages: dict):
+        """
+        Informa del avance de la tarea a medida que terminan las etapas del recomendador
+        que se ejecutan en su hilo (ver metrics.set_thread_hook). Cada etapa terminada es
+        también un punto de cancelación.
+
+        Args:
+            stages (dict): Descripción de cada etapa por nombre, en el orden en que se
+                           ejecutan. Las etapas que no aparecen se ignoran.
+        """
+        names = list(stages)
+
+        def hook(record):
+            if record['stage'] in stages:
+                position = names.index(record['stage']) + 1
+                following = names[position] if position < len(names) else None
+                self.progress(position / len(names), stages.get(following, ''))
+
+        previous = metrics.set_thread_hook(hook)
+        try:
+            yield
+        finally:
+            metrics.set_thread_hook(previous)
+
+    def events(self) -> list:
+        """
+        Recoge los eventos pendientes sin esperar. Se llama desde el hilo de la interfaz.
+
+        Returns:
+            list: Los eventos (tipo, valor) en el orden en que se produjeron.
+        """
+        events = []
+        while True:
+            try:
+                events.append(self._events.get_nowait())
+            except queue.Empty:
+                return events
+
+    def _run(self) -> None:
+        """
+        Ejecuta la función de la tarea en el hilo y envía el evento final.
+        """
+        try:
+            self.result = self._target(self, *self._args, **self._kwargs)
+            event = ('cancelled', None) if self.cancelled else ('result', self.result)
+        except JobCancelled:
+            event = ('cancelled', None)
+        except Exception as exception:  # pylint: disable=broad-except
+            self.error = exception
+            event = ('error', exception)
+        self._finished.set()
+        self._events.put(event)
@@ -0,0 +1,835 @@
+"""
+Este módulo contiene la clase CarCatalog, que mantiene los datos de los coches junto con
+las codificaciones precalculadas que utilizan los filtros de recomendación.
+"""
+
+import uuid
+import numpy as np
+import pandas as pd
+
+
+class CategoryEncoding:
+    """
+    Codificación por diccionario de una columna. Cada valor se normaliza como
+    str(valor).lower() y se sustituye por un código entero, de forma que comparar
+    una columna completa con un valor del usuario se reduce a una comparación de enteros.
+
+    Atributos:
+        codes (np.ndarray): Código de cada fila de la columna.
+        categories (list): Valores normalizados, indexados por su código.
+        index (dict): Diccionario inverso que asocia cada valor normalizado a su código.
+
+    La lista de filas de cada código (ver rows_for) se construye la primera vez que se
+    necesita y se reutiliza en las siguientes consultas.
+    """
+    def __init__(self, codes: np.ndarray, categories: list, index: dict = None):
+        """
+        Inicializa una instancia de la clase CategoryEncoding.
+
+        Args:
+            codes (np.ndarray): Código de cada fila de la columna.
+            categories (list): Valores normalizados, indexados por su código.
+            index (dict): Diccionario inverso ya construido. Si es None, se construye aquí.
+        """
+        self.codes = codes
+        self.categories = list(categories)
+        self.index = index if index is not None else {
+            value: code for code, value in enumerate(self.categories)
+        }
+        self._order = None  # Filas ordenadas por código, se calculan bajo demanda
+        self._offsets = None  # Inicio de las filas de cada código en _order
+
+    @classmethod
+    def from_series(cls, series: pd.Series) -> 'CategoryEncoding':
+        """
+        Construye la codificación de una columna del catálogo.
+
+        Args:
+            series (pd.Series): Columna a codificar.
+
+        Returns:
+            CategoryEncoding: La codificación de la columna.
+        """
+        # Primero se factorizan los valores originales y después sus versiones en
+        # minúsculas, para que 'Rojo' y 'rojo' compartan el mismo código
+        codes, uniques = pd.factorize(series, use_na_sentinel=False)
+        lowered = np.array([str(value).lower() for value in uniques.tolist()], dtype=object)
+        merged_codes, categories = pd.factorize(lowered)
+        return cls(merged_codes.astype(np.int32)[codes], categories.tolist())
+
+    def code_of(self, value) -> int:
+        """
+        Devuelve el código asociado a un valor, o -1 si no aparece en la columna.
+
+        Args:
+            value: Valor a buscar (se normaliza igual que la columna).
+
+        Returns:
+            int: El código del valor.
+        """
+        return self.index.get(str(value).lower(), -1)
+
+    def matches(self, value) -> np.ndarray:
+        """
+        Indica qué filas de la columna coinciden exactamente con un valor.
+
+        Args:
+            value: Valor a comparar (sin distinguir mayúsculas y minúsculas).
+
+        Returns:
+            np.ndarray: Máscara booleana con una posición por fila.
+        """
+        return self.codes == self.code_of(value)
+
+    def with_changes(self, changes: 'RowChanges', values) -> 'CategoryEncoding':
+        """
+        Construye la codificación de la columna tras los cambios de un catálogo (ver
+        CarCatalog.apply_changes) sin volver a codificar las filas que no cambian. Los
+        valores que no aparecían reciben códigos nuevos al final de categories, y la lista
+        de filas de cada código se actualiza si ya estaba construida.
+
+        Args:
+            changes (RowChanges): Correspondencia entre las filas anteriores y las nuevas.
+            values (iterable): Valores de las filas modificadas y añadidas, en el orden de
+                               changes.rows.
+
+        Returns:
+            CategoryEncoding: La codificación de la columna con los cambios.
+        """
+        categories = list(self.categories)
+        index = dict(self.index)
+        changed = np.empty(len(changes.rows), dtype=self.codes.dtype)
+        for position, value in enumerate(values):
+            category = str(value).lower()
+            code = index.get(category)
+            if code is None:
+                code = index[category] = len(categories)
+                categories.append(category)
+            changed[position] = code
+
+        encoding = CategoryEncoding(changes.column(self.codes, changed), categories, index)
+        if self._order is not None:
+            encoding._order = changes.sorted_order(self._order, encoding.codes)
+            encoding._offsets = encoding._code_offsets()
+        return encoding
+
+    def build_rows(self) -> None:
+        """
+        Construye la lista de filas de cada código: las posiciones de la columna ordenadas
+        por código, junto con el inicio de cada código en esa ordenación.
+        """
+        if self._order is None:
+            self._order = np.argsort(self.codes, kind='stable')
+            self._offsets = self._code_offsets()
+
+    def _code_offsets(self) -> np.ndarray:
+        """
+        Calcula el inicio de las filas de cada código en la ordenación por código.
+
+        Returns:
+            np.ndarray: El inicio de cada código, seguido del número de filas.
+        """
+        counts = np.bincount(self.codes, minlength=len(self.categories))
+        return np.concatenate([[0], np.cumsum(counts)])
+
+    def codes_for(self, values) -> list:
+        """
+        Devuelve los códigos de los valores dados que aparecen en la columna.
+
+        Args:
+            values (iterable): Valores a buscar (sin distinguir mayúsculas y minúsculas).
+
+        Returns:
+            list: Los códigos, en orden ascendente.
+        """
+        return sorted({self.code_of(value) for value in values} - {-1})
+
+    def count_for(self, values) -> int:
+        """
+        Cuenta las filas cuyo valor es alguno de los dados, sin recorrer la columna.
+
+        Args:
+            values (iterable): Valores aceptados (sin distinguir mayúsculas y minúsculas).
+
+        Returns:
+            int: Número de filas.
+        """
+        self.build_rows()
+        return int(sum(self._offsets[code + 1] - self._offsets[code]
+                       for code in self.codes_for(values)))
+
+    def rows_for(self, values) -> np.ndarray:
+        """
+        Devuelve las filas cuyo valor es alguno de los dados, sin recorrer la columna.
+
+        Args:
+            values (iterable): Valores aceptados (sin distinguir mayúsculas y minúsculas).
+
+        Returns:
+            np.ndarray: Posiciones de las filas, en orden ascendente.
+        """
+        self.build_rows()
+        codes = self.codes_for(values)
+        rows = [self._order[self._offsets[code]:self._offsets[code + 1]] for code in codes]
+        if not rows:
+            return np.empty(0, dtype=np.intp)
+        return np.sort(np.concatenate(rows))
+
+
+class SortedIndex:
+    """
+    Índice de una columna numérica para consultas por rango: las posiciones de las filas
+    ordenadas por su valor, junto con los valores ya ordenados.
+
+    Atributos:
+        order (np.ndarray): Posiciones de las filas, ordenadas por valor (los NaN al final).
+        sorted_values (np.ndarray): Valores de la columna en ese orden.
+        valid (int): Número de valores que no son NaN.
+    """
+    def __init__(self, order: np.ndarray, sorted_values: np.ndarray):
+        """
+        Inicializa una instancia de la clase SortedIndex.
+
+        Args:
+            order (np.ndarray): Posiciones de las filas, ordenadas por valor.
+            sorted_values (np.ndarray): Valores de la columna en ese orden.
+        """
+        self.order = order
+        self.sorted_values = sorted_values
+        self.valid = len(sorted_values)  # Número de valores que no son NaN
+        if np.issubdtype(sorted_values.dtype, np.floating):
+            self.valid -= int(np.count_nonzero(np.isnan(sorted_values)))
+
+    @classmethod
+    def from_values(cls, values: np.ndarray) -> 'SortedIndex':
+        """
+        Construye el índice de una columna.
+
+        Args:
+            values (np.ndarray): Valores de la columna.
+
+        Returns:
+            SortedIndex: El índice de la columna.
+        """
+        order = np.argsort(values, kind='stable')
+        return cls(order, values[order])
+
+    def with_changes(self, changes: 'RowChanges', values: np.ndarray) -> 'SortedIndex':
+        """
+        Construye el índice de la columna tras los cambios de un catálogo (ver
+        CarCatalog.apply_changes) insertando las filas modificadas y añadidas en la
+        ordenación anterior, sin volver a ordenar la columna completa.
+
+        Args:
+            changes (RowChanges): Correspondencia entre las filas anteriores y las nuevas.
+            values (np.ndarray): Valores de la columna con los cambios.
+
+        Returns:
+            SortedIndex: El índice de la columna con los cambios.
+        """
+        order = changes.sorted_order(self.order, values)
+        return SortedIndex(order, values[order])
+
+    def bounds(self, minimum=None, maximum=None) -> tuple:
+        """
+        Localiza mediante búsqueda binaria el tramo de la ordenación cuyos valores están
+        entre dos límites (ambos incluidos). Las filas sin valor (NaN) quedan siempre fuera.
+
+        Args:
+            minimum (float): Límite inferior, o None si no hay.
+            maximum (float): Límite superior, o None si no hay.
+
+        Returns:
+            tuple: Inicio y fin del tramo en order.
+        """
+        # Los NaN quedan al final de la ordenación y no cumplen ningún límite
+        values = self.sorted_values[:self.valid]
+        start = 0 if minimum is None else np.searchsorted(values, minimum, side='left')
+        stop = len(values) if maximum is None else np.searchsorted(values, maximum, side='right')
+        return start, max(start, stop)
+
+    def between(self, minimum=None, maximum=None) -> np.ndarray:
+        """
+        Devuelve las filas cuyo valor está entre dos límites (ambos incluidos).
+
+        Args:
+            minimum (float): Límite inferior, o None si no hay.
+            maximum (float): Límite superior, o None si no hay.
+
+        Returns:
+            np.ndarray: Posiciones de las filas, en orden ascendente.
+        """
+        start, stop = self.bounds(minimum, maximum)
+        return np.sort(self.order[start:stop])
+
+
+class CatalogStats:
+    """
+    CatalogStats guarda las constantes de normalización de las columnas numéricas del
+    catálogo (mínimo, máximo y rango), de forma que las consultas no tengan que recorrer
+    las columnas completas para obtenerlas.
+
+    Atributos:
+        minimums (dict): Valor mínimo de cada columna numérica.
+        maximums (dict): Valor máximo de cada columna numérica.
+        spans (dict): Rango de cada columna (máximo - mínimo + 1e-6), usado como divisor.
+    """
+    def __init__(self, minimums: dict, maximums: dict):
+        """
+        Inicializa una instancia de la clase CatalogStats.
+
+        Args:
+            minimums (dict): Valor mínimo de cada columna numérica.
+            maximums (dict): Valor máximo de cada columna numérica.
+        """
+        self.minimums = dict(minimums)
+        self.maximums = dict(maximums)
+        self.spans = {
+            column: self.maximums[column] - self.minimums[column] + 1e-6
+            for column in self.minimums
+        }
+
+    @classmethod
+    def from_dataframe(cls, data: pd.DataFrame) -> 'CatalogStats':
+        """
+        Calcula las estadísticas de todas las columnas numéricas de un DataFrame.
+
+        Args:
+            data (pd.DataFrame): DataFrame con los datos de los coches.
+
+        Returns:
+            CatalogStats: Las estadísticas del DataFrame.
+        """
+        numeric = data.select_dtypes(include='number')
+        return cls(
+            {column: numeric[column].min() for column in numeric.columns},
+            {column: numeric[column].max() for column in numeric.columns}
+        )
+
+
+class RowChanges:
+    """
+    RowChanges describe cómo pasan las filas de un catálogo a las de su versión con cambios
+    (ver CarCatalog.apply_changes): las filas eliminadas desaparecen, las que siguen
+    conservan su orden y las añadidas se colocan al final.
+
+    Atributos:
+        kept (np.ndarray): Máscara de las filas anteriores que siguen en el catálogo.
+        unchanged (np.ndarray): Máscara de las filas anteriores que siguen sin modificar.
+        positions (np.ndarray): Posición nueva de cada fila anterior que sigue.
+        rows (np.ndarray): Posiciones nuevas de las filas modificadas y de las añadidas,
+                           en este orden.
+        kept_rows (int): Número de filas anteriores que siguen en el catálogo.
+        size (int): Número de filas del catálogo con los cambios.
+    """
+    def __init__(self, kept: np.ndarray, updated: np.ndarray, inserted: int):
+        """
+        Inicializa una instancia de la clase RowChanges.
+
+        Args:
+            kept (np.ndarray): Máscara de las filas anteriores que siguen en el catálogo.
+            updated (np.ndarray): Posiciones anteriores de las filas modificadas.
+            inserted (int): Número de filas añadidas.
+        """
+        self.kept = kept
+        self.unchanged = kept.copy()
+        self.unchanged[updated] = False
+        self.positions = np.cumsum(kept) - 1
+        self.kept_rows = int(np.count_nonzero(kept))
+        self.rows = np.concatenate([self.positions[updated],
+                                    np.arange(self.kept_rows, self.kept_rows + inserted)])
+        self.size = self.kept_rows + inserted
+
+    def column(self, values: np.ndarray, changed: np.ndarray) -> np.ndarray:
+        """
+        Construye una columna con los cambios a partir de la anterior.
+
+        Args:
+            values (np.ndarray): Valores anteriores de la columna.
+            changed (np.ndarray): Valores de las filas modificadas y añadidas, en el orden
+                                  de rows.
+
+        Returns:
+            np.ndarray: Los valores de la columna con los cambios.
+        """
+        column = np.empty(self.size, dtype=np.result_type(values.dtype, changed.dtype))
+        column[:self.kept_rows] = values[self.kept]
+        column[self.rows] = changed
+        return column
+
+    def sorted_order(self, order: np.ndarray, keys: np.ndarray) -> np.ndarray:
+        """
+        Actualiza una ordenación estable de las filas por clave, como la de
+        np.argsort(kind='stable'): las filas que no cambian conservan su orden relativo y
+        las modificadas y añadidas se insertan en su lugar mediante búsqueda binaria.
+
+        Args:
+            order (np.ndarray): Ordenación anterior de las filas.
+            keys (np.ndarray): Clave de cada fila, con los cambios.
+
+        Returns:
+            np.ndarray: La ordenación de las filas con los cambios.
+        """
+        order = self.positions[order[self.unchanged[order]]]
+        sorted_keys = keys[order]
+        rows = self.rows[np.lexsort((self.rows, keys[self.rows]))]
+        row_keys = keys[rows]
+
+        points = np.searchsorted(sorted_keys, row_keys, side='left')
+        ties = points < np.searchsorted(sorted_keys, row_keys, side='right')
+        if ties.any():
+            # A igual clave se ordena por posición: se numeran los grupos de claves
+            # iguales (los NaN forman un único grupo al final) y se busca por
+            # (grupo, posición)
+            same = sorted_keys[1:] == sorted_keys[:-1]
+            if np.issubdtype(sorted_keys.dtype, np.floating):
+                same |= np.isnan(sorted_keys[1:]) & np.isnan(sorted_keys[:-1])
+            groups = np.concatenate([[0], np.cumsum(~same)])
+            combined = groups * self.size + order
+            points[ties] = np.searchsorted(combined,
+                                           groups[points[ties]] * self.size + rows[ties])
+        return np.insert(order, points, rows)
+
+
+class CarCatalog:
+    """
+    CarCatalog agrupa el DataFrame de coches con las codificaciones por diccionario de
+    sus columnas y sus estadísticas, calculadas una única vez al cargar los datos.
+
+    Atributos:
+        data (pd.DataFrame): DataFrame con los datos de los coches.
+        encodings (dict): Codificaciones de las columnas, indexadas por su nombre.
+        stats (CatalogStats): Estadísticas de las columnas numéricas.
+        indexes (dict): Índices por rango de las columnas numéricas, por nombre de columna.
+        version (str): Identificador del contenido del catálogo, que cambia cada vez que
+                       cambian los datos (ver refresh).
+    """
+    # Columnas que se codifican al cargar el catálogo; el resto se codifican bajo demanda
+    ENCODED_COLUMNS = ['make', 'model', 'price', 'fuel', 'year', 'kms',
+                       'power', 'doors', 'shift', 'color', 'province']
+    # Columnas numéricas que admiten restricciones por rango
+    INDEXED_COLUMNS = ['price', 'year', 'kms', 'power', 'doors']
+    # Columnas categóricas que admiten restricciones por lista de valores
+    FILTER_COLUMNS = ['make', 'model', 'fuel', 'shift', 'color', 'province', 'doors']
+    # Columna que identifica cada coche en los cambios del catálogo
+    ID_COLUMN = 'id'
+
+    def __init__(self, data: pd.DataFrame, encodings: dict = None,
+                 stats: CatalogStats = None, version: str = None):
+        """
+        Inicializa una instancia de la clase CarCatalog.
+
+        Args:
+            data (pd.DataFrame): DataFrame con los datos de los coches.
+            encodings (dict): Codificaciones ya calculadas. Las columnas de
+                              ENCODED_COLUMNS que falten se codifican aquí.
+            stats (CatalogStats): Estadísticas ya calculadas. Si es None, se calculan aquí.
+            version (str): Identificador del contenido de los datos, por ejemplo el hash
+                           del archivo de origen. Si es None, se genera uno aleatorio.
+        """
+        self.data = data
+        self.encodings = dict(encodings or {})
+        for column in self.ENCODED_COLUMNS:
+            if column in data.columns and column not in self.encodings:
+                self.encodings[column] = CategoryEncoding.from_series(data[column])
+        self.stats = stats if stats is not None else CatalogStats.from_dataframe(data)
+        self.indexes = {}
+        self.version = version or uuid.uuid4().hex[:16]
+        self._ids = None  # Índice de la columna ID_COLUMN, se construye bajo demanda
+
+    def refresh(self) -> None:
+        """
+        Recalcula las codificaciones y las estadísticas del catálogo y le asigna una versión
+        nueva. Debe llamarse cada vez que se modifique el DataFrame de coches.
+        """
+        columns = set(self.encodings) | set(self.ENCODED_COLUMNS)
+        self.encodings = {
+            column: CategoryEncoding.from_series(self.data[column])
+            for column in columns if column in self.data.columns
+        }
+        self.stats = CatalogStats.from_dataframe(self.data)
+        self.indexes = {}
+        self.version = uuid.uuid4().hex[:16]
+        self._ids = None
+
+    def __len__(self) -> int:
+        return len(self.data)
+
+    @classmethod
+    def ensure(cls, cars) -> 'CarCatalog':
+        """
+        Devuelve un CarCatalog a partir de un catálogo o de un DataFrame de coches.
+
+        Args:
+            cars (CarCatalog | pd.DataFrame): Datos de los coches.
+
+        Returns:
+            CarCatalog: El catálogo correspondiente.
+        """
+        if isinstance(cars, cls):
+            return cars
+        return cls(cars)
+
+    def encoding(self, column: str) -> CategoryEncoding:
+        """
+        Devuelve la codificación de una columna, calculándola si todavía no existe.
+
+        Args:
+            column (str): Nombre de la columna.
+
+        Returns:
+            CategoryEncoding: La codificación de la columna.
+        """
+        if column not in self.encodings:
+            self.encodings[column] = CategoryEncoding.from_series(self.data[column])
+        return self.encodings[column]
+
+    def build_indexes(self) -> None:
+        """
+        Construye los índices de las columnas que admiten restricciones, para que las
+        consultas no tengan que hacerlo la primera vez que los usan.
+        """
+        for column in self.INDEXED_COLUMNS:
+            if column in self.data.columns:
+                self.index(column)
+        for column in self.FILTER_COLUMNS:
+            if column in self.data.columns:
+                self.encoding(column).build_rows()
+
+    def index(self, column: str) -> SortedIndex:
+        """
+        Devuelve el índice por rango de una columna numérica, construyéndolo si todavía
+        no existe.
+
+        Args:
+            column (str): Nombre de la columna.
+
+        Returns:
+            SortedIndex: El índice de la columna.
+        """
+        if column not in self.indexes:
+            self.indexes[column] = SortedIndex.from_values(self.values(column))
+        return self.indexes[column]
+
+    def candidates(self, constraints: dict) -> np.ndarray:
+        """
+        Devuelve las filas que cumplen todas las restricciones, resolviéndolas con los
+        índices del catálogo en lugar de recorrer las columnas.
+
+        Cada restricción es un rango para las columnas numéricas, por ejemplo
+        {'price': {'max': 20000}, 'year': {'min': 2015}}, o una lista de valores aceptados,
+        por ejemplo {'fuel': ['Electrico', 'Hibrido']}. Los índices permiten contar las
+        filas de cada restricción sin obtenerlas, así que solo se obtienen las de la más
+        selectiva y el resto se comprueban sobre esas filas.
+
+        Args:
+            constraints (dict): Restricciones por nombre de columna.
+
+        Returns:
+            np.ndarray: Posiciones de las filas que cumplen las restricciones, en orden
+            ascendente.
+
+        Raises:
+            ValueError: Si alguna restricción no se puede aplicar.
+        """
+        conditions = []
+        for column, condition in constraints.items():
+            if isinstance(condition, dict):
+                if column not in self.INDEXED_COLUMNS or column not in self.data.columns:
+                    raise ValueError(f"La columna '{column}' no admite restricciones por rango.")
+                limits = (condition.get('min'), condition.get('max'))
+                start, stop = self.index(column).bounds(*limits)
+                conditions.append((stop - start, 'range', column, limits))
+            else:
+                if column not in self.FILTER_COLUMNS or column not in self.data.columns:
+                    raise ValueError(f"La columna '{column}' no admite restricciones por valor.")
+                values = condition if isinstance(condition, (list, tuple, set)) else [condition]
+                encoding = self.encoding(column)
+                conditions.append((encoding.count_for(values), 'values', column, values))
+        if not conditions:
+            return np.arange(len(self))
+
+        # Se obtienen las filas de la restricción más selectiva con su índice
+        conditions.sort(key=lambda condition: condition[0])
+        _, kind, column, argument = conditions[0]
+        if kind == 'range':
+            rows = self.index(column).between(*argument)
+        else:
+            rows = self.encoding(column).rows_for(argument)
+
+        # Las demás restricciones se comprueban solo sobre esas filas
+        for _, kind, column, argument in conditions[1:]:
+            if kind == 'range':
+                values = self.values(column)[rows]
+                keep = ~pd.isna(values)
+                if argument[0] is not None:
+                    keep &= values >= argument[0]
+                if argument[1] is not None:
+                    keep &= values <= argument[1]
+            else:
+                encoding = self.encoding(column)
+                keep = np.isin(encoding.codes[rows], encoding.codes_for(argument))
+            rows = rows[keep]
+        return rows
+
+    def values(self, column: str) -> np.ndarray:
+        """
+        Devuelve los valores de una columna como array de NumPy.
+
+        Args:
+            column (str): Nombre de la columna.
+
+        Returns:
+            np.ndarray: Valores de la columna.
+        """
+        return self.data[column].to_numpy()
+
+    def positions_of(self, ids) -> np.ndarray:
+        """
+        Devuelve la posición en el catálogo de cada coche por su identificador.
+
+        Args:
+            ids (iterable): Identificadores de los coches (columna ID_COLUMN).
+
+        Returns:
+            np.ndarray: La posición de cada coche, o -1 si no está en el catálogo.
+
+        Raises:
+            ValueError: Si el catálogo no tiene la columna ID_COLUMN o tiene identificadores
+                        repetidos.
+        """
+        if self._ids is None:
+            if self.ID_COLUMN not in self.data.columns:
+                raise ValueError(f"El catálogo no tiene la columna '{self.ID_COLUMN}'.")
+            ids_index = pd.Index(self.values(self.ID_COLUMN))
+            if not ids_index.is_unique:
+                raise ValueError(f"La columna '{self.ID_COLUMN}' tiene valores repetidos.")
+            self._ids = ids_index
+        return self._ids.get_indexer(np.asarray(ids))
+
+    def apply_changes(self, upserts: pd.DataFrame = None, deletes=None) -> tuple:
+        """
+        Aplica altas, modificaciones y bajas de coches, identificados por la columna
+        ID_COLUMN, y devuelve un catálogo nuevo sin modificar este, de modo que las
+        consultas que lo están usando no se ven afectadas.
+
+        Solo se procesan las filas que cambian: las demás se copian tal cual, y las
+        codificaciones, los índices ya construidos y las estadísticas se actualizan de
+        forma incremental en lugar de recalcularse. Las filas eliminadas desaparecen, las
+        demás conservan su orden y las añadidas se colocan al final.
+
+        Args:
+            upserts (pd.DataFrame): Coches nuevos o modificados, con la columna ID_COLUMN y
+                                    cualquier subconjunto de las columnas del catálogo. Los
+                                    coches que ya existen se modifican solo en esas
+                                    columnas; en los nuevos, las demás quedan vacías. Si un
+                                    identificador se repite, se aplica la última fila.
+            deletes (iterable): Identificadores de los coches que se eliminan. Se aplican
+                                antes que upserts y los que no existen se ignoran.
+
+        Returns:
+            tuple: El catálogo con los cambios y un resumen con el número de coches
+            añadidos ('inserted'), modificados ('updated') y eliminados ('deleted') y el
+            total de coches ('rows').
+
+        Raises:
+            ValueError: Si upserts no indica el identificador de cada coche o tiene columnas
+                        que no son del catálogo.
+        """
+        upserts = self._validate_upserts(upserts)
+        kept = np.ones(len(self), dtype=bool)
+        deleted = self.positions_of(list(deletes if deletes is not None else []))
+        kept[deleted[deleted >= 0]] = False
+
+        # Las filas de upserts cuyo coche sigue en el catálogo lo modifican; el resto se
+        # añaden, en el mismo orden
+        positions = self.positions_of(upserts[self.ID_COLUMN].to_numpy())
+        is_update = positions >= 0
+        is_update[is_update] = kept[positions[is_update]]
+        sources = np.concatenate([np.flatnonzero(is_update), np.flatnonzero(~is_update)])
+        changes = RowChanges(kept, positions[is_update], int(np.count_nonzero(~is_update)))
+
+        # Si no se eliminan ni se añaden coches, las columnas que no cambian se comparten
+        # con este catálogo, junto con sus codificaciones e índices
+        same_rows = changes.size == changes.kept_rows == len(self)
+        unchanged = {column for column in self.data.columns
+                     if same_rows and column not in upserts.columns}
+        data = pd.DataFrame({
+            column: self.data[column].array if column in unchanged
+            else self._changed_column(column, changes, positions[is_update],
+                                      upserts[column].to_numpy()[sources]
+                                      if column in upserts.columns else None)
+            for column in self.data.columns
+        }, copy=False)
+
+        encodings = {}
+        for column, encoding in self.encodings.items():
+            if column in unchanged:
+                encodings[column] = encoding
+            elif self._same_kind(self.data[column].dtype, data[column].dtype):
+                encodings[column] = encoding.with_changes(
+                    changes, data[column].array.take(changes.rows))
+            else:
+                encodings[column] = CategoryEncoding.from_series(data[column])
+        indexes = {
+            column: index if column in unchanged
+            else index.with_changes(changes, data[column].to_numpy())
+            for column, index in self.indexes.items()
+            if self._same_kind(self.data[column].dtype, data[column].dtype)
+        }
+
+        catalog = CarCatalog(data, encodings=encodings,
+                             stats=self._changed_stats(data, indexes))
+        catalog.indexes = indexes
+        return catalog, {
+            'inserted': int(np.count_nonzero(~is_update)),
+            'updated': int(np.count_nonzero(is_update)),
+            'deleted': int(len(self) - changes.kept_rows),
+            'rows': changes.size
+        }
+
+    def changes_from(self, data: pd.DataFrame) -> tuple:
+        """
+        Compara el catálogo con una versión nueva de sus datos, por ejemplo el CSV de
+        coches leído de nuevo, y obtiene los cambios que la convierten en ella (ver
+        apply_changes).
+
+        Args:
+            data (pd.DataFrame): Datos nuevos de los coches, con la columna ID_COLUMN.
+
+        Returns:
+            tuple: Los coches nuevos o modificados (pd.DataFrame) y los identificadores de
+            los coches eliminados (np.ndarray).
+
+        Raises:
+            ValueError: Si data no tiene la columna ID_COLUMN.
+        """
+        if self.ID_COLUMN not in data.columns:
+            raise ValueError(f"Los datos deben tener la columna '{self.ID_COLUMN}'.")
+        columns = [column for column in self.data.columns if column in data.columns]
+        positions = self.positions_of(data[self.ID_COLUMN].to_numpy())
+        present = np.zeros(len(self), dtype=bool)
+        present[positions[positions >= 0]] = True
+
+        existing = np.flatnonzero(positions >= 0)
+        changed = positions < 0
+        for column in columns:
+            previous = np.asarray(self.data[column].array.take(positions[existing]),
+                                  dtype=object)
+            current = np.asarray(data[column].to_numpy()[existing], dtype=object)
+            changed[existing] |= (previous != current) & ~(pd.isna(previous)
+                                                          & pd.isna(current))
+        return (data.loc[changed, columns].reset_index(drop=True),
+                self.values(self.ID_COLUMN)[~present])
+
+    def _validate_upserts(self, upserts: pd.DataFrame) -> pd.DataFrame:
+        """
+        Comprueba los coches nuevos o modificados de apply_changes.
+
+        Args:
+            upserts (pd.DataFrame): Coches nuevos o modificados, o None.
+
+        Returns:
+            pd.DataFrame: Los coches, sin identificadores repetidos.
+
+        Raises:
+            ValueError: Si falta el identificador de algún coche o hay columnas que no son
+                        del catálogo.
+        """
+        if upserts is None:
+            return pd.DataFrame({self.ID_COLUMN: self.data[self.ID_COLUMN].iloc[:0]})
+        if self.ID_COLUMN not in upserts.columns or upserts[self.ID_COLUMN].isna().any():
+            raise ValueError(f"Cada coche debe indicar su '{self.ID_COLUMN}'.")
+        unknown = [column for column in upserts.columns if column not in self.data.columns]
+        if unknown:
+            raise ValueError(f"Columnas desconocidas: {', '.join(map(str, unknown))}")
+        return upserts.drop_duplicates(self.ID_COLUMN, keep='last')
+
+    def _changed_column(self, column: str, changes: RowChanges, updated: np.ndarray,
+                        values: np.ndarray):
+        """
+        Construye una columna del catálogo con los cambios.
+
+        Args:
+            column (str): Nombre de la columna.
+            changes (RowChanges): Correspondencia entre las filas anteriores y las nuevas.
+            updated (np.ndarray): Posiciones anteriores de las filas modificadas.
+            values (np.ndarray): Valores de las filas modificadas y añadidas, en el orden
+                                 de changes.rows, o None si los cambios no incluyen la
+                                 columna.
+
+        Returns:
+            np.ndarray | pd.Categorical: La columna con los cambios.
+        """
+        series = self.data[column]
+        inserted = len(changes.rows) - len(updated)
+        if isinstance(series.dtype, pd.CategoricalDtype):
+            # Las categorías se amplían con los valores nuevos y se trabaja con los códigos
+            categories = series.cat.categories
+            codes = series.cat.codes.to_numpy()
+            if values is None:
+                changed = np.concatenate([codes[updated], np.full(inserted, -1)])
+            else:
+                new = pd.unique(values[~pd.isna(values) & (categories.get_indexer(values) < 0)])
+                categories = categories.append(pd.Index(new)) if len(new) else categories
+                changed = categories.get_indexer(values)
+            return pd.Categorical.from_codes(changes.column(codes, changed), categories)
+
+        previous = series.to_numpy()
+        if values is not None and values.dtype == object and previous.dtype.kind in 'iuf':
+            # Los valores recibidos como objetos (por ejemplo, desde JSON) se convierten a
+            # número para que la columna conserve su tipo
+            values = pd.to_numeric(values)
+        if values is None:
+            # Las filas añadidas quedan vacías en las columnas que no se indican
+            values = previous[updated] if not inserted else np.concatenate(
+                [previous[updated], np.full(inserted, np.nan)])
+        return changes.column(previous, values)
+
+    def _changed_stats(self, data: pd.DataFrame, indexes: dict) -> CatalogStats:
+        """
+        Calcula las estadísticas del catálogo con los cambios. El mínimo y el máximo de las
+        columnas con índice son sus extremos, sin recorrer la columna.
+
+        Args:
+            data (pd.DataFrame): Datos del catálogo con los cambios.
+            indexes (dict): Índices del catálogo con los cambios.
+
+        Returns:
+            CatalogStats: Las estadísticas.
+        """
+        minimums, maximums = {}, {}
+        for column in data.columns:
+            dtype = data[column].dtype
+            if not isinstance(dtype, np.dtype) or dtype.kind not in 'iuf':
+                continue
+            if column in indexes:
+                index = indexes[column]
+                if index.valid:
+                    minimums[column] = index.sorted_values[0]
+                    maximums[column] = index.sorted_values[index.valid - 1]
+                else:
+                    minimums[column] = maximums[column] = np.nan
+                continue
+            values = data[column].to_numpy()
+            valid = values[~np.isnan(values)] if dtype.kind == 'f' else values
+            minimums[column] = valid.min() if len(valid) else np.nan
+            maximums[column] = valid.max() if len(valid) else np.nan
+        return CatalogStats(minimums, maximums)
+
+    @staticmethod
+    def _same_kind(previous, current) -> bool:
+        """
+        Indica si una columna conserva su tipo tras los cambios. Las columnas categóricas
+        lo conservan aunque se añadan categorías.
+
+        Args:
+            previous: Tipo anterior de la columna.
+            current: Tipo de la columna con los cambios.
+
+        Returns:
+            bool: True si el tipo se conserva.
+        """
+        if isinstance(previous, pd.CategoricalDtype):
+            return isinstance(current, pd.CategoricalDtype)
+        return previous == current
@@ -0,0 +1,104 @@
+"""
+Este módulo contiene la clase CatalogWatcher, que vigila el CSV de coches y comunica su
+contenido cada vez que cambia, para que el servicio de recomendación actualice el catálogo
+sin reiniciarse.
+"""
+
+import os
+import threading
+import pandas as pd
+
+
+class CatalogWatcher:
+    """
+    CatalogWatcher comprueba periódicamente, en un hilo en segundo plano, si el CSV de
+    coches ha cambiado (tamaño o fecha de modificación) y, en ese caso, lo lee y llama a
+    on_change con los datos nuevos. Si el archivo no se puede leer, por ejemplo porque se
+    está escribiendo, se vuelve a intentar en la siguiente comprobación.
+
+    Atributos:
+        path (str): Ruta al archivo CSV de coches.
+        on_change (callable): Función que recibe el DataFrame con los datos nuevos.
+        interval (float): Segundos entre dos comprobaciones.
+    """
+    def __init__(self, path: str, on_change, interval: float = 5.0):
+        """
+        Inicializa una instancia de la clase CatalogWatcher. La firma actual del archivo
+        se toma como punto de partida, así que solo se comunican los cambios posteriores.
+
+        Args:
+            path (str): Ruta al archivo CSV de coches.
+            on_change (callable): Función que recibe el DataFrame con los datos nuevos.
+            interval (float): Segundos entre dos comprobaciones.
+
+        Raises:
+            ValueError: Si interval no es positivo.
+        """
+        if interval <= 0:
+            raise ValueError("El intervalo de comprobación debe ser positivo.")
+        self.path = path
+        self.on_change = on_change
+        self.interval = interval
+        self._signature = self._file_signature()
+        self._stopped = threading.Event()
+        self._thread = None
+
+    def start(self) -> 'CatalogWatcher':
+        """
+        Inicia las comprobaciones en segundo plano.
+
+        Returns:
+            CatalogWatcher: El propio vigilante.
+        """
+        self._stopped.clear()
+        self._thread = threading.Thread(target=self._run, name='catalog-watcher', daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        """
+        Detiene las comprobaciones y espera a que termine la que está en curso.
+        """
+        self._stopped.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def check(self) -> bool:
+        """
+        Comprueba si el archivo ha cambiado y, en ese caso, comunica los datos nuevos.
+
+        Returns:
+            bool: True si el archivo había cambiado y se han comunicado los datos.
+        """
+        signature = self._file_signature()
+        if signature is None or signature == self._signature:
+            return False
+        try:
+            data = pd.read_csv(self.path)
+            self.on_change(data)
+        except (OSError, ValueError) as exception:
+            print(f"Error al actualizar el catálogo desde {self.path}: {exception}")
+            return False
+        self._signature = signature
+        return True
+
+    def _file_signature(self) -> tuple:
+        """
+        Devuelve la firma del archivo (tamaño y fecha de modificación).
+
+        Returns:
+            tuple: La firma, o None si el archivo no existe.
+        """
+        try:
+            stat = os.stat(self.path)
+        except OSError:
+            return None
+        return stat.st_size, stat.st_mtime_ns
+
+    def _run(self) -> None:
+        """
+        Comprueba el archivo cada interval segundos hasta que se detiene el vigilante.
+        """
+        while not self._stopped.wait(self.interval):
+            self.check()
@@ -3,11 +3,283 @@ Este módulo implementa un modelo de filtrado colaborativo
 para predecir las calificaciones de los usuarios.
 """
 
-import pickle
+import datetime
+import hashlib
+import json
 import os
+import threading
+import numpy as np
 import pandas as pd
-from surprise import Dataset, Reader, SVD
-from surprise.model_selection import train_test_split
+from .model_artifact import ModelArtifact
+from .retrieval import FactorIndex
+from .snapshot import file_sha256
+
+
+class FactorModel:
+    """
+    FactorModel contiene los parámetros de un modelo SVD entrenado como arrays de NumPy,
+    de forma que las predicciones no necesitan surprise.
+
+    Los IDs originales de usuarios y modelos se traducen a IDs internos mediante arrays
+    ordenados y búsqueda binaria, así que las traducciones también se pueden mapear en
+    memoria sin construir diccionarios al cargar el modelo.
+
+    Atributos:
+        pu (np.ndarray): Factores de cada usuario (usuarios x factores).
+        qi (np.ndarray): Factores de cada modelo de coche (modelos x factores).
+        bu (np.ndarray): Sesgo de cada usuario.
+        bi (np.ndarray): Sesgo de cada modelo de coche.
+        user_counts (np.ndarray): Número de valoraciones con las que se han estimado los
+                                  factores de cada usuario.
+        user_ids (np.ndarray): ID original de cada usuario, por ID interno.
+        item_ids (np.ndarray): ID original de cada modelo de coche, por ID interno.
+        global_mean (float): Calificación media del conjunto de entrenamiento.
+        rating_scale (tuple): Calificaciones mínima y máxima.
+        biased (bool): Indica si el modelo usa los sesgos de usuarios y modelos.
+    """
+    ARRAYS = ['pu', 'qi', 'bu', 'bi', 'user_counts', 'user_ids', 'user_keys', 'user_inner',
+              'item_ids', 'item_keys', 'item_inner']
+
+    def __init__(self, arrays: dict, global_mean: float, rating_scale: tuple, biased: bool):
+        """
+        Inicializa una instancia de la clase FactorModel.
+
+        Args:
+            arrays (dict): Arrays del modelo (ver ARRAYS). 'user_keys' y 'item_keys' son
+                           los IDs originales ordenados y 'user_inner' e 'item_inner' el
+                           ID interno de cada uno de ellos.
+            global_mean (float): Calificación media del conjunto de entrenamiento.
+            rating_scale (tuple): Calificaciones mínima y máxima.
+            biased (bool): Indica si el modelo usa los sesgos.
+        """
+        self.pu = arrays['pu']
+        self.qi = arrays['qi']
+        self.bu = arrays['bu']
+        self.bi = arrays['bi']
+        self.user_counts = arrays['user_counts']
+        self.user_ids = arrays['user_ids']
+        self.item_ids = arrays['item_ids']
+        self._user_keys = arrays['user_keys']
+        self._user_inner = arrays['user_inner']
+        self._item_keys = arrays['item_keys']
+        self._item_inner = arrays['item_inner']
+        self.global_mean = global_mean
+        self.rating_scale = tuple(rating_scale)
+        self.biased = biased
+
+    @classmethod
+    def from_svd(cls, svd) -> 'FactorModel':
+        """
+        Extrae los parámetros de un modelo SVD de surprise ya entrenado.
+
+        Args:
+            svd (surprise.SVD): El modelo entrenado.
+
+        Returns:
+            FactorModel: Los parámetros del modelo.
+        """
+        trainset = svd.trainset
+        user_ids = cls._id_array([trainset.to_raw_uid(inner)
+                                  for inner in range(trainset.n_users)])
+        item_ids = cls._id_array([trainset.to_raw_iid(inner)
+                                  for inner in range(trainset.n_items)])
+        user_inner = np.argsort(user_ids, kind='stable')
+        item_inner = np.argsort(item_ids, kind='stable')
+        arrays = {
+            'pu': np.asarray(svd.pu, dtype=float).reshape(trainset.n_users, -1),
+            'qi': np.asarray(svd.qi, dtype=float).reshape(trainset.n_items, -1),
+            'bu': np.asarray(svd.bu, dtype=float),
+            'bi': np.asarray(svd.bi, dtype=float),
+            'user_counts': np.array([len(trainset.ur[inner]) for inner in range(trainset.n_users)],
+                                    dtype=np.int64),
+            'user_ids': user_ids, 'user_keys': user_ids[user_inner], 'user_inner': user_inner,
+            'item_ids': item_ids, 'item_keys': item_ids[item_inner], 'item_inner': item_inner
+        }
+        return cls(arrays, float(trainset.global_mean), trainset.rating_scale,
+                   bool(svd.biased))
+
+    @staticmethod
+    def _id_array(raw_ids: list) -> np.ndarray:
+        """
+        Convierte una lista de IDs originales en un array que se pueda guardar en disco.
+
+        Args:
+            raw_ids (list): IDs originales.
+
+        Returns:
+            np.ndarray: Los IDs como números o, si no lo son todos, como texto.
+        """
+        array = np.asarray(raw_ids)
+        return array.astype(str) if array.dtype == object else array
+
+    def arrays(self) -> dict:
+        """
+        Devuelve los arrays del modelo para guardarlos.
+
+        Returns:
+            dict: Arrays del modelo por nombre (ver ARRAYS).
+        """
+        return {'pu': self.pu, 'qi': self.qi, 'bu': self.bu, 'bi': self.bi,
+                'user_counts': self.user_counts, 'user_ids': self.user_ids,
+                'user_keys': self._user_keys, 'user_inner': self._user_inner,
+                'item_ids': self.item_ids, 'item_keys': self._item_keys,
+                'item_inner': self._item_inner}
+
+    def user_index(self, user_id) -> int:
+        """
+        Traduce el ID de un usuario a su ID interno.
+
+        Args:
+            user_id: ID original del usuario.
+
+        Returns:
+            int: El ID interno, o -1 si el modelo no conoce al usuario.
+        """
+        return int(self.user_indices([user_id])[0])
+
+    def user_indices(self, user_ids) -> np.ndarray:
+        """
+        Traduce los IDs de varios usuarios a sus IDs internos.
+
+        Args:
+            user_ids (array-like): IDs originales de los usuarios.
+
+        Returns:
+            np.ndarray: El ID interno de cada usuario, o -1 si el modelo no lo conoce.
+        """
+        return self._lookup(self._user_keys, self._user_inner, user_ids)
+
+    def item_indices(self, model_ids) -> np.ndarray:
+        """
+        Traduce los IDs de varios modelos de coche a sus IDs internos.
+
+        Args:
+            model_ids (array-like): IDs originales de los modelos.
+
+        Returns:
+            np.ndarray: El ID interno de cada modelo, o -1 si el modelo no lo conoce.
+        """
+        return self._lookup(self._item_keys, self._item_inner, model_ids)
+
+    @staticmethod
+    def _lookup(keys: np.ndarray, inner: np.ndarray, values) -> np.ndarray:
+        """
+        Busca varios IDs originales en un array ordenado de IDs.
+
+        Args:
+            keys (np.ndarray): IDs originales ordenados.
+            inner (np.ndarray): ID interno de cada posición de keys.
+            values (array-like): IDs a buscar.
+
+        Returns:
+            np.ndarray: El ID interno de cada valor, o -1 si no aparece.
+        """
+        values = np.asarray(values)
+        result = np.full(len(values), -1, dtype=np.intp)
+        if not len(keys) or not len(values):
+            return result
+        try:
+            positions = np.minimum(np.searchsorted(keys, values), len(keys) - 1)
+            found = np.asarray(keys[positions] == values, dtype=bool)
+        except (TypeError, ValueError):
+            return result  # IDs de un tipo distinto al de los del modelo
+        result[found] = inner[positions[found]]
+        return result
+
+    def with_users(self, user_ids) -> 'FactorModel':
+        """
+        Devuelve una copia del modelo con usuarios nuevos, sin valoraciones: factores y
+        sesgo a cero, que es la estimación de un usuario desconocido. Los arrays de los
+        usuarios se copian aunque no haya usuarios nuevos, así que la copia se puede
+        modificar (ver fit_user) sin afectar a este modelo.
+
+        Args:
+            user_ids (array-like): IDs originales de los usuarios nuevos.
+
+        Returns:
+            FactorModel: El modelo ampliado. Los arrays de los modelos de coche se comparten.
+        """
+        user_ids = list(user_ids)
+        new_ids = self._id_array(user_ids) if user_ids else self.user_ids[:0]
+        user_ids = np.concatenate([self.user_ids, new_ids])
+        user_inner = np.argsort(user_ids, kind='stable')
+        arrays = dict(
+            self.arrays(),
+            pu=np.vstack([self.pu, np.zeros((len(new_ids), self.pu.shape[1]))]),
+            bu=np.concatenate([self.bu, np.zeros(len(new_ids))]),
+            user_counts=np.concatenate([self.user_counts,
+                                        np.zeros(len(new_ids), dtype=np.int64)]),
+            user_ids=user_ids, user_keys=user_ids[user_inner], user_inner=user_inner
+        )
+        return FactorModel(arrays, self.global_mean, self.rating_scale, self.biased)
+
+    def fit_user(self, inner_user: int, inner_items: np.ndarray, ratings: np.ndarray,
+                 reg: float) -> None:
+        """
+        Ajusta los factores y el sesgo de un usuario a sus valoraciones nuevas con los
+        factores de los modelos de coche fijos.
+
+        Es un problema de mínimos cuadrados regularizado que se resuelve de forma exacta.
+        Los factores actuales del usuario actúan como estimación previa, con un peso igual
+        a reg más el número de valoraciones con las que se estimaron, de forma que las
+        valoraciones nuevas corrigen la estimación en lugar de sustituirla.
+
+        Args:
+            inner_user (int): ID interno del usuario.
+            inner_items (np.ndarray): IDs internos de los modelos valorados.
+            ratings (np.ndarray): Calificación de cada modelo.
+            reg (float): Término de regularización.
+        """
+        factors = self.qi[inner_items]
+        if self.biased:
+            design = np.hstack([np.ones((len(inner_items), 1)), factors])
+            targets = ratings - self.global_mean - self.bi[inner_items]
+            previous = np.concatenate([[self.bu[inner_user]], self.pu[inner_user]])
+        else:
+            design = factors
+            targets = np.asarray(ratings, dtype=float)
+            previous = np.array(self.pu[inner_user])
+
+        weight = reg + self.user_counts[inner_user]
+        solution = np.linalg.solve(
+            design.T @ design + weight * np.eye(design.shape[1]),
+            design.T @ targets + weight * previous
+        )
+        if self.biased:
+            self.bu[inner_user] = solution[0]
+            solution = solution[1:]
+        self.pu[inner_user] = solution
+        self.user_counts[inner_user] += len(inner_items)
+
+    def estimate(self, inner_user: int, inner_items: np.ndarray) -> np.ndarray:
+        """
+        Calcula la calificación estimada de un usuario para varios modelos de coche,
+        replicando SVD.predict de surprise de forma vectorizada.
+
+        Args:
+            inner_user (int): ID interno del usuario, o -1 si es desconocido.
+            inner_items (np.ndarray): IDs internos de los modelos (-1 si son desconocidos).
+
+        Returns:
+            np.ndarray: La calificación estimada de cada modelo.
+        """
+        known = inner_items >= 0
+        items = inner_items[known]
+
+        estimates = np.full(len(inner_items), self.global_mean)
+        if self.biased:
+            # Un usuario desconocido (por ejemplo 'new_user') se resuelve con la media
+            # global y el sesgo de cada modelo, sin productos de factores
+            if inner_user >= 0:
+                estimates += self.bu[inner_user]
+            estimates[known] += self.bi[items]
+            if inner_user >= 0:
+                estimates[known] += self.qi[items] @ self.pu[inner_user]
+        elif inner_user >= 0:
+            estimates[known] = self.qi[items] @ self.pu[inner_user]
+
+        lower_bound, higher_bound = self.rating_scale
+        return np.clip(estimates, lower_bound, higher_bound)
 
 
 class CollaborativeFilter:
@@ -15,33 +287,73 @@ class CollaborativeFilter:
     CollaborativeFilter es una clase que implementa un modelo de filtrado colaborativo
     para predecir las calificaciones de los usuarios.
 
+    El modelo entrenado se guarda como un ModelArtifact con sus matrices de factores,
+    sesgos y traducciones de IDs, más los hiperparámetros y la firma del archivo de
+    valoraciones con el que se entrenó. Cargarlo solo mapea los arrays en memoria y no
+    necesita importar surprise, que solo se usa para entrenar.
+
     Atributos:
         model_path (str): Ruta al archivo del modelo guardado.
-        model (SVD): El modelo de filtrado colaborativo.
-        testset (Dataset): El conjunto de datos de prueba utilizado para la evaluación.
+        params_path (str): Ruta al archivo de hiperparámetros.
+        model (FactorModel): Los parámetros del modelo de filtrado colaborativo.
+        metadata (dict): Metadatos del modelo: hiperparámetros ('params'), firma de las
+                         valoraciones ('ratings'), fecha de entrenamiento, versión y número
+                         de valoraciones incorporadas después del entrenamiento
+                         ('folded_ratings').
+        testset (list): El conjunto de prueba del último entrenamiento, o None si el modelo
+                        se ha cargado del archivo.
     """
-    def __init__(self, model_path='data/collaborative_model.pkl'):
+    # Estos parámetros han sido encontrados mediante GridSearchCV; se usan mientras no
+    # exista el archivo de hiperparámetros que escribe la búsqueda (ver modules.tuning)
+    DEFAULT_PARAMS = {
+        'n_factors': 20,
+        'n_epochs': 10,
+        'lr_all': 0.002,
+        'reg_all': 0.4
+    }
+    PARAMS_PATH = 'data/collaborative_params.json'
+
+    def __init__(self, model_path='data/collaborative_model.bin', params_path=PARAMS_PATH):
         """
         Inicializa una instancia de la clase CollaborativeFilter.
 
         Args:
             model_path (str): Ruta al archivo del modelo colaborativo.
-                              Por defecto es 'data/collaborative_model.pkl'.
+                              Por defecto es 'data/collaborative_model.bin'.
+            params_path (str): Ruta al archivo de hiperparámetros escrito por la búsqueda
+                               de hiperparámetros.
         """
         self.model_path = model_path
+        self.params_path = params_path
         self.model = None
+        self.metadata = None
         self.testset = None
+        self._lock = threading.Lock()
+        self._index = None
+
+    @property
+    def version(self):
+        """
+        Versión del modelo cargado, que cambia cada vez que se entrena.
+
+        Returns:
+            str: La versión, o None si el modelo no está entrenado.
+        """
+        return None if self.metadata is None else self.metadata['version']
 
-    def train_model(self, ratings_path: str) -> None:
+    def train_model(self, ratings_path: str, params: dict = None) -> None:
         """
         Entrena un modelo de filtrado colaborativo utilizando los datos de calificaciones
         proporcionados.
-        Si un modelo entrenado ya existe en la ruta especificada,
-        lo carga en lugar de entrenar uno nuevo.
+        Si en la ruta especificada ya existe un modelo entrenado con las mismas
+        valoraciones y los mismos hiperparámetros, lo carga en lugar de entrenar uno nuevo;
+        si las valoraciones han cambiado, lo vuelve a entrenar.
 
         Args:
             ratings_path (str): La ruta al archivo CSV que contiene las
             calificaciones de los usuarios.
+            params (dict): Hiperparámetros del modelo SVD. Por defecto, los del archivo de
+                           hiperparámetros o, si no existe, DEFAULT_PARAMS.
 
         El archivo CSV debe tener las siguientes columnas:
         - user_id: Identificador del usuario.
@@ -49,36 +361,236 @@ class CollaborativeFilter:
         - rating: Calificación dada por un usuario al ítem.
         El modelo entrenado se guarda en la ruta especificada por self.model_path.
         """
-        if os.path.exists(self.model_path):
+        params = dict(self.tuned_params() if params is None else params)
+        if self.load(ratings_path, params):
             print("Cargando modelo colaborativo guardado...")
-            with open(self.model_path, 'rb') as model_file:
-                self.model = pickle.load(model_file)
             return
 
-        print("Entrenando un nuevo modelo colaborativo...")
-        df_ratings = pd.read_csv(ratings_path)
-        reader = Reader(rating_scale=(1, 5))
-        data = Dataset.load_from_df(df_ratings[['user_id', 'model_id', 'rating']], reader)
+        df_ratings, signature = self.read_ratings(ratings_path)
+        self.train_from_ratings(df_ratings, signature, params)
 
-        trainset, self.testset = train_test_split(data, test_size=0.2)
+    def train_from_ratings(self, df_ratings: pd.DataFrame, signature: dict,
+                           params: dict = None) -> None:
+        """
+        Entrena un modelo nuevo con valoraciones ya leídas (ver read_ratings) y lo guarda,
+        sin volver a leer el archivo, de forma que la firma guardada corresponde
+        exactamente a las valoraciones con las que se ha entrenado.
 
-        # Estos parámetros han sido encontrados mediante GridSearchCV
-        best_params = {
-            'n_factors': 20,
-            'n_epochs': 10,
-            'lr_all': 0.002,
-            'reg_all': 0.4
+        Args:
+            df_ratings (pd.DataFrame): Valoraciones con user_id, model_id y rating.
+            signature (dict): Firma del archivo del que se leyeron las valoraciones.
+            params (dict): Hiperparámetros del modelo SVD. Por defecto, los del archivo de
+                           hiperparámetros o, si no existe, DEFAULT_PARAMS.
+        """
+        params = dict(self.tuned_params() if params is None else params)
+        print("Entrenando un nuevo modelo colaborativo...")
+        svd, self.testset = self._fit(df_ratings, params)
+        self.model = FactorModel.from_svd(svd)
+        trained_at = datetime.datetime.now().isoformat(timespec='seconds')
+        self.metadata = {
+            'params': params,
+            'ratings': signature,
+            'trained_at': trained_at,
+            'version': hashlib.sha256(json.dumps(
+                [params, signature['sha256'], trained_at], sort_keys=True
+            ).encode('utf-8')).hexdigest()[:16]
         }
-        self.model = SVD(
-            n_factors=best_params['n_factors'],
-            n_epochs=best_params['n_epochs'],
-            lr_all=best_params['lr_all'],
-            reg_all=best_params['reg_all']
+        self._save()
+
+    def tuned_params(self) -> dict:
+        """
+        Lee los hiperparámetros elegidos por la última búsqueda de hiperparámetros.
+
+        Returns:
+            dict: Los hiperparámetros del archivo, o DEFAULT_PARAMS si no existe o no es
+            válido.
+        """
+        if not os.path.exists(self.params_path):
+            return dict(self.DEFAULT_PARAMS)
+        try:
+            with open(self.params_path, encoding='utf-8') as params_file:
+                params = json.load(params_file)['params']
+        except (OSError, ValueError, KeyError, TypeError) as exception:
+            print(f"Error al leer los hiperparámetros: {exception}")  # Manejo de errores
+            return dict(self.DEFAULT_PARAMS)
+        return params
+
+    def load(self, ratings_path: str, params: dict = None) -> bool:
+        """
+        Carga el modelo guardado si se entrenó con el archivo de valoraciones actual y, si
+        se indican, con los mismos hiperparámetros.
+
+        Si el tamaño y la fecha de modificación de las valoraciones coinciden, el modelo se
+        da por válido sin leerlas. Si solo ha cambiado la fecha pero el hash del contenido
+        coincide, se actualiza la firma guardada.
+
+        Args:
+            ratings_path (str): La ruta al archivo CSV de valoraciones.
+            params (dict): Hiperparámetros que debe tener el modelo, o None para no
+                           comprobarlos.
+
+        Returns:
+            bool: True si el modelo se ha cargado.
+        """
+        artifact = ModelArtifact(self.model_path)
+        stored = artifact.read()
+        if stored is None:
+            return False
+        metadata, arrays = stored
+        if params is not None and metadata.get('params') != params:
+            return False
+        if any(name not in arrays for name in FactorModel.ARRAYS):
+            return False
+
+        signature = metadata.get('ratings', {})
+        stat = os.stat(ratings_path)
+        if signature.get('size') != stat.st_size:
+            return False
+        if signature.get('mtime_ns') != stat.st_mtime_ns:
+            if file_sha256(ratings_path) != signature.get('sha256'):
+                return False
+            signature.update(size=stat.st_size, mtime_ns=stat.st_mtime_ns)
+            try:
+                artifact.write(arrays, metadata)
+            except OSError:
+                pass  # Se comprobará el hash de nuevo en la próxima carga
+
+        self.model = FactorModel(arrays, metadata['global_mean'], metadata['rating_scale'],
+                                 metadata['biased'])
+        self.metadata = metadata
+        self.testset = None
+        return True
+
+    def fold_in(self, ratings) -> dict:
+        """
+        Incorpora valoraciones nuevas al modelo entrenado sin volver a entrenarlo: solo se
+        ajustan los factores y el sesgo de los usuarios que las han hecho (ver
+        FactorModel.fit_user), y los usuarios que el modelo no conocía se añaden. Los
+        factores de los modelos de coche no cambian, así que las valoraciones de modelos
+        que el modelo no conoce se ignoran hasta el siguiente entrenamiento.
+
+        El cambio solo se aplica en memoria; el archivo del modelo no se modifica. Las
+        valoraciones deben añadirse también al CSV para que el siguiente entrenamiento
+        completo las tenga en cuenta (ver RecommenderService.add_ratings).
+
+        Args:
+            ratings (pd.DataFrame | list): Valoraciones con las columnas user_id, model_id
+                                           y rating, o tuplas con esos valores.
+
+        Returns:
+            dict: Número de valoraciones incorporadas ('ratings') e ignoradas ('skipped'),
+            de usuarios actualizados ('users') y de usuarios nuevos ('new_users').
+
+        Raises:
+            ValueError: Si el modelo no está entrenado.
+        """
+        if self.model is None:
+            raise ValueError("El modelo no está entrenado.")
+        if not isinstance(ratings, pd.DataFrame):
+            ratings = pd.DataFrame(list(ratings), columns=['user_id', 'model_id', 'rating'])
+
+        with self._lock:
+            model = self.model
+            items = model.item_indices(ratings['model_id'].to_numpy())
+            known = items >= 0
+            user_codes, user_ids = pd.factorize(ratings['user_id'].to_numpy()[known])
+            items = items[known]
+            values = ratings['rating'].to_numpy(dtype=float)[known]
+
+            users = model.user_indices(user_ids)
+            new_users = users < 0
+            # Los usuarios se ajustan sobre una copia que sustituye entera al modelo al
+            # final, así que las consultas en curso siguen usando el anterior sin cambios
+            model = model.with_users(user_ids[new_users])
+            users[new_users] = model.user_indices(user_ids[new_users])
+
+            params = self.metadata['params']
+            reg = params.get('reg_pu', params.get('reg_all', 0.02))
+            order = np.argsort(user_codes, kind='stable')
+            bounds = np.searchsorted(user_codes[order], np.arange(len(user_ids) + 1))
+            for code, user in enumerate(users):
+                rows = order[bounds[code]:bounds[code + 1]]
+                model.fit_user(user, items[rows], values[rows], reg)
+
+            folded = self.metadata.get('folded_ratings', 0) + len(values)
+            self.metadata = dict(
+                self.metadata, folded_ratings=folded,
+                version=f"{self.metadata['version'].split('+')[0]}+{folded}"
+            )
+            self.model = model
+
+        return {'ratings': int(len(values)), 'skipped': int((~known).sum()),
+                'users': int(len(user_ids)), 'new_users': int(new_users.sum())}
+
+    def _save(self) -> None:
+        """
+        Guarda el modelo y sus metadatos. Si no se puede escribir el archivo, el modelo
+        se sigue usando desde memoria.
+        """
+        metadata = dict(self.metadata, global_mean=self.model.global_mean,
+                        rating_scale=list(self.model.rating_scale), biased=self.model.biased)
+        try:
+            ModelArtifact(self.model_path).write(self.model.arrays(), metadata)
+        except OSError as exception:
+            print(f"No se pudo guardar el modelo colaborativo: {exception}")
+        self.metadata = metadata
+
+    @classmethod
+    def read_ratings(cls, ratings_path: str) -> tuple:
+        """
+        Lee el archivo de valoraciones junto con su firma. Quien escriba en el archivo
+        debe impedirlo mientras tanto para que ambos correspondan al mismo contenido (ver
+        RecommenderService._retrain).
+
+        Args:
+            ratings_path (str): La ruta al archivo CSV de valoraciones.
+
+        Returns:
+            tuple: Las valoraciones (pd.DataFrame) y la firma del archivo (dict).
+        """
+        signature = cls._ratings_signature(ratings_path)
+        return pd.read_csv(ratings_path), signature
+
+    @staticmethod
+    def _ratings_signature(ratings_path: str) -> dict:
+        """
+        Obtiene el tamaño, la fecha de modificación y el hash del archivo de valoraciones.
+
+        Args:
+            ratings_path (str): La ruta al archivo CSV de valoraciones.
+
+        Returns:
+            dict: La firma del archivo.
+        """
+        stat = os.stat(ratings_path)
+        return {'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns,
+                'sha256': file_sha256(ratings_path)}
+
+    @staticmethod
+    def _fit(df_ratings: pd.DataFrame, params: dict) -> tuple:
+        """
+        Entrena un modelo SVD de surprise con las valoraciones dadas.
+
+        Args:
+            df_ratings (pd.DataFrame): Valoraciones con user_id, model_id y rating.
+            params (dict): Hiperparámetros del modelo SVD.
+
+        Returns:
+            tuple: El modelo entrenado y el conjunto de prueba.
+        """
+        # surprise solo se necesita para entrenar, no para predecir
+        from surprise import Dataset, Reader, SVD  # pylint: disable=import-outside-toplevel
+        from surprise.model_selection import (  # pylint: disable=import-outside-toplevel
+            train_test_split
         )
-        self.model.fit(trainset)
 
-        with open(self.model_path, 'wb') as model_file:
-            pickle.dump(self.model, model_file)
+        reader = Reader(rating_scale=(1, 5))
+        data = Dataset.load_from_df(df_ratings[['user_id', 'model_id', 'rating']], reader)
+
+        trainset, testset = train_test_split(data, test_size=0.2)
+        model = SVD(**params)
+        model.fit(trainset)
+        return model, testset
 
     def predict_rating(self, user_id: str, model_id: int) -> float:
         """
@@ -91,10 +603,105 @@ class CollaborativeFilter:
         Returns:
             float: La calificación predicha para el usuario y el modelo especificados.
 
+        Raises:
+            ValueError: Si el modelo no está entrenado.
+        """
+        return float(self.predict_many(user_id, [model_id])[0])
+
+    def predict_many(self, user_id: str, model_ids) -> np.ndarray:
+        """
+        Predice la calificación de un usuario para varios modelos a la vez.
+
+        La predicción se calcula directamente a partir de las matrices de factores del
+        modelo SVD: cada modelo distinto se evalúa una sola vez mediante un único producto
+        matriz-vector y el resultado se reparte entre todas sus posiciones.
+
+        Args:
+            user_id (str): El ID del usuario para el cual se desea predecir la calificación.
+            model_ids (array-like): Los IDs de los modelos, uno por coche.
+
+        Returns:
+            np.ndarray: La calificación predicha para cada posición de model_ids.
+
+        Raises:
+            ValueError: Si el modelo no está entrenado.
+        """
+        if self.model is None:
+            raise ValueError("El modelo no está entrenado.")
+        codes, unique_ids = pd.factorize(np.asarray(model_ids))
+        return self._predict_unique(user_id, unique_ids.tolist())[codes]
+
+    def _predict_unique(self, user_id, model_ids: list) -> np.ndarray:
+        """
+        Predice la calificación de un usuario para una lista de modelos distintos.
+
+        Args:
+            user_id (str): El ID del usuario.
+            model_ids (list): Los IDs de los modelos, sin repetidos.
+
+        Returns:
+            np.ndarray: La calificación predicha para cada modelo.
+        """
+        return self.model.estimate(self.model.user_index(user_id),
+                                   self.model.item_indices(model_ids))
+
+    def retrieval_index(self) -> FactorIndex:
+        """
+        Devuelve el índice de búsqueda sobre los factores de los modelos de coche. El
+        índice se construye la primera vez y se reutiliza mientras los factores de los
+        modelos no cambien: incorporar valoraciones (ver fold_in) solo cambia los de los
+        usuarios, así que solo un entrenamiento nuevo lo invalida.
+
+        Returns:
+            FactorIndex: El índice del modelo actual.
+
+        Raises:
+            ValueError: Si el modelo no está entrenado.
+        """
+        if self.model is None:
+            raise ValueError("El modelo no está entrenado.")
+        return self._index_for(self.model)
+
+    def _index_for(self, model: FactorModel) -> FactorIndex:
+        """
+        Devuelve el índice de búsqueda de un modelo, construyéndolo si el guardado es de
+        otro modelo.
+
+        Args:
+            model (FactorModel): El modelo.
+
+        Returns:
+            FactorIndex: El índice del modelo.
+        """
+        index = self._index
+        if index is None or index.item_factors is not model.qi:
+            index = FactorIndex(model.qi, model.bi if model.biased else None)
+            self._index = index
+        return index
+
+    def top_models(self, user_id, n: int = 10, approximate: bool = False) -> tuple:
+        """
+        Obtiene los modelos de coche con mayor calificación estimada para un usuario, sin
+        predecir todos los modelos (ver FactorIndex).
+
+        Args:
+            user_id: El ID del usuario.
+            n (int): Número de modelos a devolver.
+            approximate (bool): Si es True, se usa la búsqueda aproximada del índice.
+
+        Returns:
+            tuple: Los IDs de los modelos, de mayor a menor calificación estimada, y la
+            calificación estimada de cada uno (la misma que predict_many).
+
         Raises:
             ValueError: Si el modelo no está entrenado.
         """
         if self.model is None:
             raise ValueError("El modelo no está entrenado.")
-        prediction = self.model.predict(user_id, model_id)
-        return prediction.est
+        # El modelo se lee una sola vez por si se sustituye durante la búsqueda
+        model = self.model
+        index = self._index_for(model)
+        inner_user = model.user_index(user_id)
+        query = index.query_vector(model.pu[inner_user] if inner_user >= 0 else None)
+        inner_items = index.search(query, n, approximate)
+        return model.item_ids[inner_items], model.estimate(inner_user, inner_items)
@@ -5,6 +5,7 @@ entre las preferencias del usuario y los datos de los coches.
 
 import pandas as pd
 import numpy as np
+from .catalog import CarCatalog, CatalogStats
 
 class ContentFilter:
     """
@@ -13,81 +14,306 @@ class ContentFilter:
     @staticmethod
     def calculate_content_similarity(
         user_input: dict,
-        car_data: pd.DataFrame,
+        car_data,
         feature_weights: dict
     ) -> pd.DataFrame:
         """
         Calcula la similitud entre las características deseadas por el usuario y los coches.
 
         :param user_input: Diccionario con las preferencias del usuario.
-        :param car_data: DataFrame con los datos de los coches.
+        :param car_data: Catálogo o DataFrame con los datos de los coches.
         :param feature_weights: Diccionario con los pesos asignados a cada característica.
         :return: DataFrame con un puntaje de similitud para cada coche.
         """
+        catalog = CarCatalog.ensure(car_data)
+        similarity_score = ContentFilter.score(user_input, catalog, feature_weights)
+
         # Crear una copia del DataFrame original para evitar modificarlo directamente
-        car_data = car_data.copy()
+        car_data = catalog.data.copy()
+        car_data['similarity_score'] = similarity_score
 
-        # Inicializar una nueva columna para almacenar el puntaje de similitud
-        car_data['similarity_score'] = 0.0
+        # Ordenar los coches según el puntaje de similitud de mayor a menor
+        return car_data.sort_values(by='similarity_score', ascending=False)
 
+    # Características que se comparan numéricamente y por coincidencia exacta
+    NUMERIC_FEATURES = ['price', 'year', 'kms', 'power', 'distance']
+    CATEGORICAL_FEATURES = ['fuel', 'shift', 'color', 'make', 'model', 'doors']
+
+    @staticmethod
+    def score(user_input: dict, catalog: CarCatalog, feature_weights: dict,
+              rows: np.ndarray = None, bases: dict = None) -> np.ndarray:
+        """
+        Calcula el puntaje de similitud de cada coche del catálogo, en el orden del catálogo.
+
+        Las columnas categóricas se comparan mediante sus códigos precalculados, por lo que
+        cada característica se resuelve con una única comparación vectorizada.
+
+        :param user_input: Diccionario con las preferencias del usuario.
+        :param catalog: Catálogo de coches con sus columnas codificadas.
+        :param feature_weights: Diccionario con los pesos asignados a cada característica.
+                                Los pesos se normalizan sin modificar el diccionario.
+        :param rows: Posiciones de los coches candidatos. Si se indica, solo se puntúan esos
+                     coches y el puntaje se normaliza entre ellos.
+        :param bases: Vectores base ya calculados para user_input y rows (ver term_bases).
+        :return: Array con el puntaje de similitud normalizado entre 0 y 1.
+        """
         # Normalizar los pesos de las características para que sumen 1
+        feature_weights = ContentFilter.normalize_weights(feature_weights)
+
+        return ContentFilter.normalize_score(
+            ContentFilter.raw_score(user_input, catalog, feature_weights, rows, bases)
+        )
+
+    @staticmethod
+    def raw_score(user_input: dict, catalog: CarCatalog, feature_weights: dict,
+                  rows: np.ndarray = None, bases: dict = None) -> np.ndarray:
+        """
+        Calcula el puntaje de similitud sin normalizar de cada coche del catálogo.
+
+        Cada coche se puntúa de forma independiente con las estadísticas del catálogo, así
+        que el catálogo puede ser un fragmento de otro mayor (ver CatalogStream).
+
+        :param user_input: Diccionario con las preferencias del usuario.
+        :param catalog: Catálogo de coches con sus columnas codificadas.
+        :param feature_weights: Diccionario con los pesos, ya normalizados.
+        :param rows: Posiciones de los coches candidatos. Si se indica, solo se puntúan esos
+                     coches.
+        :param bases: Vectores base ya calculados para user_input y rows (ver term_bases).
+                      Los que falten se calculan y se añaden al diccionario.
+        :return: Array con el puntaje de similitud sin normalizar.
+        """
+        bases = {} if bases is None else bases
+
+        # Inicializar el array que almacena el puntaje de similitud. Cada término se
+        # calcula en un mismo array auxiliar para no reservar memoria en cada uno
+        similarity_score = np.zeros(len(catalog) if rows is None else len(rows))
+        term = np.empty_like(similarity_score)
+
+        for kind, feature, user_value, weight in ContentFilter.score_terms(
+                user_input, feature_weights, catalog.data.columns):
+            base = ContentFilter.term_base(kind, feature, user_value, catalog, rows, bases)
+            # Ajustar el puntaje de similitud según el peso de la característica. En las
+            # máscaras de coincidencia, máscara * peso vale exactamente el peso o 0
+            similarity_score += np.multiply(base, weight, out=term)
+            if kind == 'category':
+                # Asignar un puntaje según si hay coincidencia exacta o no,
+                # con penalización según el peso
+                similarity_score += np.multiply(~base, weight * 0.5 if weight < 5 else 0,
+                                                out=term)
+
+        return similarity_score
+
+    @staticmethod
+    def term_base(kind: str, feature: str, user_value, catalog: CarCatalog,
+                  rows: np.ndarray = None, bases: dict = None) -> np.ndarray:
+        """
+        Devuelve el vector base de un término del puntaje (ver score_terms), que no depende
+        de su peso: la similitud sin ponderar de una característica numérica o la máscara
+        de coincidencia exacta de una característica con el valor del usuario.
+
+        :param kind: Tipo del término ('numeric', 'category' o 'bonus').
+        :param feature: Nombre de la característica.
+        :param user_value: Valor deseado por el usuario.
+        :param catalog: Catálogo de coches con sus columnas codificadas.
+        :param rows: Posiciones de los coches candidatos, o None para todos.
+        :param bases: Diccionario de vectores base ya calculados, en el que se guarda el
+                      vector si no estaba.
+        :return: El vector base del término.
+        """
+        key = ('numeric' if kind == 'numeric' else 'match', feature, user_value)
+        if bases is not None and key in bases:
+            return bases[key]
+        if kind == 'numeric':
+            values = catalog.values(feature)
+            base = ContentFilter.numeric_similarity(
+                feature, user_value, values if rows is None else values[rows], catalog.stats
+            )
+        else:
+            encoding = catalog.encoding(feature)
+            codes = encoding.codes if rows is None else encoding.codes[rows]
+            base = codes == encoding.code_of(user_value)
+        if bases is not None:
+            bases[key] = base
+        return base
+
+    @staticmethod
+    def term_bases(user_input: dict, catalog: CarCatalog, rows: np.ndarray = None) -> dict:
+        """
+        Calcula los vectores base de todos los términos que puede tener el puntaje de una
+        consulta con cualquier combinación de pesos, para volver a puntuarla con pesos
+        distintos sin recalcularlos (ver raw_score).
+
+        :param user_input: Diccionario con las preferencias del usuario.
+        :param catalog: Catálogo de coches con sus columnas codificadas.
+        :param rows: Posiciones de los coches candidatos, o None para todos.
+        :return: Diccionario con los vectores base.
+        """
+        bases = {}
+        features = [feature for feature in user_input if feature in catalog.data.columns]
+        for kind, feature, user_value, _ in ContentFilter.score_terms(
+                user_input, dict.fromkeys(features, 1), catalog.data.columns):
+            ContentFilter.term_base(kind, feature, user_value, catalog, rows, bases)
+        return bases
+
+    @staticmethod
+    def normalize_weights(feature_weights: dict) -> dict:
+        """
+        Normaliza los pesos de las características para que sumen 1.
+
+        :param feature_weights: Diccionario con los pesos asignados a cada característica.
+        :return: Nuevo diccionario con los pesos normalizados (o los mismos si no suman
+                 más que 0).
+        """
         total_weight = sum(feature_weights.values())
         if total_weight > 0:
-            for feature in feature_weights:
-                feature_weights[feature] /= total_weight
+            return {feature: weight / total_weight for feature, weight in feature_weights.items()}
+        return dict(feature_weights)
+
+    @staticmethod
+    def score_terms(user_input: dict, feature_weights: dict, columns) -> list:
+        """
+        Enumera, en el orden en que se suman, los términos que componen el puntaje de
+        similitud de una consulta.
+
+        Cada término es una tupla (tipo, característica, valor del usuario, peso), donde el
+        tipo es 'numeric' o 'category' para la similitud de cada característica y 'bonus'
+        para el bonus por coincidencia exacta (cuyo peso ya es el importe del bonus).
+
+        :param user_input: Diccionario con las preferencias del usuario.
+        :param feature_weights: Diccionario con los pesos, ya normalizados.
+        :param columns: Columnas disponibles en el catálogo.
+        :return: Lista de términos del puntaje.
+        """
+        terms = []
 
         # Calcular la similitud para cada característica
         for feature, weight in feature_weights.items():
             if feature in user_input and user_input[feature] is not None:
-                user_value = user_input[feature]
-
-                # Características numéricas
-                if feature in ['price', 'year', 'kms', 'power', 'distance']:
-                    max_val = car_data[feature].max()
-                    min_val = car_data[feature].min()
-
-                    if feature == 'price':
-                        # Penalizar precios alejados del valor deseado
-                        normalized_diff = np.where(
-                            car_data[feature] > user_value,
-                            1 - ((car_data[feature] - user_value) / (max_val - user_value + 1e-6)),
-                            1 - ((user_value - car_data[feature]) / (user_value - min_val + 1e-6))
-                        )
-                    elif feature == 'distance':
-                        # Invertir la similitud para la distancia (menor es mejor)
-                        normalized_diff = 1 - (car_data[feature] / max_val)
-                    else:
-                        # Calcular similitud normalizada para otras características numéricas
-                        normalized_diff = 1 - abs(car_data[feature] - user_value) / (
-                            max_val - min_val + 1e-6)
-
-                    # Ajustar el puntaje de similitud según el peso de la característica
-                    car_data['similarity_score'] += normalized_diff * weight
-
-                # Características categóricas
-                elif feature in ['fuel', 'shift', 'color', 'make', 'model', 'doors']:
-                    # Asignar un puntaje según si hay coincidencia exacta o no
-                    def category_score(value, user_value=user_value, weight=weight):
-                        if str(value).lower() == str(user_value).lower():
-                            return weight  # Coincidencia exacta
-                        return weight * 0.5 if weight < 5 else 0  # Penalización según peso
-
-                    car_data['similarity_score'] += car_data[feature].apply(category_score)
+                if feature in ContentFilter.NUMERIC_FEATURES:
+                    terms.append(('numeric', feature, user_input[feature], weight))
+                elif feature in ContentFilter.CATEGORICAL_FEATURES:
+                    terms.append(('category', feature, user_input[feature], weight))
 
         # Bonus adicional por coincidencias exactas en ciertas características
-        for feature in user_input:
-            if feature in car_data.columns and user_input[feature] is not None:
-                def apply_exact_match_bonus(value,
-                                            user_value=user_input[feature],
-                                            bonus=0.2 * feature_weights.get(feature, 0)):
-                    return bonus if str(value).lower() == str(user_value).lower() else 0
+        for feature, user_value in user_input.items():
+            if feature in columns and user_value is not None:
+                terms.append(('bonus', feature, user_value, 0.2 * feature_weights.get(feature, 0)))
+        return terms
 
-                car_data['similarity_score'] += car_data[feature].apply(apply_exact_match_bonus)
+    @staticmethod
+    def numeric_similarity(feature: str, user_value, values: np.ndarray,
+                           stats: CatalogStats) -> np.ndarray:
+        """
+        Calcula la similitud (sin ponderar) de una característica numérica.
 
-        # Normalizar el puntaje final entre 0 y 1 para que sea comparable
-        max_score = car_data['similarity_score'].max()
+        Los límites de la columna se leen de las estadísticas del catálogo, por lo que
+        values puede ser tanto la columna completa como un fragmento de ella.
+
+        :param feature: Nombre de la característica.
+        :param user_value: Valor deseado por el usuario.
+        :param values: Valores de la columna.
+        :param stats: Estadísticas del catálogo.
+        :return: Array con la similitud de cada valor.
+        """
+        max_val = stats.maximums[feature]
+        min_val = stats.minimums[feature]
+
+        if feature == 'price':
+            # Penalizar precios alejados del valor deseado
+            return np.where(
+                values > user_value,
+                1 - ((values - user_value) / (max_val - user_value + 1e-6)),
+                1 - ((user_value - values) / (user_value - min_val + 1e-6))
+            )
+        if feature == 'distance':
+            # Invertir la similitud para la distancia (menor es mejor)
+            return 1 - (values / max_val)
+        # Calcular similitud normalizada para otras características numéricas
+        return 1 - np.abs(values - user_value) / stats.spans[feature]
+
+    @staticmethod
+    def normalize_score(similarity_score: np.ndarray, max_score=None) -> np.ndarray:
+        """
+        Normaliza el puntaje final entre 0 y 1 para que sea comparable. El máximo depende
+        de la consulta, así que es la única reducción sobre el puntaje ya calculado.
+
+        :param similarity_score: Puntaje sin normalizar; se modifica en el sitio.
+        :param max_score: Máximo con el que se normaliza. Si es None, se usa el máximo de
+                          similarity_score; al puntuar por fragmentos es el de todo el catálogo.
+        :return: El puntaje normalizado.
+        """
+        if max_score is None:
+            max_score = np.fmax.reduce(similarity_score, initial=-np.inf)
         if max_score > 0:
-            car_data['similarity_score'] /= max_score
+            similarity_score /= max_score
+        return similarity_score
 
-        # Ordenar los coches según el puntaje de similitud de mayor a menor
-        return car_data.sort_values(by='similarity_score', ascending=False)
+    @staticmethod
+    def score_many(queries: list, catalog: CarCatalog, chunk_size: int = 2048) -> np.ndarray:
+        """
+        Calcula el puntaje de similitud de varias consultas a la vez, como una matriz
+        consultas x coches.
+
+        Cada término del puntaje es un vector base (la similitud numérica de un valor o la
+        máscara de coincidencia de un código) multiplicado por un coeficiente, así que la
+        matriz se obtiene como el producto de la matriz (dispersa) de coeficientes por la de
+        vectores base. Los vectores base se calculan una sola vez para todas las consultas
+        que los comparten y por fragmentos de chunk_size coches, para que quepan en caché.
+        El resultado coincide con el de score salvo diferencias de redondeo.
+
+        :param queries: Lista de pares (user_input, feature_weights). Los pesos no se
+                        modifican.
+        :param catalog: Catálogo de coches con sus columnas codificadas.
+        :param chunk_size: Número de coches de cada fragmento.
+        :return: Matriz con el puntaje normalizado de cada consulta (filas) y coche (columnas).
+        """
+        bases = {}
+        coefficients = []
+        constants = np.zeros(len(queries))
+        for query, (user_input, feature_weights) in enumerate(queries):
+            query_coefficients = {}
+            for kind, feature, user_value, weight in ContentFilter.score_terms(
+                    user_input, ContentFilter.normalize_weights(feature_weights),
+                    catalog.data.columns):
+                if kind == 'numeric':
+                    key = ('numeric', feature, type(user_value).__name__, user_value)
+                    coefficient = weight
+                else:
+                    # where(máscara, a, b) == b + (a - b) * máscara
+                    key = ('match', feature, catalog.encoding(feature).code_of(user_value))
+                    coefficient = weight
+                    if kind == 'category':
+                        penalty = weight * 0.5 if weight < 5 else 0
+                        constants[query] += penalty
+                        coefficient = weight - penalty
+                bases.setdefault(key, len(bases))
+                query_coefficients[bases[key]] = query_coefficients.get(bases[key], 0) + coefficient
+            coefficients.append(query_coefficients)
+
+        # La matriz de coeficientes es dispersa: cada consulta solo usa unos pocos vectores
+        # base, así que se guarda por filas como (índices, coeficientes)
+        coefficient_rows = [
+            (np.fromiter(query_coefficients, dtype=np.intp, count=len(query_coefficients)),
+             np.fromiter(query_coefficients.values(), dtype=float,
+                         count=len(query_coefficients)))
+            for query_coefficients in coefficients
+        ]
+
+        similarity_scores = np.empty((len(queries), len(catalog)))
+        for start in range(0, len(catalog), chunk_size):
+            stop = min(start + chunk_size, len(catalog))
+            base_matrix = np.empty((len(bases), stop - start))
+            for key, base in bases.items():
+                if key[0] == 'numeric':
+                    base_matrix[base] = ContentFilter.numeric_similarity(
+                        key[1], key[3], catalog.values(key[1])[start:stop], catalog.stats
+                    )
+                else:
+                    base_matrix[base] = catalog.encoding(key[1]).codes[start:stop] == key[2]
+            for query, (indices, weights) in enumerate(coefficient_rows):
+                similarity_scores[query, start:stop] = weights @ base_matrix[indices]
+        similarity_scores += constants[:, None]
+
+        for row in similarity_scores:
+            ContentFilter.normalize_score(row)
+        return similarity_scores
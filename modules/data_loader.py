@@ -3,6 +3,8 @@ Este módulo contiene la clase DataLoader que se encarga de cargar datos desde a
 """
 
 import pandas as pd
+from .catalog import CarCatalog
+from .snapshot import ColumnarSnapshot, file_sha256
 
 class DataLoader:
     """
@@ -12,23 +14,89 @@ class DataLoader:
     Atributos:
         coches_path (str): Ruta al archivo CSV que contiene los datos de los coches.
         ratings_path (str): Ruta al archivo CSV que contiene las valoraciones de los usuarios.
+        use_snapshots (bool): Indica si se usan instantáneas binarias de los CSV.
+        cars_snapshot (ColumnarSnapshot): Instantánea binaria del CSV de coches.
+        ratings_snapshot (ColumnarSnapshot): Instantánea binaria del CSV de valoraciones.
     """
-    def __init__(self, coches_path: str, ratings_path: str):
+    def __init__(self, coches_path: str, ratings_path: str, use_snapshots: bool = True):
         self.coches_path = coches_path
         self.ratings_path = ratings_path
+        self.use_snapshots = use_snapshots
+        self.cars_snapshot = ColumnarSnapshot(coches_path)
+        self.ratings_snapshot = ColumnarSnapshot(ratings_path)
 
     def load_data(self) -> tuple:
         """
         Carga los datos de coches y valoraciones desde los archivos CSV especificados.
 
+        La primera carga guarda junto a cada CSV una instantánea binaria y columnar; las
+        siguientes la mapean en memoria en lugar de interpretar el texto, y se reconstruye
+        sola cuando el CSV cambia. Los DataFrames tienen los mismos tipos que devuelve
+        pd.read_csv, también cuando se leen de la instantánea.
+
         Returns:
             tuple: Un par de DataFrames que contienen los datos de los coches y las valoraciones.
         """
+        df_cars, df_ratings = self._read_frames()
+        return self._as_objects(df_cars), self._as_objects(df_ratings)
+
+    def _read_frames(self) -> tuple:
+        """
+        Lee los datos de coches y valoraciones, de las instantáneas si se usan. En ese caso
+        las columnas de texto se devuelven como categorías, que es la forma en que las
+        guarda la instantánea.
+
+        Returns:
+            tuple: Un par de DataFrames con los datos de los coches y las valoraciones.
+        """
         try:
-            df_cars = pd.read_csv(self.coches_path)
-            df_ratings = pd.read_csv(self.ratings_path)
+            if self.use_snapshots:
+                df_cars = self.cars_snapshot.load(CarCatalog.ENCODED_COLUMNS)
+                df_ratings = self.ratings_snapshot.load()
+            else:
+                df_cars = pd.read_csv(self.coches_path)
+                df_ratings = pd.read_csv(self.ratings_path)
             print("Datos cargados exitosamente.")
             return df_cars, df_ratings
         except Exception as exception:
             print(f"Error al cargar los datos: {exception}")
             raise
+
+    @staticmethod
+    def _as_objects(df: pd.DataFrame) -> pd.DataFrame:
+        """
+        Convierte las columnas categóricas de un DataFrame en columnas de objetos.
+
+        Args:
+            df (pd.DataFrame): DataFrame leído de una instantánea.
+
+        Returns:
+            pd.DataFrame: El DataFrame con las columnas de texto como objetos.
+        """
+        categorical = [column for column in df.columns
+                       if isinstance(df[column].dtype, pd.CategoricalDtype)]
+        if not categorical:
+            return df
+        return df.astype({column: object for column in categorical})
+
+    def load_catalog(self) -> CarCatalog:
+        """
+        Carga los datos de coches y construye el catálogo con sus columnas ya codificadas
+        y sus índices, listo para ser utilizado por el recomendador. La versión del
+        catálogo es el hash del CSV de coches, de modo que no cambia entre ejecuciones
+        mientras no cambien los datos. Si se usan las instantáneas, las columnas de texto
+        del catálogo se mantienen como categorías, sin convertirlas en objetos.
+
+        Returns:
+            CarCatalog: El catálogo de coches.
+        """
+        df_cars, _ = self._read_frames()
+        version = (self.cars_snapshot.source_hash or file_sha256(self.coches_path))[:16]
+        if self.use_snapshots:
+            # Las codificaciones y estadísticas se leen de la instantánea sin recalcularlas
+            catalog = CarCatalog(df_cars, encodings=self.cars_snapshot.encodings,
+                                 stats=self.cars_snapshot.stats, version=version)
+        else:
+            catalog = CarCatalog(df_cars, version=version)
+        catalog.build_indexes()
+        return catalog
@@ -0,0 +1,147 @@
+"""
+Este módulo contiene la clase DistanceStore, que guarda el caché de distancias en una base
+de datos SQLite para que las nuevas distancias se añadan por lotes sin reescribir el caché
+completo y para que varios procesos puedan compartirlo.
+"""
+
+import os
+import sqlite3
+import threading
+import pandas as pd
+
+
+class DistanceStore:
+    """
+    DistanceStore persiste el caché de distancias en SQLite.
+
+    La base de datos se inicializa a partir del CSV del caché (origin, destination,
+    distance_km) y se vuelve a sincronizar con él cuando el CSV cambia. Las escrituras se
+    hacen por lotes dentro de una transacción, de modo que un proceso que termina a mitad
+    de una escritura no deja el caché corrupto, y el modo WAL permite que varios procesos
+    lean mientras otro escribe.
+
+    Atributos:
+        seed_file (str): Ruta al archivo CSV con el caché inicial de distancias.
+        path (str): Ruta a la base de datos SQLite.
+        last_row (int): Última fila leída de la base de datos, para leer solo las nuevas.
+    """
+    TIMEOUT = 30  # Segundos de espera cuando otro proceso está escribiendo
+
+    def __init__(self, seed_file: str, path: str = None):
+        """
+        Inicializa una instancia de la clase DistanceStore y abre la base de datos.
+
+        Args:
+            seed_file (str): Ruta al archivo CSV con el caché inicial de distancias.
+            path (str): Ruta a la base de datos. Por defecto es la ruta del CSV con la
+                        extensión '.sqlite'.
+        """
+        self.seed_file = seed_file
+        self.path = path or f"{os.path.splitext(seed_file)[0]}.sqlite"
+        self.last_row = 0
+        self._lock = threading.Lock()
+        self._connection = self._connect()
+        self._seed()
+
+    def _connect(self) -> sqlite3.Connection:
+        """
+        Abre la base de datos y crea sus tablas. Si no se puede abrir el archivo (por
+        ejemplo, en un directorio de solo lectura), el caché se mantiene solo en memoria.
+
+        Returns:
+            sqlite3.Connection: La conexión a la base de datos.
+        """
+        try:
+            connection = sqlite3.connect(self.path, timeout=self.TIMEOUT,
+                                         check_same_thread=False)
+            connection.execute('PRAGMA journal_mode=WAL')
+        except sqlite3.Error as exception:
+            print(f"No se pudo abrir el caché de distancias {self.path}: {exception}")
+            connection = sqlite3.connect(':memory:', check_same_thread=False)
+        connection.execute('PRAGMA synchronous=NORMAL')
+        with connection:
+            connection.execute(
+                'CREATE TABLE IF NOT EXISTS distances ('
+                'origin TEXT NOT NULL, destination TEXT NOT NULL, distance_km REAL, '
+                'PRIMARY KEY (origin, destination))'
+            )
+            connection.execute(
+                'CREATE TABLE IF NOT EXISTS metadata (key TEXT PRIMARY KEY, value TEXT)'
+            )
+        return connection
+
+    def _seed(self) -> None:
+        """
+        Importa el CSV del caché si la base de datos no lo ha importado todavía o si el
+        CSV ha cambiado desde la última importación. Las distancias ya guardadas en la base
+        de datos tienen preferencia sobre las del CSV.
+        """
+        if not os.path.exists(self.seed_file):
+            return
+        stat = os.stat(self.seed_file)
+        signature = f"{stat.st_size}:{stat.st_mtime_ns}"
+        with self._lock:
+            row = self._connection.execute(
+                "SELECT value FROM metadata WHERE key = 'seed_signature'"
+            ).fetchone()
+            if row is not None and row[0] == signature:
+                return
+            try:
+                seed = pd.read_csv(self.seed_file)
+            except (pd.errors.EmptyDataError, pd.errors.ParserError) as exception:
+                print(f"Error al cargar el caché: {exception}.")  # Manejo de errores
+                return
+            entries = zip(seed['origin'].str.lower(), seed['destination'].str.lower(),
+                          seed['distance_km'].astype(float))
+            with self._connection:
+                self._connection.executemany(
+                    'INSERT OR IGNORE INTO distances VALUES (?, ?, ?)', entries
+                )
+                self._connection.execute(
+                    "INSERT OR REPLACE INTO metadata VALUES ('seed_signature', ?)", (signature,)
+                )
+
+    def load(self) -> dict:
+        """
+        Lee las distancias añadidas a la base de datos desde la última lectura, incluidas
+        las que hayan guardado otros procesos. La primera llamada lee el caché completo.
+
+        Returns:
+            dict: Distancia de cada par (origen, destino), en minúsculas.
+        """
+        with self._lock:
+            rows = self._connection.execute(
+                'SELECT rowid, origin, destination, distance_km FROM distances '
+                'WHERE rowid > ? ORDER BY rowid', (self.last_row,)
+            ).fetchall()
+        if not rows:
+            return {}
+        self.last_row = rows[-1][0]
+        return {(origin, destination): distance for _, origin, destination, distance in rows}
+
+    def add_many(self, entries: dict) -> None:
+        """
+        Guarda un lote de distancias en una única transacción.
+
+        Args:
+            entries (dict): Distancia de cada par (origen, destino), en minúsculas.
+        """
+        if not entries:
+            return
+        rows = [(origin, destination, round(float(distance), 2))
+                for (origin, destination), distance in entries.items()]
+        with self._lock:
+            try:
+                with self._connection:
+                    self._connection.executemany(
+                        'INSERT OR REPLACE INTO distances VALUES (?, ?, ?)', rows
+                    )
+            except sqlite3.Error as exception:
+                print(f"No se pudo guardar el caché de distancias: {exception}")
+
+    def close(self) -> None:
+        """
+        Cierra la conexión con la base de datos.
+        """
+        with self._lock:
+            self._connection.close()
@@ -3,76 +3,226 @@ Este módulo proporciona utilidades para calcular distancia entre ciudades.
 """
 
 import os
-import geopy
+import threading
+import unicodedata
+import numpy as np
 import pandas as pd
-from geopy.distance import geodesic
-from geopy.geocoders import Nominatim
+from . import metrics
+from .catalog import CategoryEncoding
+from .distance_store import DistanceStore
+from .geocoding import GeocodingPool, NominatimGeocoder
+
+EARTH_RADIUS_KM = 6371.0088  # Radio medio de la Tierra
+
+
+def normalize_place(name):
+    """
+    Normaliza el nombre de una ubicación para buscarlo en el nomenclátor: minúsculas,
+    sin tildes y con los guiones sustituidos por espacios.
+
+    Args:
+        name (str): Nombre de la ubicación.
+
+    Returns:
+        str: El nombre normalizado.
+    """
+    decomposed = unicodedata.normalize('NFKD', str(name).lower())
+    stripped = ''.join(char for char in decomposed if not unicodedata.combining(char))
+    return ' '.join(stripped.replace('-', ' ').split())
+
+
+def haversine(latitude_1, longitude_1, latitude_2, longitude_2):
+    """
+    Calcula la distancia de círculo máximo entre dos conjuntos de coordenadas.
+    Acepta escalares o arrays de NumPy, que se combinan elemento a elemento.
+
+    Args:
+        latitude_1 (np.ndarray): Latitud de los orígenes, en grados.
+        longitude_1 (np.ndarray): Longitud de los orígenes, en grados.
+        latitude_2 (np.ndarray): Latitud de los destinos, en grados.
+        longitude_2 (np.ndarray): Longitud de los destinos, en grados.
+
+    Returns:
+        np.ndarray: Distancias en kilómetros.
+    """
+    latitude_1, longitude_1, latitude_2, longitude_2 = map(
+        np.radians, (latitude_1, longitude_1, latitude_2, longitude_2)
+    )
+    a = (np.sin((latitude_2 - latitude_1) / 2) ** 2 +
+         np.cos(latitude_1) * np.cos(latitude_2) * np.sin((longitude_2 - longitude_1) / 2) ** 2)
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(a))
+
 
 class GeoUtils:
     """
     GeoUtils es una clase que proporciona utilidades para cálculos geográficos,
     como la distancia entre ubicaciones.
 
+    Las distancias se obtienen, por orden, del caché de distancias, de las coordenadas del
+    nomenclátor incluido en el proyecto (comunidades, provincias y municipios principales)
+    y, solo si la ubicación no aparece en ninguno de ellos, del geocodificador.
+
     Atributos:
-        geolocator (Nominatim): Objeto geolocator de geopy para obtener coordenadas de ubicaciones.
-        cache_file (str): Ruta al archivo CSV que contiene el caché de distancias.
+        geolocator: Geocodificador con un método geocode(nombre) que devuelve un objeto con
+                    latitude y longitude (por defecto Nominatim), o None para no usar la red.
+        geocoding (GeocodingPool): Hilos que geocodifican en paralelo las ubicaciones
+                                   desconocidas, o None si no se usa la red.
+        cache_file (str): Ruta al archivo CSV que contiene el caché inicial de distancias.
+        store (DistanceStore): Base de datos en la que se guarda el caché de distancias.
+        gazetteer_file (str): Ruta al archivo CSV con las coordenadas de las ubicaciones.
         distance_cache (dict): Diccionario que almacena las distancias calculadas entre ubicaciones.
+        coordinates (dict): Latitud y longitud de cada ubicación conocida, por nombre normalizado.
         cache_miss_message_shown (bool): Indica si se ha mostrado el mensaje de caché no encontrado
+        place_index (dict): Código entero de cada ubicación presente en el caché.
+        distance_matrix (np.ndarray): Matriz densa de distancias entre las ubicaciones del caché,
+                                      con NaN en los pares desconocidos.
     """
-    def __init__(self, user_agent="geo_calc", cache_file='data/distance_cache.csv'):
+    MAX_DISTANCE = 200  # Distancia máxima para penalización
+    def __init__(self, user_agent="geo_calc", cache_file='data/distance_cache.csv',
+                 gazetteer_file='data/gazetteer.csv', geolocator=None, offline=False,
+                 store_file=None, geocoder_workers=4, geocoder_rate=1.0):
         """
         Inicializa una instancia de la clase GeoUtils.
 
         Args:
             user_agent (str): Nombre del agente de usuario para geopy.
             cache_file (str): Ruta al archivo CSV que contiene el caché de distancias.
+            gazetteer_file (str): Ruta al archivo CSV con las coordenadas de las ubicaciones
+                                  (columnas name, latitude, longitude y kind).
+            geolocator: Geocodificador que se usa cuando una ubicación no está en el
+                        nomenclátor. Si es None, se usa Nominatim (ver NominatimGeocoder).
+            offline (bool): Si es True, no se usa ningún geocodificador y las ubicaciones
+                            desconocidas reciben la penalización máxima.
+            store_file (str): Ruta a la base de datos del caché. Por defecto es la ruta de
+                              cache_file con la extensión '.sqlite'.
+            geocoder_workers (int): Número máximo de peticiones simultáneas al geocodificador.
+            geocoder_rate (float): Peticiones por segundo permitidas por el proveedor
+                                   (la política de uso de Nominatim permite una).
         """
-        self.geolocator = Nominatim(user_agent=user_agent)  # Inicializa el geolocator
+        # Inicializa el geolocator
+        self.geolocator = None if offline else (geolocator or NominatimGeocoder(user_agent))
+        self.geocoding = (GeocodingPool(self.geolocator, geocoder_workers, geocoder_rate)
+                          if self.geolocator is not None else None)
         self.cache_file = cache_file  # Archivo de caché
+        self.store = DistanceStore(cache_file, store_file)  # Base de datos del caché
+        self.gazetteer_file = gazetteer_file  # Nomenclátor de coordenadas
         self.distance_cache = {}  # Diccionario de caché de distancias
+        self.coordinates = {}  # Coordenadas del nomenclátor y de las ubicaciones geocodificadas
         self.cache_miss_message_shown = False  # Indicador de mensaje de caché no encontrado
+        self.place_index = {}  # Código de cada ubicación en la matriz de distancias
+        self.distance_matrix = None  # Matriz de distancias, se construye bajo demanda
+        self._location_distances = {}  # Distancias memorizadas por ubicación del usuario
+        self._geocoded = set()  # Ubicaciones cuyas coordenadas vienen del geocodificador
+        self._lock = threading.RLock()  # Protege el caché cuando varias consultas lo comparten
         self._load_cache()  # Carga el caché
+        self._load_gazetteer()  # Carga el nomenclátor
 
     def _load_cache(self):
         """
-        Carga el caché de distancias desde el archivo CSV especificado en el atributo cache_file.
-
-        El archivo CSV debe tener las siguientes columnas:
+        Carga el caché de distancias desde la base de datos con una única lectura.
+        La base de datos se inicializa con el CSV especificado en el atributo cache_file,
+        que debe tener las siguientes columnas:
         - origin: Ubicación de origen.
         - destination: Ubicación de destino.
         - distance_km: Distancia en kilómetros entre origen y destino.
         """
-        if os.path.exists(self.cache_file):  # Verifica si el archivo de caché existe
-            try:
-                cache_df = pd.read_csv(self.cache_file)  # Lee el archivo CSV
-                self.distance_cache = {
-                    (row['origin'].lower(), row['destination'].lower()): row['distance_km']
-                    for _, row in cache_df.iterrows()
-                }  # Llena el diccionario de caché
-            except (pd.errors.EmptyDataError, pd.errors.ParserError,
-                    FileNotFoundError) as exception:
-                print(f"Error al cargar el caché: {exception}.")  # Manejo de errores
+        self.distance_cache = self.store.load()
 
-    def _save_cache(self):
+    def _refresh_cache(self):
         """
-        Guarda el caché de distancias en el archivo CSV especificado en el atributo cache_file.
+        Añade al caché las distancias que otros procesos hayan guardado en la base de datos
+        desde la última lectura.
 
-        El archivo CSV tendrá las siguientes columnas:
-        - origin: Ubicación de origen.
-        - destination: Ubicación de destino.
-        - distance_km: Distancia en kilómetros entre origen y destino.
+        Returns:
+            bool: True si el caché ha cambiado.
+        """
+        changed = {
+            pair: distance for pair, distance in self.store.load().items()
+            if self.distance_cache.get(pair) != distance
+        }
+        if changed:
+            self.distance_cache.update(changed)
+            self._invalidate_matrix()
+        return bool(changed)
+
+    def _load_gazetteer(self):
+        """
+        Carga las coordenadas del nomenclátor desde el archivo CSV especificado en el
+        atributo gazetteer_file. Si el archivo no existe, solo se usan el caché y el
+        geocodificador.
+        """
+        if not os.path.exists(self.gazetteer_file):
+            return
+        try:
+            gazetteer = pd.read_csv(self.gazetteer_file)
+        except (pd.errors.EmptyDataError, pd.errors.ParserError) as exception:
+            print(f"Error al cargar el nomenclátor: {exception}.")
+            return
+        for name, latitude, longitude in zip(gazetteer['name'], gazetteer['latitude'],
+                                             gazetteer['longitude']):
+            self.coordinates.setdefault(normalize_place(name), (latitude, longitude))
+
+    def locate(self, place):
         """
-        cache_data = [
-            {"origin": origin, "destination": destination, "distance_km": round(distance, 2)}
-            for (origin, destination), distance in self.distance_cache.items()
-        ]  # Prepara los datos para guardar
-        cache_df = pd.DataFrame(cache_data)  # Crea un DataFrame
-        cache_df.to_csv(self.cache_file, index=False)  # Guarda el DataFrame en un archivo CSV
+        Obtiene las coordenadas de una ubicación: primero del nomenclátor y, si no aparece,
+        del geocodificador. El resultado del geocodificador se memoriza.
+
+        Args:
+            place (str): Nombre de la ubicación.
+
+        Returns:
+            tuple: Latitud y longitud de la ubicación, o None si no se puede localizar.
+        """
+        self.locate_many([place])
+        return self.coordinates.get(normalize_place(place))
+
+    def locate_many(self, places):
+        """
+        Obtiene las coordenadas de varias ubicaciones. Las que no están en el nomenclátor ni
+        se han geocodificado antes se geocodifican en paralelo, una vez cada una, y sus
+        coordenadas se memorizan.
+
+        Args:
+            places (list): Nombres de las ubicaciones.
+        """
+        pending = {}
+        for place in places:
+            key = normalize_place(place)
+            if key not in self.coordinates:
+                pending.setdefault(key, place)
+        if not pending or self.geocoding is None:
+            return
+        if not self.cache_miss_message_shown:
+            print("Distancia no encontrada en caché. Esto puede tardar unos segundos...")
+            self.cache_miss_message_shown = True
+        located = self.geocoding.locate_many(list(pending.values()))
+        with self._lock:
+            for key, place in pending.items():
+                if place in located:
+                    self.coordinates[key] = located[place]
+                    self._geocoded.add(key)
+
+    def _save_cache(self, entries):
+        """
+        Añade nuevas distancias al caché y las guarda en la base de datos en una única
+        transacción, sin reescribir el resto del caché.
+
+        Args:
+            entries (dict): Distancia de cada par (origen, destino), en minúsculas.
+        """
+        entries = {pair: round(distance, 2) for pair, distance in entries.items()}
+        self.distance_cache.update(entries)
+        self._invalidate_matrix()  # La matriz se reconstruirá con las nuevas distancias
+        self.store.add_many(entries)
 
     def calculate_distance(self, origin, destination):
         """
         Calcula la distancia en kilómetros entre dos ubicaciones geográficas.
 
+        Si el par no está en el caché, la distancia se calcula con las coordenadas del
+        nomenclátor o del geocodificador (ver locate). Solo las distancias que han
+        requerido el geocodificador se añaden al caché.
+
         Args:
             origin (str): Ubicación de origen.
             destination (str): Ubicación de destino.
@@ -87,29 +237,258 @@ class GeoUtils:
         # Verifica si la distancia ya está en caché
         if ((origin, destination) in self.distance_cache or
             (destination, origin) in self.distance_cache):
+            metrics.count('geo_cache_hits')
             return (self.distance_cache.get((origin, destination)) or
                     self.distance_cache.get((destination, origin)))
-        if not self.cache_miss_message_shown:
-            print("Distancia no encontrada en caché. Esto puede tardar unos segundos...")
-            self.cache_miss_message_shown = True
-        try:
-            # Obtiene las coordenadas de las ubicaciones
-            coords_origin = self.geolocator.geocode(origin)
-            coords_dest = self.geolocator.geocode(destination)
-            if coords_origin and coords_dest:
-                # Calcula la distancia geodésica
-                distance = geodesic(
-                    (coords_origin.latitude, coords_origin.longitude),
-                    (coords_dest.latitude, coords_dest.longitude)
-                ).kilometers
-                self.distance_cache[(origin, origin)] = 0.0
-                self.distance_cache[(origin, destination)] = distance
-                self._save_cache()  # Guarda el caché actualizado
-                return round(distance, 2)  # Retorna la distancia redondeada
-        except (AttributeError, ValueError, geopy.exc.GeocoderServiceError) as exception:
-            print(f"Error al calcular la distancia: {exception}")  # Manejo de errores
-
-        return None
+        metrics.count('geo_cache_misses')
+
+        # Obtiene las coordenadas del nomenclátor o, si no aparecen, del geocodificador
+        self.locate_many([origin, destination])
+        coords_origin = self.coordinates.get(normalize_place(origin))
+        coords_dest = self.coordinates.get(normalize_place(destination))
+        if coords_origin is None or coords_dest is None:
+            return None
+        distance = float(haversine(*coords_origin, *coords_dest))
+        if self._needed_network(origin, destination):
+            # Las distancias que han requerido la red se guardan en el caché
+            self._save_cache({(origin, origin): 0.0, (origin, destination): distance})
+        return round(distance, 2)  # Retorna la distancia redondeada
+
+    def _needed_network(self, origin, destination):
+        """
+        Indica si las coordenadas de alguna de las dos ubicaciones vienen del geocodificador.
+
+        Args:
+            origin (str): Ubicación de origen.
+            destination (str): Ubicación de destino.
+
+        Returns:
+            bool: True si alguna de las ubicaciones se ha geocodificado.
+        """
+        return (normalize_place(origin) in self._geocoded or
+                normalize_place(destination) in self._geocoded)
+
+    def _invalidate_matrix(self):
+        """
+        Descarta la matriz de distancias y las distancias memorizadas por ubicación,
+        de forma que se reconstruyan a partir del caché actualizado.
+        """
+        self.distance_matrix = None
+        self._location_distances = {}
+
+    def _build_matrix(self):
+        """
+        Construye la matriz densa de distancias a partir del diccionario del caché.
+
+        Cada celda (i, j) contiene la distancia que devolvería calculate_distance para el
+        par (i, j) sin consultar el geocodificador: primero el par directo y, si no existe
+        o vale 0, el par inverso.
+        """
+        places = sorted({place for pair in self.distance_cache for place in pair})
+        self.place_index = {place: code for code, place in enumerate(places)}
+        matrix = np.full((len(places), len(places)), np.nan)
+        if self.distance_cache:
+            pairs = np.array([
+                (self.place_index[origin], self.place_index[destination])
+                for origin, destination in self.distance_cache
+            ])
+            matrix[pairs[:, 0], pairs[:, 1]] = list(self.distance_cache.values())
+        self.distance_matrix = np.where(np.isnan(matrix) | (matrix == 0), matrix.T, matrix)
+
+    def distances_to(self, user_location, places):
+        """
+        Calcula la distancia entre la ubicación del usuario y cada una de las ubicaciones dadas.
+
+        El resultado se memoriza por ubicación del usuario, de modo que las siguientes
+        consultas desde la misma ubicación se resuelven sin acceder al caché.
+
+        Args:
+            user_location (str): Ubicación del usuario.
+            places (list): Ubicaciones de destino, en minúsculas.
+
+        Returns:
+            np.ndarray: Distancia en kilómetros a cada ubicación, NaN si no se puede calcular.
+        """
+        key = (user_location.lower(), tuple(places))
+        with self._lock:
+            if key in self._location_distances:
+                metrics.count('geo_location_hits')
+                return self._location_distances[key]
+            pending = self._pending_places(user_location, places)
+
+        # Las ubicaciones desconocidas se geocodifican fuera del bloqueo, de modo que las
+        # consultas simultáneas no esperan a las peticiones de las demás
+        self.locate_many(pending)
+
+        with self._lock:
+            if key not in self._location_distances:
+                metrics.count('geo_location_misses')
+                self._location_distances[key] = self._compute_distances(user_location, places)
+            return self._location_distances[key]
+
+    def _pending_places(self, user_location, places):
+        """
+        Obtiene las ubicaciones que hay que geocodificar para calcular las distancias que
+        no están en el caché.
+
+        Args:
+            user_location (str): Ubicación del usuario.
+            places (list): Ubicaciones de destino, en minúsculas.
+
+        Returns:
+            list: Ubicaciones sin coordenadas conocidas.
+        """
+        distances = self._cached_distances(user_location, places)
+        missing = np.flatnonzero(np.isnan(distances))
+        if len(missing) and self._refresh_cache():
+            # Otro proceso ha añadido distancias al caché desde la última lectura
+            missing = np.flatnonzero(np.isnan(self._cached_distances(user_location, places)))
+        if not len(missing):
+            return []
+        names = [user_location] + [places[position] for position in missing]
+        return [name for name in names if normalize_place(name) not in self.coordinates]
+
+    def _compute_distances(self, user_location, places):
+        """
+        Calcula las distancias de distances_to a partir de la matriz de distancias. Los
+        pares que no están en el caché se calculan todos a la vez con la fórmula del
+        semiverseno a partir de las coordenadas conocidas de cada ubicación (ver
+        locate_many), sin consultar el geocodificador.
+
+        Args:
+            user_location (str): Ubicación del usuario.
+            places (list): Ubicaciones de destino, en minúsculas.
+
+        Returns:
+            np.ndarray: Distancia en kilómetros a cada ubicación, NaN si no se puede calcular.
+        """
+        distances = self._cached_distances(user_location, places)
+        missing = np.flatnonzero(np.isnan(distances))
+        if len(missing) and self._refresh_cache():
+            # Otro proceso ha añadido distancias al caché desde la última lectura
+            distances = self._cached_distances(user_location, places)
+            missing = np.flatnonzero(np.isnan(distances))
+        metrics.count('geo_cache_hits', len(places) - len(missing))
+
+        # Los pares que no están en el caché se calculan una sola vez por ubicación
+        metrics.count('geo_cache_misses', len(missing))
+        origin_coordinates = (self.coordinates.get(normalize_place(user_location))
+                              if len(missing) else None)
+        if origin_coordinates is not None:
+            coordinates = np.array([
+                self.coordinates.get(normalize_place(places[position])) or (np.nan, np.nan)
+                for position in missing
+            ], dtype=float).reshape(-1, 2)
+            distances[missing] = haversine(*origin_coordinates,
+                                           coordinates[:, 0], coordinates[:, 1])
+            metrics.count('geo_gazetteer_hits',
+                          int(np.count_nonzero(~np.isnan(distances[missing]))))
+            self._store_geocoded(user_location, [places[position] for position in missing],
+                                 distances[missing])
+        return np.round(distances, 2)
+
+    def _cached_distances(self, user_location, places):
+        """
+        Obtiene de la matriz de distancias las distancias que están en el caché.
+
+        Args:
+            user_location (str): Ubicación del usuario.
+            places (list): Ubicaciones de destino, en minúsculas.
+
+        Returns:
+            np.ndarray: Distancia en kilómetros a cada ubicación, NaN si no está en el caché.
+        """
+        if self.distance_matrix is None:
+            self._build_matrix()
+        origin = self.place_index.get(user_location.lower())
+        distances = np.full(len(places), np.nan)
+        if origin is not None:
+            codes = np.array([self.place_index.get(place, -1) for place in places], dtype=int)
+            known = codes >= 0
+            distances[known] = self.distance_matrix[origin, codes[known]]
+        return distances
+
+    def _store_geocoded(self, origin, destinations, distances):
+        """
+        Añade al caché las distancias que han requerido el geocodificador y las guarda
+        en un único lote.
+
+        Args:
+            origin (str): Ubicación de origen.
+            destinations (list): Ubicaciones de destino.
+            distances (np.ndarray): Distancia a cada destino, NaN si no se ha podido calcular.
+        """
+        origin = origin.lower()
+        entries = {
+            (origin, destination.lower()): float(distance)
+            for destination, distance in zip(destinations, distances)
+            if not np.isnan(distance) and self._needed_network(origin, destination)
+        }
+        if entries:
+            entries[(origin, origin)] = 0.0
+            self._save_cache(entries)  # Guarda el caché actualizado
+
+    def penalty_scores(self, user_location, distance_weight, provinces, rows=None):
+        """
+        Calcula la distancia y la penalización geográfica de cada coche a partir de los
+        códigos de provincia del catálogo.
+
+        Args:
+            user_location (str): Ubicación del usuario.
+            distance_weight (float): Peso de la penalización por distancia.
+            provinces (CategoryEncoding): Codificación de la columna 'province' del catálogo.
+            rows (np.ndarray): Posiciones de los coches candidatos, o None para todos.
+
+        Returns:
+            tuple: Arrays con la distancia y la penalización ('geo_score') de cada coche.
+        """
+        distance, penalty = self.distance_penalty(user_location, provinces, rows)
+        return distance, -distance_weight * penalty  # Aplica la penalización según el peso
+
+    def distance_penalty(self, user_location, provinces, rows=None):
+        """
+        Calcula la distancia de cada coche y su penalización sin ponderar, que es la
+        fracción de la distancia máxima (como mucho 1) a la que se encuentra.
+
+        Args:
+            user_location (str): Ubicación del usuario.
+            provinces (CategoryEncoding): Codificación de la columna 'province' del catálogo.
+            rows (np.ndarray): Posiciones de los coches candidatos, o None para todos.
+
+        Returns:
+            tuple: Arrays con la distancia y la penalización sin ponderar de cada coche.
+        """
+        max_distance = self.MAX_DISTANCE
+        province_distances = self.distances_to(user_location, provinces.categories)
+        province_distances = np.where(
+            np.isnan(province_distances), max_distance, province_distances
+        )
+        codes = provinces.codes if rows is None else provinces.codes[rows]
+        distance = province_distances[codes]  # Distancia de cada coche
+        penalty = np.where(distance < max_distance, distance / max_distance, 1.0)
+        return distance, penalty
+
+    def places_within(self, user_location, places, minimum=None, maximum=None):
+        """
+        Selecciona las ubicaciones cuya distancia a la del usuario está entre dos límites.
+        Las ubicaciones cuya distancia no se puede calcular no se seleccionan.
+
+        Args:
+            user_location (str): Ubicación del usuario.
+            places (list): Ubicaciones candidatas, en minúsculas.
+            minimum (float): Distancia mínima en kilómetros, o None si no hay.
+            maximum (float): Distancia máxima en kilómetros, o None si no hay.
+
+        Returns:
+            list: Las ubicaciones seleccionadas.
+        """
+        distances = self.distances_to(user_location, places)
+        selected = ~np.isnan(distances)
+        if minimum is not None:
+            selected &= distances >= minimum
+        if maximum is not None:
+            selected &= distances <= maximum
+        return [place for place, keep in zip(places, selected) if keep]
 
     def apply_penalty(self, car_data, user_location, distance_weight):
         """
@@ -125,15 +504,7 @@ class GeoUtils:
             pd.DataFrame: DataFrame con los datos de los coches y una columna adicional 'geo_score'
                         que indica la penalización por distancia.
         """
-        max_distance = 200  # Distancia máxima para penalización
-        car_data['distance'] = round(car_data['province'].apply(
-            lambda x: self.calculate_distance(user_location, x)
-            if self.calculate_distance(user_location, x) is not None
-            else max_distance
-        ), 2)  # Calcula la distancia para cada auto
-        car_data['geo_score'] = car_data['distance'].apply(
-            lambda x: (-distance_weight * (x / max_distance)
-                       if x < max_distance
-                       else -distance_weight)
-        )  # Aplica la penalización basada en la distancia
+        car_data['distance'], car_data['geo_score'] = self.penalty_scores(
+            user_location, distance_weight, CategoryEncoding.from_series(car_data['province'])
+        )
         return car_data  # Retorna el DataFrame modificado
@@ -0,0 +1,212 @@
+"""
+Este módulo contiene GeocodingPool, que geocodifica varias ubicaciones en paralelo
+respetando el límite de peticiones del proveedor y sin repetir las peticiones en curso, y
+NominatimGeocoder, el geocodificador por defecto.
+
+geopy solo se importa cuando hace falta geocodificar una ubicación en la red, ya que
+importarlo retrasa el arranque de las aplicaciones.
+"""
+
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from . import metrics
+
+
+class TokenBucket:
+    """
+    TokenBucket limita el ritmo de peticiones: cada petición consume un testigo y los
+    testigos se reponen a un ritmo constante hasta una capacidad máxima.
+
+    Atributos:
+        rate (float): Testigos que se reponen por segundo (peticiones por segundo).
+        capacity (float): Número máximo de testigos acumulados (ráfaga máxima).
+    """
+    def __init__(self, rate: float, capacity: float = 1):
+        """
+        Inicializa una instancia de la clase TokenBucket.
+
+        Args:
+            rate (float): Peticiones permitidas por segundo.
+            capacity (float): Ráfaga máxima de peticiones seguidas.
+        """
+        self.rate = rate
+        self.capacity = capacity
+        self._tokens = capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self) -> None:
+        """
+        Espera hasta que haya un testigo disponible y lo consume.
+        """
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self.capacity,
+                                   self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                wait = (1 - self._tokens) / self.rate
+            time.sleep(wait)
+
+
+class NominatimGeocoder:
+    """
+    NominatimGeocoder geocodifica ubicaciones con Nominatim. El geocodificador de geopy se
+    crea la primera vez que se geocodifica una ubicación.
+
+    Atributos:
+        user_agent (str): Nombre del agente de usuario para geopy.
+    """
+    def __init__(self, user_agent: str = 'geo_calc'):
+        """
+        Inicializa una instancia de la clase NominatimGeocoder.
+
+        Args:
+            user_agent (str): Nombre del agente de usuario para geopy.
+        """
+        self.user_agent = user_agent
+        self._geolocator = None
+        self._lock = threading.Lock()
+
+    def geocode(self, query, **kwargs):
+        """
+        Geocodifica una ubicación.
+
+        Args:
+            query (str): Nombre de la ubicación.
+            **kwargs: Opciones de Nominatim.geocode.
+
+        Returns:
+            geopy.location.Location: La ubicación encontrada, o None.
+        """
+        with self._lock:
+            if self._geolocator is None:
+                from geopy.geocoders import Nominatim  # pylint: disable=import-outside-toplevel
+                self._geolocator = Nominatim(user_agent=self.user_agent)
+        return self._geolocator.geocode(query, **kwargs)
+
+
+def _service_error():
+    """
+    Devuelve la excepción de geopy de los errores del servicio de geocodificación. Solo se
+    llama cuando falla una petición, así que geopy no se importa si no se usa.
+
+    Returns:
+        type: geopy.exc.GeocoderServiceError.
+    """
+    from geopy.exc import GeocoderServiceError  # pylint: disable=import-outside-toplevel
+    return GeocoderServiceError
+
+
+class GeocodingPool:
+    """
+    GeocodingPool geocodifica ubicaciones con un número limitado de hilos.
+
+    Todas las peticiones pasan por un TokenBucket, de modo que se respeta la política de
+    uso del proveedor (Nominatim permite una petición por segundo), y las peticiones de la
+    misma ubicación que ya están en curso se comparten entre todas las consultas que la
+    necesitan.
+
+    Atributos:
+        geolocator: Geocodificador con un método geocode(nombre) que devuelve un objeto con
+                    latitude y longitude, o None si no encuentra la ubicación.
+        rate_limiter (TokenBucket): Limitador del ritmo de peticiones.
+    """
+    def __init__(self, geolocator, max_workers: int = 4, rate: float = 1.0,
+                 burst: float = 1):
+        """
+        Inicializa una instancia de la clase GeocodingPool.
+
+        Args:
+            geolocator: Geocodificador que se usa para cada petición.
+            max_workers (int): Número máximo de peticiones simultáneas.
+            rate (float): Peticiones permitidas por segundo.
+            burst (float): Ráfaga máxima de peticiones seguidas.
+        """
+        self.geolocator = geolocator
+        self.rate_limiter = TokenBucket(rate, burst)
+        self._executor = ThreadPoolExecutor(max_workers=max_workers,
+                                            thread_name_prefix='geocoder')
+        self._in_flight = {}  # Petición en curso de cada ubicación
+        self._lock = threading.Lock()
+
+    def locate_many(self, places) -> dict:
+        """
+        Geocodifica varias ubicaciones en paralelo. Cada ubicación distinta se pide una sola
+        vez, aunque aparezca varias veces o la esté pidiendo otra consulta a la vez.
+
+        Args:
+            places (iterable): Nombres de las ubicaciones.
+
+        Returns:
+            dict: Latitud y longitud de cada ubicación, o None si el geocodificador no la
+            encuentra. Las ubicaciones cuya petición ha fallado no aparecen en el resultado.
+        """
+        futures = {}
+        for place in places:
+            if place not in futures:
+                futures[place] = self._submit(place)
+
+        results = {}
+        for place, future in futures.items():
+            try:
+                results[place] = future.result()
+            except (AttributeError, ValueError, _service_error()) as exception:
+                print(f"Error al calcular la distancia: {exception}")  # Manejo de errores
+        return results
+
+    def _submit(self, place):
+        """
+        Devuelve la petición en curso de una ubicación o crea una nueva.
+
+        Args:
+            place (str): Nombre de la ubicación.
+
+        Returns:
+            concurrent.futures.Future: La petición de la ubicación.
+        """
+        key = str(place).strip().lower()
+        with self._lock:
+            future = self._in_flight.get(key)
+            if future is not None:
+                metrics.count('geocoder_shared')
+                return future
+            metrics.count('geocoder_calls')
+            future = self._executor.submit(self._geocode, place)
+            self._in_flight[key] = future
+        future.add_done_callback(lambda _: self._finish(key))
+        return future
+
+    def _finish(self, key):
+        """
+        Descarta la petición terminada de una ubicación.
+
+        Args:
+            key (str): Clave de la ubicación.
+        """
+        with self._lock:
+            self._in_flight.pop(key, None)
+
+    def _geocode(self, place):
+        """
+        Geocodifica una ubicación respetando el límite de peticiones.
+
+        Args:
+            place (str): Nombre de la ubicación.
+
+        Returns:
+            tuple: Latitud y longitud de la ubicación, o None si no se encuentra.
+        """
+        self.rate_limiter.acquire()
+        location = self.geolocator.geocode(place)
+        return (location.latitude, location.longitude) if location else None
+
+    def shutdown(self) -> None:
+        """
+        Espera a que terminen las peticiones en curso y libera los hilos.
+        """
+        self._executor.shutdown(wait=True)
@@ -3,9 +3,15 @@ Este módulo implementa un sistema de recomendación híbrido que combina filtra
 filtrado basado en contenido y penalización geográfica.
 """
 
+import numpy as np
+import pandas as pd
+from . import metrics
+from .catalog import CarCatalog
 from .collaborative_filter import CollaborativeFilter
 from .content_filter import ContentFilter
 from .geo_utils import GeoUtils
+from .result_cache import ResultCache
+from .ranking import merge_top_k, top_k_indices
 
 class HybridRecommender:
     """
@@ -15,58 +21,629 @@ class HybridRecommender:
     Atributos:
         collaborative_model (CollaborativeFilter): El modelo de filtrado colaborativo utilizado.
         geo_calculator (GeoUtils): La instancia de GeoUtils utilizada para cálculos geográficos
+        result_cache (ResultCache): Caché de las recomendaciones ya calculadas, o None.
     """
-    def __init__(self, collaborative_model: CollaborativeFilter, geo_calculator: GeoUtils):
+    def __init__(self, collaborative_model: CollaborativeFilter, geo_calculator: GeoUtils,
+                 result_cache: ResultCache = None):
         """
         Inicializa una instancia de la clase HybridRecommender.
 
         Args:
             collaborative_model (CollaborativeFilter): El modelo de filtrado colaborativo.
             geo_calculator (GeoUtils): La instancia de GeoUtils para cálculos geográficos.
+            result_cache (ResultCache): Caché de las recomendaciones. Si es None, cada
+                                        consulta se calcula de nuevo.
         """
         self.collaborative_model = collaborative_model
         self.geo_calculator = geo_calculator
+        self.result_cache = result_cache
 
-    def recommend(self, user_id, user_input, feature_weights, user_location, cars_df):
+    # Memoria máxima aproximada de la matriz de puntuaciones de cada bloque de consultas
+    BATCH_MEMORY = 64 * 1024 * 1024
+    # Ventaja en la puntuación híbrida de los coches de los modelos preferidos del usuario
+    TOP_MODELS_BOOST = 0.1
+
+    def recommend(self, user_id, user_input, feature_weights, user_location, cars_df,
+                  top_k=None, constraints=None, top_models=None):
         """
         Recomienda coches al usuario basándose en sus preferencias,
         ubicación y valoraciones previas.
 
+        Si el recomendador tiene un caché y cars_df es un CarCatalog, las recomendaciones
+        se buscan primero en el caché, con la versión del catálogo y la del modelo
+        colaborativo como parte de la clave.
+
         Args:
             user_id (int): Identificador del usuario para el que se generan las recomendaciones.
             user_input (dict): Diccionario con las características y valores
             proporcionados por el usuario.
             feature_weights (dict): Diccionario con los pesos asignados a cada característica.
             user_location (str): Ubicación del usuario en formato de texto.
-            cars_df (pd.DataFrame): DataFrame que contiene los datos de los coches.
+            cars_df (CarCatalog | pd.DataFrame): Catálogo o DataFrame con los datos de los coches.
+            top_k (int): Número de coches a devolver. Si es None, se devuelven todos.
+            constraints (dict): Restricciones obligatorias que deben cumplir los coches, por
+                                ejemplo {'price': {'max': 20000}, 'fuel': ['Electrico'],
+                                'distance': {'max': 150}} (ver CarCatalog.candidates). Solo
+                                los coches que las cumplen se puntúan, y la similitud de
+                                contenido se normaliza entre ellos.
+            top_models (dict): Usa los modelos con mayor calificación estimada para el
+                               usuario (ver CollaborativeFilter.top_models), por ejemplo
+                               {'n': 50, 'mode': 'boost'}. Con 'mode' 'restrict' (por
+                               defecto) solo se puntúan los coches de esos modelos, como
+                               una restricción más; con 'boost' se suma TOP_MODELS_BOOST a
+                               su puntuación híbrida. 'approximate' usa la búsqueda
+                               aproximada del índice.
 
         Returns:
             pd.DataFrame: DataFrame con los datos de los coches recomendados y
-            sus puntuaciones de similitud.
+            sus puntuaciones de similitud, ordenado por la puntuación híbrida.
+
+        Raises:
+            ValueError: Si alguna restricción o la opción top_models no se puede aplicar.
         """
-        # Calcula la similitud de contenido entre las preferencias del usuario y los coches
-        content_scores = ContentFilter.calculate_content_similarity(
-            user_input, cars_df, feature_weights
-        )
+        arguments = (user_id, user_input, feature_weights, user_location, cars_df, top_k,
+                     constraints, top_models)
+        # Un DataFrame no tiene versión, así que sus consultas no se guardan en el caché
+        if self.result_cache is None or not isinstance(cars_df, CarCatalog):
+            return self._recommend(*arguments)
 
-        # Aplica una penalización geográfica a las puntuaciones de similitud de contenido
-        geo_scores = self.geo_calculator.apply_penalty(
-            content_scores, user_location, feature_weights.get('distance', 0)
-        )
+        key = ResultCache.key(user_id, user_input, feature_weights, user_location, top_k,
+                              catalog_version=cars_df.version,
+                              model_version=self.collaborative_model.version,
+                              constraints=constraints, top_models=top_models)
+        recommendations = self.result_cache.get(key)
+        if recommendations is not None:
+            metrics.count('result_cache_hits')
+            return recommendations
+        metrics.count('result_cache_misses')
+        recommendations = self._recommend(*arguments)
+        self.result_cache.put(key, recommendations)
+        return recommendations
 
-        # Calcula la puntuación colaborativa para cada coche
-        geo_scores['collaborative_score'] = geo_scores['model_id'].apply(
-            lambda x: self.collaborative_model.predict_rating(user_id, x)
-        )
+    def _recommend(self, user_id, user_input, feature_weights, user_location, cars_df,
+                   top_k, constraints, top_models):
+        """
+        Calcula las recomendaciones de recommend sin consultar el caché.
+        """
+        with metrics.stage('recommend', rows=len(cars_df)):
+            catalog = CarCatalog.ensure(cars_df)
+            candidates, boosted = self._select_rows(catalog, user_id, user_location,
+                                                    constraints, top_models)
+            rows = len(catalog) if candidates is None else len(candidates)
+
+            # Calcula la similitud de contenido entre las preferencias del usuario y los
+            # coches, sin ordenar: solo se ordenan las recomendaciones finales
+            with metrics.stage('content_score', rows=rows):
+                similarity_score = ContentFilter.score(user_input, catalog, feature_weights,
+                                                       candidates)
+
+            # Calcula la penalización geográfica a partir de los códigos de provincia, con
+            # el peso de la distancia normalizado como los del resto de características
+            with metrics.stage('geo_penalty', rows=rows):
+                distance, geo_score = self.geo_calculator.penalty_scores(
+                    user_location,
+                    ContentFilter.normalize_weights(feature_weights).get('distance', 0),
+                    catalog.encoding('province'), candidates
+                )
+
+            # Calcula la puntuación colaborativa de cada coche, evaluando cada modelo una
+            # sola vez
+            with metrics.stage('collaborative_predict', rows=rows):
+                model_ids = catalog.values('model_id')
+                collaborative_score = self.collaborative_model.predict_many(
+                    user_id, model_ids if candidates is None else model_ids[candidates]
+                )
+
+            return self._rank(catalog, candidates, boosted, similarity_score, distance,
+                              geo_score, collaborative_score, top_k)
+
+    def session(self, user_id, user_input, user_location, cars_df, constraints=None,
+                top_models=None):
+        """
+        Prepara una consulta para recomendar con distintos pesos (ver rerank). Se calcula
+        todo lo que no depende de los pesos: los coches candidatos, los vectores base de la
+        similitud de contenido, la distancia y la penalización geográfica sin ponderar y la
+        puntuación colaborativa de cada coche.
+
+        Args:
+            user_id (int): Identificador del usuario.
+            user_input (dict): Diccionario con las características y valores
+            proporcionados por el usuario.
+            user_location (str): Ubicación del usuario en formato de texto.
+            cars_df (CarCatalog | pd.DataFrame): Catálogo o DataFrame con los datos de los coches.
+            constraints (dict): Restricciones obligatorias (ver recommend).
+            top_models (dict): Opciones de los modelos preferidos del usuario (ver recommend).
+
+        Returns:
+            RecommendationSession: La consulta preparada.
+
+        Raises:
+            ValueError: Si alguna restricción o la opción top_models no se puede aplicar.
+        """
+        with metrics.stage('session', rows=len(cars_df)):
+            catalog = CarCatalog.ensure(cars_df)
+            candidates, boosted = self._select_rows(catalog, user_id, user_location,
+                                                    constraints, top_models)
+            rows = len(catalog) if candidates is None else len(candidates)
+
+            with metrics.stage('content_score', rows=rows):
+                bases = ContentFilter.term_bases(user_input, catalog, candidates)
+
+            with metrics.stage('geo_penalty', rows=rows):
+                distance, penalty = self.geo_calculator.distance_penalty(
+                    user_location, catalog.encoding('province'), candidates
+                )
+
+            with metrics.stage('collaborative_predict', rows=rows):
+                model_ids = catalog.values('model_id')
+                collaborative_score = self.collaborative_model.predict_many(
+                    user_id, model_ids if candidates is None else model_ids[candidates]
+                )
 
+            return RecommendationSession(self, user_id, dict(user_input), user_location,
+                                         catalog, candidates, boosted, bases, distance,
+                                         penalty, collaborative_score)
+
+    def rerank(self, session, feature_weights, top_k=None):
+        """
+        Recomienda coches para una consulta ya preparada con unos pesos nuevos. Solo se
+        combinan los vectores de la sesión y se seleccionan los top_k coches, y el
+        resultado es el mismo que el de recommend con esos pesos.
+
+        Args:
+            session (RecommendationSession): La consulta preparada (ver session).
+            feature_weights (dict): Diccionario con los pesos asignados a cada característica.
+            top_k (int): Número de coches a devolver. Si es None, se devuelven todos.
+
+        Returns:
+            pd.DataFrame: DataFrame con los datos de los coches recomendados y
+            sus puntuaciones de similitud, ordenado por la puntuación híbrida.
+        """
+        with metrics.stage('rerank', rows=len(session.collaborative_score)):
+            similarity_score = ContentFilter.score(
+                session.user_input, session.catalog, feature_weights, session.candidates,
+                session.bases
+            )
+            distance_weight = ContentFilter.normalize_weights(feature_weights).get('distance', 0)
+            geo_score = -distance_weight * session.penalty
+            return self._rank(session.catalog, session.candidates, session.boosted,
+                              similarity_score, session.distance, geo_score,
+                              session.collaborative_score, top_k)
+
+    def _select_rows(self, catalog, user_id, user_location, constraints, top_models):
+        """
+        Selecciona los coches que se puntúan según las restricciones y la opción
+        top_models (ver recommend).
+
+        Args:
+            catalog (CarCatalog): Catálogo de coches.
+            user_id: Identificador del usuario.
+            user_location (str): Ubicación del usuario.
+            constraints (dict): Restricciones obligatorias, o None.
+            top_models (dict): Opciones de los modelos preferidos del usuario, o None.
+
+        Returns:
+            tuple: Posiciones de los coches candidatos (o None si se puntúan todos) y
+            máscara de los candidatos que reciben TOP_MODELS_BOOST (o None).
+
+        Raises:
+            ValueError: Si alguna restricción o la opción top_models no se puede aplicar.
+        """
+        # Selecciona los coches que cumplen las restricciones con los índices del
+        # catálogo; el resto de etapas solo procesan esos coches
+        candidates = None
+        if constraints:
+            with metrics.stage('filter', rows=len(catalog)):
+                candidates = self._candidates(catalog, constraints, user_location)
+        boosted = None
+        if top_models:
+            with metrics.stage('top_models', rows=len(catalog)):
+                top_rows, restrict = self._top_model_rows(catalog, user_id, top_models)
+            if restrict:
+                candidates = top_rows if candidates is None else np.intersect1d(
+                    candidates, top_rows, assume_unique=True)
+            else:
+                boosted = np.isin(np.arange(len(catalog)) if candidates is None
+                                  else candidates, top_rows, assume_unique=True)
+        return candidates, boosted
+
+    def _rank(self, catalog, candidates, boosted, similarity_score, distance, geo_score,
+              collaborative_score, top_k):
+        """
+        Combina las puntuaciones de los coches candidatos en la puntuación híbrida y
+        construye el DataFrame con los top_k coches con mejor puntuación.
+
+        Args:
+            catalog (CarCatalog): Catálogo de coches.
+            candidates (np.ndarray): Posiciones de los coches candidatos, o None para todos.
+            boosted (np.ndarray): Máscara de los candidatos que reciben TOP_MODELS_BOOST, o
+                                  None.
+            similarity_score (np.ndarray): Similitud de contenido de cada candidato.
+            distance (np.ndarray): Distancia de cada candidato.
+            geo_score (np.ndarray): Penalización geográfica de cada candidato.
+            collaborative_score (np.ndarray): Puntuación colaborativa de cada candidato.
+            top_k (int): Número de coches a devolver. Si es None, se devuelven todos.
+
+        Returns:
+            pd.DataFrame: Los coches recomendados, ordenados por la puntuación híbrida.
+        """
         # Calcula la puntuación híbrida combinando las puntuaciones de similitud,
-        # colaborativas y geográficas
-        geo_scores['hybrid_score'] = (
-            geo_scores['similarity_score'] * 0.4 +
-            geo_scores['collaborative_score'] * 0.3 +
-            geo_scores['geo_score'] * 0.3
+        # colaborativas y geográficas, y selecciona los top_k coches con mejor
+        # puntuación en orden descendente
+        with metrics.stage('rank', rows=len(similarity_score)):
+            hybrid_score = similarity_score * 0.4
+            term = np.empty_like(hybrid_score)
+            hybrid_score += np.multiply(collaborative_score, 0.3, out=term)
+            hybrid_score += np.multiply(geo_score, 0.3, out=term)
+            if boosted is not None:
+                hybrid_score[boosted] += self.TOP_MODELS_BOOST
+            best = top_k_indices(hybrid_score, top_k)
+
+        # Devuelve el DataFrame con los coches seleccionados y sus puntuaciones
+        with metrics.stage('build_results', rows=len(best)):
+            return self._build_results(
+                catalog, best if candidates is None else candidates[best], {
+                    'similarity_score': similarity_score[best],
+                    'distance': distance[best],
+                    'geo_score': geo_score[best],
+                    'collaborative_score': collaborative_score[best],
+                    'hybrid_score': hybrid_score[best]
+                }
+            )
+
+    def _candidates(self, catalog, constraints, user_location):
+        """
+        Obtiene los coches que cumplen las restricciones de una consulta. La restricción
+        'distance' se traduce en la lista de provincias que están a esa distancia del
+        usuario; el resto se resuelven directamente con los índices del catálogo.
+
+        Args:
+            catalog (CarCatalog): Catálogo de coches.
+            constraints (dict): Restricciones de la consulta.
+            user_location (str): Ubicación del usuario.
+
+        Returns:
+            np.ndarray: Posiciones de los coches que cumplen las restricciones.
+
+        Raises:
+            ValueError: Si alguna restricción no se puede aplicar.
+        """
+        constraints = dict(constraints)
+        distance = constraints.pop('distance', None)
+        candidates = catalog.candidates(constraints)
+        if distance is not None:
+            if not isinstance(distance, dict):
+                raise ValueError("La restricción 'distance' debe indicar 'min' y/o 'max'.")
+            provinces = catalog.encoding('province')
+            nearby = provinces.rows_for(self.geo_calculator.places_within(
+                user_location, provinces.categories, distance.get('min'), distance.get('max')
+            ))
+            candidates = np.intersect1d(candidates, nearby, assume_unique=True)
+        return candidates
+
+    def _top_model_rows(self, catalog, user_id, top_models):
+        """
+        Obtiene los coches de los modelos con mayor calificación estimada para el usuario.
+
+        Args:
+            catalog (CarCatalog): Catálogo de coches.
+            user_id: Identificador del usuario.
+            top_models (dict): Opciones 'n', 'mode' y 'approximate' (ver recommend).
+
+        Returns:
+            tuple: Posiciones de los coches de esos modelos e indicador de si se restringe
+            la recomendación a ellos (True) o solo se les da ventaja (False).
+
+        Raises:
+            ValueError: Si las opciones no son válidas.
+        """
+        if not isinstance(top_models, dict) or not isinstance(top_models.get('n'), int) \
+                or top_models['n'] <= 0:
+            raise ValueError("La opción 'top_models' debe indicar un número 'n' positivo.")
+        mode = top_models.get('mode', 'restrict')
+        if mode not in ('restrict', 'boost'):
+            raise ValueError(f"Modo de 'top_models' desconocido: {mode}")
+        model_ids, _ = self.collaborative_model.top_models(
+            user_id, top_models['n'], top_models.get('approximate', False)
         )
+        rows = np.flatnonzero(np.isin(catalog.values('model_id'), model_ids))
+        return rows, mode == 'restrict'
 
-        # Ordena los coches por la puntuación híbrida en orden descendente
-        # y devuelve el DataFrame resultante
-        return geo_scores.sort_values('hybrid_score', ascending=False)
+    def recommend_many(self, queries, cars_df, top_k=10, chunk_size=2048):
+        """
+        Recomienda coches para varias consultas a la vez, compartiendo el trabajo común:
+        las codificaciones del catálogo, los vectores base de cada característica, las
+        distancias de cada ubicación y las puntuaciones colaborativas de cada usuario.
+
+        Las consultas se puntúan por bloques como una matriz consultas x coches (ver
+        ContentFilter.score_many). Los resultados coinciden con los de recommend salvo
+        diferencias de redondeo, y los pesos de las consultas no se modifican.
+
+        Args:
+            queries (list): Lista de tuplas (user_id, user_input, feature_weights, user_location).
+            cars_df (CarCatalog | pd.DataFrame): Catálogo o DataFrame con los datos de los coches.
+            top_k (int): Número de coches a devolver por consulta. Si es None, se devuelven todos.
+            chunk_size (int): Número de coches de cada fragmento de la matriz.
+
+        Returns:
+            list: Un DataFrame de recomendaciones por consulta, en el mismo orden.
+        """
+        with metrics.stage('recommend_many', rows=len(cars_df) * len(queries)):
+            catalog = CarCatalog.ensure(cars_df)
+            provinces = catalog.encoding('province')
+            model_ids = catalog.values('model_id')
+            location_penalties = {}
+            collaborative_scores = {}
+            block_size = max(1, self.BATCH_MEMORY // (8 * max(len(catalog), 1)))
+
+            results = []
+            for block_start in range(0, len(queries), block_size):
+                block = queries[block_start:block_start + block_size]
+                with metrics.stage('content_score_many', rows=len(catalog) * len(block)):
+                    similarity_scores = ContentFilter.score_many(
+                        [(user_input, feature_weights)
+                         for _, user_input, feature_weights, _ in block],
+                        catalog, chunk_size
+                    )
+                for similarity_score, (user_id, _, feature_weights, user_location) in zip(
+                        similarity_scores, block):
+                    location = user_location.lower()
+                    if location not in location_penalties:
+                        with metrics.stage('geo_penalty', rows=len(catalog)):
+                            location_penalties[location] = self.geo_calculator.distance_penalty(
+                                user_location, provinces
+                            )
+                    if user_id not in collaborative_scores:
+                        with metrics.stage('collaborative_predict', rows=len(catalog)):
+                            collaborative_scores[user_id] = (
+                                self.collaborative_model.predict_many(user_id, model_ids)
+                            )
+
+                    distance, penalty = location_penalties[location]
+                    distance_weight = ContentFilter.normalize_weights(
+                        feature_weights).get('distance', 0)
+                    geo_score = -distance_weight * penalty
+                    collaborative_score = collaborative_scores[user_id]
+                    hybrid_score = (
+                        similarity_score * 0.4 +
+                        collaborative_score * 0.3 +
+                        geo_score * 0.3
+                    )
+
+                    with metrics.stage('rank', rows=len(catalog)):
+                        best = top_k_indices(hybrid_score, top_k)
+                    with metrics.stage('build_results', rows=len(best)):
+                        results.append(self._build_results(catalog, best, {
+                            'similarity_score': similarity_score[best],
+                            'distance': distance[best],
+                            'geo_score': geo_score[best],
+                            'collaborative_score': collaborative_score[best],
+                            'hybrid_score': hybrid_score[best]
+                        }))
+            return results
+
+    def recommend_stream(self, user_id, user_input, feature_weights, user_location, stream,
+                         top_k=10):
+        """
+        Recomienda coches recorriendo el catálogo por fragmentos (ver CatalogStream), con
+        una memoria máxima que depende del tamaño de los fragmentos y de top_k, pero no del
+        tamaño del catálogo.
+
+        La similitud de contenido se normaliza con su máximo en todo el catálogo, que
+        depende de la consulta, así que el catálogo se recorre dos veces: la primera pasada
+        solo calcula ese máximo y la segunda calcula la puntuación híbrida de cada fragmento
+        y conserva los top_k mejores coches vistos hasta el momento. El resultado es el
+        mismo que el de recommend sobre el catálogo completo, incluido el orden de los
+        empates, y los pesos de la consulta no se modifican.
+
+        Args:
+            user_id (str): Identificador del usuario.
+            user_input (dict): Características y valores proporcionados por el usuario.
+            feature_weights (dict): Pesos asignados a cada característica.
+            user_location (str): Ubicación del usuario.
+            stream (CatalogStream): Catálogo de coches por fragmentos.
+            top_k (int): Número de coches a devolver.
+
+        Returns:
+            pd.DataFrame: DataFrame con los datos de los coches recomendados y sus
+            puntuaciones, ordenado por la puntuación híbrida e indexado por la posición de
+            cada coche en el catálogo.
+
+        Raises:
+            ValueError: Si top_k no es un número positivo.
+        """
+        if top_k is None or top_k <= 0:
+            raise ValueError("El modo por fragmentos necesita un top_k positivo.")
+
+        with metrics.stage('recommend_stream'):
+            weights = ContentFilter.normalize_weights(feature_weights)
+
+            # Primera pasada: máximo de la similitud de contenido sin normalizar
+            max_score = -np.inf
+            with metrics.stage('content_max'):
+                for chunk in stream.chunks():
+                    metrics.count('chunks')
+                    max_score = np.fmax(max_score, np.fmax.reduce(
+                        ContentFilter.raw_score(user_input, chunk, weights), initial=-np.inf
+                    ))
+
+            # Segunda pasada: puntuación híbrida de cada fragmento y selección de los
+            # top_k del fragmento, que se combinan con los mejores vistos hasta ahora
+            best = None
+            for chunk in stream.chunks():
+                with metrics.stage('score_chunk', rows=len(chunk)):
+                    similarity_score = ContentFilter.normalize_score(
+                        ContentFilter.raw_score(user_input, chunk, weights), max_score
+                    )
+                    distance, geo_score = self.geo_calculator.penalty_scores(
+                        user_location, weights.get('distance', 0), chunk.encoding('province')
+                    )
+                    collaborative_score = self.collaborative_model.predict_many(
+                        user_id, chunk.values('model_id')
+                    )
+                    hybrid_score = (
+                        similarity_score * 0.4 +
+                        collaborative_score * 0.3 +
+                        geo_score * 0.3
+                    )
+                    rows = top_k_indices(hybrid_score, top_k)
+                    chunk_best = self._build_results(chunk, rows, {
+                        'similarity_score': similarity_score[rows],
+                        'distance': distance[rows],
+                        'geo_score': geo_score[rows],
+                        'collaborative_score': collaborative_score[rows],
+                        'hybrid_score': hybrid_score[rows]
+                    })
+                    best = chunk_best if best is None else pd.concat([best, chunk_best])
+                    best = best.iloc[merge_top_k(best['hybrid_score'].to_numpy(),
+                                                 best.index.to_numpy(), top_k)]
+            return best
+
+    def recommend_sharded(self, user_id, user_input, feature_weights, user_location, shards,
+                          top_k=10):
+        """
+        Recomienda coches puntuando en paralelo los fragmentos de un catálogo en memoria
+        compartida (ver ShardedCatalog).
+
+        La penalización geográfica de cada provincia y la puntuación colaborativa de cada
+        modelo se calculan aquí una sola vez; los procesos calculan la similitud de
+        contenido y la puntuación híbrida de su fragmento y devuelven solo sus top_k
+        mejores coches, que se combinan en el resultado. Como en recommend_stream, la
+        similitud se normaliza con su máximo en todo el catálogo, que se obtiene en una
+        primera ronda. El resultado es el mismo que el de recommend, incluido el orden de
+        los empates, y los pesos de la consulta no se modifican.
+
+        Args:
+            user_id (str): Identificador del usuario.
+            user_input (dict): Características y valores proporcionados por el usuario.
+            feature_weights (dict): Pesos asignados a cada característica.
+            user_location (str): Ubicación del usuario.
+            shards (ShardedCatalog): Catálogo de coches repartido en fragmentos.
+            top_k (int): Número de coches a devolver. Si es None, se devuelven todos.
+
+        Returns:
+            pd.DataFrame: DataFrame con los datos de los coches recomendados y sus
+            puntuaciones, ordenado por la puntuación híbrida.
+        """
+        with metrics.stage('recommend_sharded', rows=len(shards)):
+            weights = ContentFilter.normalize_weights(feature_weights)
+            metrics.count('shards', len(shards.shards()))
+
+            with metrics.stage('content_max', rows=len(shards)):
+                max_score = shards.content_max(user_input, weights)
+
+            with metrics.stage('geo_penalty', rows=len(shards.provinces.categories)):
+                province_scores = self.geo_calculator.penalty_scores(
+                    user_location, weights.get('distance', 0), shards.provinces
+                )
+
+            with metrics.stage('collaborative_predict', rows=len(shards.model_ids)):
+                model_scores = self.collaborative_model.predict_many(user_id, shards.model_ids)
+
+            with metrics.stage('score_shards', rows=len(shards)):
+                rows, scores = shards.top_k(user_input, weights, max_score, province_scores,
+                                            model_scores, top_k)
+
+            with metrics.stage('build_results', rows=len(rows)):
+                return self._build_results(shards.catalog, rows, scores)
+
+    @staticmethod
+    def _build_results(catalog, rows, scores):
+        """
+        Construye el DataFrame de recomendaciones con las filas seleccionadas del catálogo
+        y sus puntuaciones.
+
+        Args:
+            catalog (CarCatalog): Catálogo de coches.
+            rows (np.ndarray): Posiciones de los coches recomendados en el catálogo, en orden.
+            scores (dict): Puntuaciones de los coches recomendados, por nombre de columna.
+
+        Returns:
+            pd.DataFrame: DataFrame con los coches recomendados y sus puntuaciones.
+        """
+        # Se construye columna a columna con take, sin seleccionar, eliminar y concatenar
+        # DataFrames intermedios
+        data = catalog.data
+        columns = {column: data[column].array.take(rows)
+                   for column in data.columns if column not in scores}
+        columns.update(scores)
+        return pd.DataFrame(columns, index=data.index[rows], copy=False)
+
+
+class RecommendationSession:
+    """
+    RecommendationSession guarda los vectores de una consulta que no dependen de los pesos,
+    para volver a ordenar los coches cuando el usuario solo cambia los pesos sin recalcular
+    la similitud de cada característica, las distancias ni las puntuaciones colaborativas
+    (ver HybridRecommender.session). Los vectores corresponden al catálogo y al modelo
+    colaborativo del momento en que se creó la sesión.
+
+    Atributos:
+        recommender (HybridRecommender): El recomendador que creó la sesión.
+        user_id: Identificador del usuario.
+        user_input (dict): Características y valores proporcionados por el usuario.
+        user_location (str): Ubicación del usuario.
+        catalog (CarCatalog): Catálogo de coches.
+        candidates (np.ndarray): Posiciones de los coches candidatos, o None para todos.
+        boosted (np.ndarray): Máscara de los candidatos que reciben TOP_MODELS_BOOST, o None.
+        bases (dict): Vectores base de la similitud de contenido (ver
+                      ContentFilter.term_bases).
+        distance (np.ndarray): Distancia de cada candidato.
+        penalty (np.ndarray): Penalización geográfica sin ponderar de cada candidato.
+        collaborative_score (np.ndarray): Puntuación colaborativa de cada candidato.
+    """
+    def __init__(self, recommender, user_id, user_input, user_location, catalog, candidates,
+                 boosted, bases, distance, penalty, collaborative_score):
+        """
+        Inicializa una instancia de la clase RecommendationSession.
+
+        Args:
+            recommender (HybridRecommender): El recomendador que crea la sesión.
+            user_id: Identificador del usuario.
+            user_input (dict): Características y valores proporcionados por el usuario.
+            user_location (str): Ubicación del usuario.
+            catalog (CarCatalog): Catálogo de coches.
+            candidates (np.ndarray): Posiciones de los coches candidatos, o None.
+            boosted (np.ndarray): Máscara de los candidatos con ventaja, o None.
+            bases (dict): Vectores base de la similitud de contenido.
+            distance (np.ndarray): Distancia de cada candidato.
+            penalty (np.ndarray): Penalización geográfica sin ponderar de cada candidato.
+            collaborative_score (np.ndarray): Puntuación colaborativa de cada candidato.
+        """
+        self.recommender = recommender
+        self.user_id = user_id
+        self.user_input = user_input
+        self.user_location = user_location
+        self.catalog = catalog
+        self.candidates = candidates
+        self.boosted = boosted
+        self.bases = bases
+        self.distance = distance
+        self.penalty = penalty
+        self.collaborative_score = collaborative_score
+
+    def matches(self, user_input, user_location) -> bool:
+        """
+        Indica si la sesión corresponde a unas preferencias y una ubicación.
+
+        Args:
+            user_input (dict): Características y valores proporcionados por el usuario.
+            user_location (str): Ubicación del usuario.
+
+        Returns:
+            bool: True si se puede reutilizar la sesión para esa consulta.
+        """
+        return user_input == self.user_input and user_location == self.user_location
+
+    def recommend(self, feature_weights, top_k=None):
+        """
+        Recomienda coches con unos pesos nuevos (ver HybridRecommender.rerank).
+
+        Args:
+            feature_weights (dict): Diccionario con los pesos asignados a cada característica.
+            top_k (int): Número de coches a devolver. Si es None, se devuelven todos.
+
+        Returns:
+            pd.DataFrame: Los coches recomendados, ordenados por la puntuación híbrida.
+        """
+        return self.recommender.rerank(self, feature_weights, top_k)
@@ -0,0 +1,295 @@
+"""
+Este módulo proporciona la instrumentación por etapas del recomendador: tiempo de cada
+etapa, filas procesadas, contadores (aciertos y fallos del caché de distancias, llamadas al
+geocodificador) y, opcionalmente, memoria reservada.
+
+Las métricas se envían a un único destino intercambiable (cualquier función que reciba un
+diccionario, por ejemplo un MetricsRecorder). Cada hilo puede instalar además su propio
+destino (ver set_thread_hook), que recibe solo las etapas de ese hilo. Mientras no haya
+ningún destino instalado, stage() devuelve un contexto vacío compartido y count() no hace
+nada, de modo que el coste de la instrumentación es despreciable.
+"""
+
+import threading
+import time
+import tracemalloc
+
+_hook = None  # Destino de las métricas; None desactiva la instrumentación
+_state = threading.local()  # Pila de etapas abiertas y destino propio de cada hilo
+
+
+class _DisabledStage:
+    """
+    Contexto vacío que se usa cuando la instrumentación está desactivada.
+    """
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+
+_DISABLED_STAGE = _DisabledStage()
+
+
+class _Stage:
+    """
+    Contexto que mide una etapa y envía su registro al destino al terminar.
+
+    Atributos:
+        record (dict): Registro de la etapa: 'stage', 'path' (etapas que la contienen,
+                       separadas por '/'), 'started' (instante de inicio), 'seconds', 'rows',
+                       'bytes', 'counters' y 'depth' (nivel de anidamiento).
+    """
+    def __init__(self, hook, name, rows):
+        """
+        Inicializa una instancia de la clase _Stage.
+
+        Args:
+            hook (callable): Destino de las métricas.
+            name (str): Nombre de la etapa.
+            rows (int): Número de filas que procesa la etapa.
+        """
+        self._hook = hook
+        self.record = {'stage': name, 'path': name, 'started': 0.0, 'seconds': 0.0,
+                       'rows': rows, 'bytes': None, 'counters': {}, 'depth': 0}
+        self._start = 0.0
+        self._start_memory = 0
+        self._child_peak = 0
+
+    def __enter__(self):
+        stack = _stack()
+        self.record['depth'] = len(stack)
+        if stack:
+            self.record['path'] = f"{stack[-1].record['path']}/{self.record['stage']}"
+        if tracemalloc.is_tracing():
+            current, peak = tracemalloc.get_traced_memory()
+            # El pico se reinicia en cada etapa; la etapa padre conserva el suyo hasta aquí
+            if stack:
+                stack[-1]._child_peak = max(stack[-1]._child_peak, peak)
+            tracemalloc.reset_peak()
+            self._start_memory = current
+        stack.append(self)
+        self._start = self.record['started'] = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.record['seconds'] = time.perf_counter() - self._start
+        stack = _stack()
+        stack.pop()
+        if tracemalloc.is_tracing():
+            peak = max(tracemalloc.get_traced_memory()[1], self._child_peak)
+            self.record['bytes'] = max(0, peak - self._start_memory)
+            if stack:
+                stack[-1]._child_peak = max(stack[-1]._child_peak, peak)
+        self._hook(self.record)
+        return False
+
+
+def _stack():
+    """
+    Devuelve la pila de etapas abiertas en el hilo actual.
+
+    Returns:
+        list: Etapas abiertas, de la más externa a la más interna.
+    """
+    stack = getattr(_state, 'stack', None)
+    if stack is None:
+        stack = _state.stack = []
+    return stack
+
+
+def set_hook(hook):
+    """
+    Instala el destino de las métricas.
+
+    Args:
+        hook (callable): Función que recibe el registro (dict) de cada etapa,
+                         o None para desactivar la instrumentación.
+
+    Returns:
+        callable: El destino instalado anteriormente.
+    """
+    global _hook  # pylint: disable=global-statement
+    previous, _hook = _hook, hook
+    return previous
+
+
+def set_thread_hook(hook):
+    """
+    Instala un destino de métricas solo para el hilo actual, que sustituye en este hilo al
+    destino instalado con set_hook. Permite, por ejemplo, seguir el progreso de una
+    recomendación que se ejecuta en segundo plano sin recibir las etapas de otros hilos.
+
+    Args:
+        hook (callable): Función que recibe el registro (dict) de cada etapa del hilo,
+                         o None para volver a usar el destino común.
+
+    Returns:
+        callable: El destino del hilo instalado anteriormente.
+    """
+    previous = getattr(_state, 'hook', None)
+    _state.hook = hook
+    return previous
+
+
+def _current_hook():
+    """
+    Devuelve el destino de las métricas del hilo actual.
+
+    Returns:
+        callable: El destino del hilo, el común o None si no hay ninguno.
+    """
+    return getattr(_state, 'hook', None) or _hook
+
+
+def enabled() -> bool:
+    """
+    Indica si hay un destino de métricas instalado para el hilo actual.
+
+    Returns:
+        bool: True si la instrumentación está activa.
+    """
+    return _current_hook() is not None
+
+
+def stage(name, rows=0):
+    """
+    Mide una etapa del recomendador. Se usa como contexto:
+
+        with metrics.stage('content_score', rows=len(catalog)):
+            ...
+
+    Args:
+        name (str): Nombre de la etapa.
+        rows (int): Número de filas que procesa la etapa.
+
+    Returns:
+        Contexto que envía el registro de la etapa al destino al terminar.
+    """
+    hook = _current_hook()
+    if hook is None:
+        return _DISABLED_STAGE
+    return _Stage(hook, name, rows)
+
+
+def count(counter, amount=1):
+    """
+    Suma una cantidad a un contador de la etapa abierta más interna del hilo actual.
+    Si no hay ninguna etapa abierta, el contador se envía al destino como un registro propio.
+
+    Args:
+        counter (str): Nombre del contador, por ejemplo 'geo_cache_hits'.
+        amount (int): Cantidad a sumar.
+    """
+    hook = _current_hook()
+    if hook is None or not amount:
+        return
+    stack = _stack()
+    if stack:
+        counters = stack[-1].record['counters']
+        counters[counter] = counters.get(counter, 0) + amount
+    else:
+        hook({'stage': None, 'path': None, 'started': time.perf_counter(), 'seconds': 0.0,
+              'rows': 0, 'bytes': None, 'counters': {counter: amount}, 'depth': 0})
+
+
+class MetricsRecorder:
+    """
+    MetricsRecorder es un destino de métricas que guarda los registros en memoria y los
+    muestra como un desglose por etapas.
+
+    Se puede usar como contexto, que lo instala como destino y, si track_memory es True,
+    activa tracemalloc mientras dura:
+
+        with MetricsRecorder(track_memory=True) as recorder:
+            recommender.recommend(...)
+        print(recorder.report())
+
+    Atributos:
+        records (list): Registros recibidos, en el orden en que terminaron las etapas.
+        track_memory (bool): Indica si se mide la memoria reservada en cada etapa.
+    """
+    def __init__(self, track_memory=False):
+        """
+        Inicializa una instancia de la clase MetricsRecorder.
+
+        Args:
+            track_memory (bool): Si es True, se mide la memoria reservada en cada etapa.
+                                 tracemalloc ralentiza notablemente la ejecución.
+        """
+        self.records = []
+        self.track_memory = track_memory
+        self._lock = threading.Lock()
+        self._previous_hook = None
+        self._started_tracing = False
+
+    def __call__(self, record):
+        with self._lock:
+            self.records.append(record)
+
+    def __enter__(self):
+        if self.track_memory and not tracemalloc.is_tracing():
+            tracemalloc.start()
+            self._started_tracing = True
+        self._previous_hook = set_hook(self)
+        return self
+
+    def __exit__(self, *exc_info):
+        set_hook(self._previous_hook)
+        if self._started_tracing:
+            tracemalloc.stop()
+            self._started_tracing = False
+        return False
+
+    def clear(self):
+        """
+        Descarta los registros guardados.
+        """
+        with self._lock:
+            self.records = []
+
+    def summary(self):
+        """
+        Agrega los registros por etapa (la misma etapa dentro de etapas distintas se
+        agrega por separado).
+
+        Returns:
+            list: Un diccionario por etapa, en el orden en que se abrieron por primera vez,
+            con 'stage', 'depth', 'calls', 'seconds', 'rows', 'bytes' (el máximo) y 'counters'.
+        """
+        with self._lock:
+            records = list(self.records)
+        # Las etapas terminan de dentro hacia fuera; se muestran en orden de apertura
+        stages = {}
+        for record in sorted(records, key=lambda record: record['started']):
+            entry = stages.setdefault(record['path'], {
+                'stage': record['stage'], 'depth': record['depth'], 'calls': 0,
+                'seconds': 0.0, 'rows': 0, 'bytes': None, 'counters': {}
+            })
+            entry['calls'] += 1
+            entry['seconds'] += record['seconds']
+            entry['rows'] += record['rows']
+            if record['bytes'] is not None:
+                entry['bytes'] = max(entry['bytes'] or 0, record['bytes'])
+            for counter, value in record['counters'].items():
+                entry['counters'][counter] = entry['counters'].get(counter, 0) + value
+        return list(stages.values())
+
+    def report(self):
+        """
+        Construye el desglose por etapas en forma de tabla de texto.
+
+        Returns:
+            str: La tabla con el tiempo, las filas, la memoria y los contadores de cada etapa.
+        """
+        lines = [f"{'Etapa':<28} {'Llamadas':>8} {'Tiempo (ms)':>12} {'Filas':>10} "
+                 f"{'Memoria (MB)':>13}  Contadores"]
+        for entry in self.summary():
+            name = '  ' * entry['depth'] + (entry['stage'] or '(sin etapa)')
+            memory = '-' if entry['bytes'] is None else f"{entry['bytes'] / 2 ** 20:.2f}"
+            counters = ', '.join(f"{counter}={value}"
+                                 for counter, value in sorted(entry['counters'].items()))
+            lines.append(f"{name:<28} {entry['calls']:>8} {entry['seconds'] * 1000:>12.2f} "
+                         f"{entry['rows']:>10} {memory:>13}  {counters}")
+        return '\n'.join(lines)
@@ -0,0 +1,130 @@
+"""
+Este módulo contiene la clase ModelArtifact, que guarda los arrays de un modelo entrenado
+junto con sus metadatos en un único archivo binario que se puede mapear en memoria.
+"""
+
+import json
+import os
+import tempfile
+import numpy as np
+
+
+class ModelArtifact:
+    """
+    ModelArtifact lee y escribe el archivo de un modelo.
+
+    El archivo contiene una cabecera JSON con los metadatos del modelo (hiperparámetros,
+    firma de los datos de entrenamiento, versión) y la posición de cada array, seguida de
+    un bloque binario alineado por array. Al leerlo, los arrays se mapean en memoria en
+    modo copia en escritura: la carga no depende del tamaño del modelo y los cambios que
+    se hagan en memoria no modifican el archivo.
+
+    Atributos:
+        path (str): Ruta al archivo del modelo.
+    """
+    MAGIC = b'CARMODL1'
+    FORMAT_VERSION = 1
+    ALIGNMENT = 64
+
+    def __init__(self, path: str):
+        """
+        Inicializa una instancia de la clase ModelArtifact.
+
+        Args:
+            path (str): Ruta al archivo del modelo.
+        """
+        self.path = path
+
+    def write(self, arrays: dict, metadata: dict) -> None:
+        """
+        Escribe el modelo. El archivo se escribe primero en un temporal y se sustituye de
+        forma atómica, de modo que los lectores nunca ven un modelo a medio escribir.
+
+        Args:
+            arrays (dict): Arrays del modelo, por nombre.
+            metadata (dict): Metadatos del modelo; deben poder serializarse en JSON.
+        """
+        blocks = {}
+        offset = 0
+        for name, array in arrays.items():
+            array = np.ascontiguousarray(array)
+            blocks[name] = {'dtype': array.dtype.str, 'shape': list(array.shape),
+                            'offset': offset}
+            offset = self._align(offset + array.nbytes)
+        header = {'format_version': self.FORMAT_VERSION, 'metadata': metadata,
+                  'arrays': blocks}
+        header_bytes = json.dumps(header, ensure_ascii=False).encode('utf-8')
+        data_start = self._align(len(self.MAGIC) + 8 + len(header_bytes))
+
+        directory = os.path.dirname(os.path.abspath(self.path))
+        descriptor, temp_path = tempfile.mkstemp(dir=directory, suffix='.tmp')
+        try:
+            with os.fdopen(descriptor, 'wb') as model_file:
+                model_file.write(self.MAGIC)
+                model_file.write(len(header_bytes).to_bytes(8, 'little'))
+                model_file.write(header_bytes)
+                for name, array in arrays.items():
+                    model_file.seek(data_start + blocks[name]['offset'])
+                    model_file.write(np.ascontiguousarray(array).tobytes())
+                model_file.flush()
+                os.fsync(model_file.fileno())
+            os.replace(temp_path, self.path)
+        except BaseException:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+            raise
+
+    def read_metadata(self):
+        """
+        Lee solo los metadatos del modelo, sin mapear sus arrays.
+
+        Returns:
+            dict: Los metadatos, o None si el archivo no existe o no es un modelo válido.
+        """
+        header = self._read_header()
+        return None if header is None else header['metadata']
+
+    def read(self):
+        """
+        Lee el modelo, mapeando sus arrays en memoria.
+
+        Returns:
+            tuple: Los metadatos y los arrays del modelo por nombre, o None si el archivo
+            no existe o no es un modelo válido.
+        """
+        header = self._read_header()
+        if header is None:
+            return None
+        arrays = {}
+        for name, block in header['arrays'].items():
+            dtype = np.dtype(block['dtype'])
+            shape = tuple(block['shape'])
+            if dtype.itemsize * int(np.prod(shape)) == 0:
+                arrays[name] = np.empty(shape, dtype=dtype)
+            else:
+                arrays[name] = np.memmap(self.path, dtype=dtype, mode='c', shape=shape,
+                                         offset=header['data_start'] + block['offset'])
+        return header['metadata'], arrays
+
+    def _read_header(self):
+        """
+        Lee la cabecera del archivo.
+
+        Returns:
+            dict: La cabecera, o None si el archivo no existe o no es un modelo válido.
+        """
+        try:
+            with open(self.path, 'rb') as model_file:
+                if model_file.read(len(self.MAGIC)) != self.MAGIC:
+                    return None
+                header_size = int.from_bytes(model_file.read(8), 'little')
+                header = json.loads(model_file.read(header_size).decode('utf-8'))
+        except (OSError, ValueError):
+            return None
+        if header.get('format_version') != self.FORMAT_VERSION:
+            return None
+        header['data_start'] = self._align(len(self.MAGIC) + 8 + header_size)
+        return header
+
+    def _align(self, position: int) -> int:
+        return -(-position // self.ALIGNMENT) * self.ALIGNMENT
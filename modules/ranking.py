@@ -0,0 +1,57 @@
+"""
+Este módulo contiene utilidades para ordenar puntuaciones y seleccionar las mejores
+recomendaciones sin ordenar el catálogo completo.
+"""
+
+import numpy as np
+
+
+def top_k_indices(scores: np.ndarray, top_k: int = None) -> np.ndarray:
+    """
+    Devuelve las posiciones de las top_k mejores puntuaciones, ordenadas de mayor a menor.
+
+    La selección se hace con una partición parcial (O(n)) y solo se ordenan los top_k
+    elementos elegidos. Los empates se resuelven por posición, de modo que el resultado es
+    determinista, y las puntuaciones NaN quedan siempre al final.
+
+    Args:
+        scores (np.ndarray): Puntuaciones a ordenar.
+        top_k (int): Número de posiciones a devolver. Si es None, se ordenan todas.
+
+    Returns:
+        np.ndarray: Posiciones de las mejores puntuaciones, de mayor a menor.
+    """
+    keys = np.where(np.isnan(scores), -np.inf, scores)
+    if top_k is None or top_k >= len(keys):
+        candidates = np.arange(len(keys))
+    elif top_k <= 0:
+        return np.empty(0, dtype=np.intp)
+    else:
+        # El umbral es la k-ésima mejor puntuación; entre los empates en el umbral se
+        # conservan los de menor posición
+        threshold = keys[np.argpartition(keys, len(keys) - top_k)[len(keys) - top_k]]
+        above = np.flatnonzero(keys > threshold)
+        ties = np.flatnonzero(keys == threshold)[:top_k - len(above)]
+        candidates = np.concatenate([above, ties])
+
+    order = np.lexsort((candidates, -keys[candidates]))
+    return candidates[order]
+
+
+def merge_top_k(scores: np.ndarray, positions: np.ndarray, top_k: int) -> np.ndarray:
+    """
+    Selecciona los top_k mejores de un conjunto de candidatos que proceden de varias
+    selecciones parciales (por ejemplo, los top_k de cada fragmento del catálogo), con el
+    mismo criterio que top_k_indices sobre el catálogo completo: los empates se resuelven
+    por la posición de cada candidato en el catálogo y las puntuaciones NaN quedan al final.
+
+    Args:
+        scores (np.ndarray): Puntuaciones de los candidatos.
+        positions (np.ndarray): Posición de cada candidato en el catálogo completo.
+        top_k (int): Número de candidatos a conservar.
+
+    Returns:
+        np.ndarray: Índices (dentro de scores) de los mejores candidatos, de mayor a menor.
+    """
+    keys = np.where(np.isnan(scores), -np.inf, scores)
+    return np.lexsort((positions, -keys))[:max(top_k, 0)]
@@ -0,0 +1,305 @@
+"""
+Este módulo contiene la clase ResultCache, un caché de recomendaciones ya calculadas para
+no repetir la puntuación del catálogo completo en las consultas que se repiten.
+"""
+
+import hashlib
+import json
+import os
+import pickle
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+from .content_filter import ContentFilter
+
+
+class ResultCache:
+    """
+    ResultCache guarda las recomendaciones por consulta, con expiración (TTL) y descarte
+    de las menos usadas recientemente (LRU) cuando se supera un tamaño máximo en bytes.
+
+    La clave de cada consulta es una forma canónica de sus parámetros (ver key) junto con
+    la versión del catálogo y la del modelo colaborativo, de modo que al recargar los datos
+    o entrenar el modelo las entradas anteriores dejan de coincidir y se descartan solas.
+
+    Opcionalmente, las entradas se escriben también en un directorio, que conserva los
+    resultados entre ejecuciones y puede compartirse entre procesos: una consulta que no
+    está en memoria se busca en el directorio antes de calcularse. El tamaño del
+    directorio se lleva en un contador, de modo que solo se recorre al abrir el caché y
+    cuando se supera disk_max_bytes; entonces se borran los archivos más antiguos hasta
+    bajar a DISK_TRIM_RATIO del máximo.
+
+    Atributos:
+        max_bytes (int): Tamaño máximo en memoria de las recomendaciones guardadas.
+        ttl (float): Segundos que una entrada es válida, o None si no caduca.
+        disk_path (str): Directorio del caché en disco, o None si solo se usa memoria.
+        disk_max_bytes (int): Tamaño máximo del caché en disco.
+    """
+    DEFAULT_MAX_BYTES = 64 * 1024 * 1024
+    DEFAULT_TTL = 300
+    DISK_TRIM_RATIO = 0.9
+
+    def __init__(self, max_bytes: int = DEFAULT_MAX_BYTES, ttl: float = DEFAULT_TTL,
+                 disk_path: str = None, disk_max_bytes: int = 4 * DEFAULT_MAX_BYTES):
+        """
+        Inicializa una instancia de la clase ResultCache.
+
+        Args:
+            max_bytes (int): Tamaño máximo en memoria, en bytes.
+            ttl (float): Segundos que una entrada es válida, o None si no caduca.
+            disk_path (str): Directorio del caché en disco. Se crea si no existe.
+            disk_max_bytes (int): Tamaño máximo del caché en disco, en bytes.
+        """
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.disk_path = disk_path
+        self.disk_max_bytes = disk_max_bytes
+        self._entries = OrderedDict()  # Clave -> (caducidad, bytes, recomendaciones)
+        self._bytes = 0
+        self._counters = {'hits': 0, 'disk_hits': 0, 'misses': 0, 'evictions': 0,
+                          'expirations': 0}
+        self._lock = threading.Lock()
+        self._disk_bytes = 0  # Bytes ocupados en disco, aproximados si hay otros procesos
+        if disk_path is not None:
+            os.makedirs(disk_path, exist_ok=True)
+            self._disk_bytes = sum(size for _, size, _ in self._disk_files())
+
+    @staticmethod
+    def key(user_id, user_input: dict, feature_weights: dict, user_location: str,
+            top_k: int = None, catalog_version: str = None, model_version: str = None,
+            **options) -> str:
+        """
+        Construye la clave canónica de una consulta.
+
+        Los pesos se normalizan, así que pesos proporcionales comparten la misma clave, y la
+        ubicación no distingue mayúsculas. El orden de las características se conserva
+        porque determina el orden en que se suman los términos de la similitud.
+
+        Args:
+            user_id: Identificador del usuario.
+            user_input (dict): Características y valores proporcionados por el usuario.
+            feature_weights (dict): Pesos asignados a cada característica.
+            user_location (str): Ubicación del usuario.
+            top_k (int): Número de coches de la consulta.
+            catalog_version (str): Versión del catálogo (ver CarCatalog.version).
+            model_version (str): Versión del modelo colaborativo.
+            **options: Otras opciones de la consulta, por ejemplo las restricciones.
+
+        Returns:
+            str: La clave de la consulta.
+        """
+        return json.dumps([
+            catalog_version, model_version, user_id, list(user_input.items()),
+            list(ContentFilter.normalize_weights(feature_weights).items()),
+            str(user_location).lower(), top_k,
+            {name: value for name, value in sorted(options.items()) if value is not None}
+        ], ensure_ascii=False, sort_keys=True, default=str)
+
+    def get(self, key: str):
+        """
+        Busca las recomendaciones de una consulta, primero en memoria y después en disco.
+
+        Args:
+            key (str): Clave de la consulta (ver key).
+
+        Returns:
+            pd.DataFrame: Una copia de las recomendaciones, o None si no están guardadas o
+            han caducado.
+        """
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                if entry[0] is None or entry[0] > now:
+                    self._entries.move_to_end(key)
+                    self._counters['hits'] += 1
+                    return entry[2].copy()
+                self._remove(key)
+                self._counters['expirations'] += 1
+
+        recommendations = self._read_disk(key)
+        with self._lock:
+            if recommendations is None:
+                self._counters['misses'] += 1
+                return None
+            self._counters['disk_hits'] += 1
+            self._store(key, recommendations, now)
+        return recommendations.copy()
+
+    def put(self, key: str, recommendations) -> None:
+        """
+        Guarda las recomendaciones de una consulta. Las recomendaciones que por sí solas
+        superan el tamaño máximo no se guardan en memoria.
+
+        Args:
+            key (str): Clave de la consulta (ver key).
+            recommendations (pd.DataFrame): Las recomendaciones.
+        """
+        recommendations = recommendations.copy()
+        with self._lock:
+            self._store(key, recommendations, time.monotonic())
+        self._write_disk(key, recommendations)
+
+    def clear(self) -> None:
+        """
+        Descarta todas las entradas en memoria.
+        """
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def stats(self) -> dict:
+        """
+        Devuelve los contadores del caché.
+
+        Returns:
+            dict: Aciertos en memoria ('hits') y en disco ('disk_hits'), fallos ('misses'),
+            entradas descartadas por tamaño ('evictions') y por caducidad ('expirations'),
+            número de entradas ('entries') y bytes ocupados en memoria ('bytes').
+        """
+        with self._lock:
+            return dict(self._counters, entries=len(self._entries), bytes=self._bytes)
+
+    def _store(self, key: str, recommendations, now: float) -> None:
+        """
+        Guarda una entrada en memoria y descarta las menos usadas hasta volver a cumplir el
+        tamaño máximo. Se llama con el cerrojo adquirido.
+
+        Args:
+            key (str): Clave de la consulta.
+            recommendations (pd.DataFrame): Las recomendaciones.
+            now (float): Instante actual (time.monotonic).
+        """
+        size = len(key) + int(recommendations.memory_usage(index=True, deep=True).sum())
+        if key in self._entries:
+            self._remove(key)
+        if size > self.max_bytes:
+            return
+        expires = None if self.ttl is None else now + self.ttl
+        self._entries[key] = (expires, size, recommendations)
+        self._bytes += size
+        while self._bytes > self.max_bytes:
+            self._remove(next(iter(self._entries)))
+            self._counters['evictions'] += 1
+
+    def _remove(self, key: str) -> None:
+        """
+        Descarta una entrada de memoria. Se llama con el cerrojo adquirido.
+
+        Args:
+            key (str): Clave de la consulta.
+        """
+        self._bytes -= self._entries.pop(key)[1]
+
+    def _disk_file(self, key: str) -> str:
+        """
+        Devuelve la ruta del archivo de una entrada en disco.
+
+        Args:
+            key (str): Clave de la consulta.
+
+        Returns:
+            str: La ruta del archivo.
+        """
+        return os.path.join(self.disk_path,
+                            f"{hashlib.sha256(key.encode('utf-8')).hexdigest()}.pkl")
+
+    def _read_disk(self, key: str):
+        """
+        Lee una entrada del caché en disco.
+
+        Args:
+            key (str): Clave de la consulta.
+
+        Returns:
+            pd.DataFrame: Las recomendaciones, o None si no están guardadas, han caducado o
+            el archivo no es válido.
+        """
+        if self.disk_path is None:
+            return None
+        path = self._disk_file(key)
+        try:
+            with open(path, 'rb') as cache_file:
+                stored_key, expires, recommendations = pickle.load(cache_file)
+        except (OSError, EOFError, ValueError, pickle.UnpicklingError):
+            return None
+        if stored_key != key:
+            return None
+        if expires is not None and expires <= time.time():
+            try:
+                size = os.path.getsize(path)
+                os.remove(path)
+            except OSError:
+                return None
+            with self._lock:
+                self._disk_bytes -= size
+            return None
+        return recommendations
+
+    def _write_disk(self, key: str, recommendations) -> None:
+        """
+        Escribe una entrada en el caché en disco de forma atómica y, si se supera el
+        tamaño máximo, borra los archivos más antiguos.
+
+        Args:
+            key (str): Clave de la consulta.
+            recommendations (pd.DataFrame): Las recomendaciones.
+        """
+        if self.disk_path is None:
+            return
+        expires = None if self.ttl is None else time.time() + self.ttl
+        path = self._disk_file(key)
+        try:
+            try:
+                previous = os.path.getsize(path)
+            except OSError:
+                previous = 0
+            descriptor, temp_path = tempfile.mkstemp(dir=self.disk_path, suffix='.tmp')
+            with os.fdopen(descriptor, 'wb') as cache_file:
+                pickle.dump((key, expires, recommendations), cache_file,
+                            protocol=pickle.HIGHEST_PROTOCOL)
+                size = cache_file.tell()
+            os.replace(temp_path, path)
+            with self._lock:
+                self._disk_bytes += size - previous
+                exceeded = self._disk_bytes > self.disk_max_bytes
+            if exceeded:
+                self._trim_disk()
+        except OSError as exception:
+            print(f"No se pudo guardar la recomendación en el caché: {exception}")
+
+    def _disk_files(self) -> list:
+        """
+        Recorre el caché en disco.
+
+        Returns:
+            list: Fecha de modificación, tamaño y ruta de cada archivo de entrada.
+        """
+        files = []
+        for entry in os.scandir(self.disk_path):
+            if entry.name.endswith('.pkl'):
+                try:
+                    stat = entry.stat()
+                except OSError:
+                    continue  # Borrado por otro proceso
+                files.append((stat.st_mtime_ns, stat.st_size, entry.path))
+        return files
+
+    def _trim_disk(self) -> None:
+        """
+        Borra los archivos más antiguos del caché en disco hasta bajar a DISK_TRIM_RATIO
+        de disk_max_bytes, y corrige el contador con el tamaño real del directorio.
+        """
+        files = self._disk_files()
+        total = sum(size for _, size, _ in files)
+        for _, size, path in sorted(files):
+            if total <= self.disk_max_bytes * self.DISK_TRIM_RATIO:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+            total -= size
+        with self._lock:
+            self._disk_bytes = total
@@ -0,0 +1,214 @@
+"""
+Este módulo contiene la clase FactorIndex, un índice sobre los factores de los modelos de
+coche del modelo colaborativo que devuelve directamente los modelos con mejor calificación
+estimada para un usuario, sin predecir todo el catálogo.
+"""
+
+import numpy as np
+from .ranking import merge_top_k, top_k_indices
+
+
+class FactorIndex:
+    """
+    FactorIndex busca los modelos de coche con mayor producto escalar con el vector de un
+    usuario.
+
+    La calificación estimada de un modelo es media global + sesgo del usuario + sesgo del
+    modelo + factores del modelo · factores del usuario. La media y el sesgo del usuario
+    no cambian el orden, así que cada modelo se representa con sus factores seguidos de su
+    sesgo y cada usuario con sus factores seguidos de un 1, y el orden de las estimaciones
+    es el orden de los productos escalares.
+
+    La búsqueda exacta recorre los modelos por bloques de block_size filas, con un producto
+    matriz-vector por bloque, y conserva los n mejores de cada bloque. La búsqueda
+    aproximada (ver build_clusters) agrupa los modelos con k-medias y solo puntúa los
+    grupos cuyo centroide tiene mayor producto escalar con el usuario.
+
+    Atributos:
+        vectors (np.ndarray): Vector de cada modelo de coche (modelos x dimensiones), por
+                              ID interno.
+        block_size (int): Número de modelos de cada bloque de la búsqueda exacta.
+        centroids (np.ndarray): Centroide de cada grupo, o None si no se han construido
+                                los grupos.
+    """
+    DEFAULT_BLOCK_SIZE = 4096
+    SAMPLE_PER_CLUSTER = 64
+
+    def __init__(self, item_factors: np.ndarray, item_biases: np.ndarray = None,
+                 block_size: int = DEFAULT_BLOCK_SIZE):
+        """
+        Inicializa una instancia de la clase FactorIndex.
+
+        Args:
+            item_factors (np.ndarray): Factores de cada modelo de coche.
+            item_biases (np.ndarray): Sesgo de cada modelo de coche, o None si el modelo
+                                      no usa sesgos.
+            block_size (int): Número de modelos de cada bloque de la búsqueda exacta.
+
+        Raises:
+            ValueError: Si block_size no es positivo.
+        """
+        if block_size <= 0:
+            raise ValueError("El tamaño de bloque debe ser positivo.")
+        self.item_factors = item_factors
+        self.vectors = np.ascontiguousarray(
+            item_factors if item_biases is None
+            else np.column_stack([item_factors, item_biases])
+        )
+        self.block_size = block_size
+        self.centroids = None
+        self._members = None  # IDs internos de los modelos de cada grupo
+
+    def __len__(self) -> int:
+        return len(self.vectors)
+
+    def query_vector(self, user_factors: np.ndarray = None) -> np.ndarray:
+        """
+        Construye el vector de consulta de un usuario.
+
+        Args:
+            user_factors (np.ndarray): Factores del usuario, o None si el modelo no lo
+                                       conoce (solo cuenta el sesgo de cada modelo).
+
+        Returns:
+            np.ndarray: El vector de consulta.
+        """
+        query = np.zeros(self.vectors.shape[1])
+        if user_factors is not None:
+            query[:len(user_factors)] = user_factors
+        if self.vectors.shape[1] > self.item_factors.shape[1]:
+            query[-1] = 1.0
+        return query
+
+    def search(self, query: np.ndarray, n: int = 10, approximate: bool = False,
+               n_probe: int = None) -> np.ndarray:
+        """
+        Busca los n modelos con mayor producto escalar con un vector de consulta.
+
+        Args:
+            query (np.ndarray): Vector de consulta (ver query_vector).
+            n (int): Número de modelos a devolver.
+            approximate (bool): Si es True, solo se puntúan los grupos más prometedores
+                                (ver build_clusters, que se llama si hace falta).
+            n_probe (int): Número mínimo de grupos a puntuar en la búsqueda aproximada.
+                           Por defecto, la raíz cuadrada del número de grupos.
+
+        Returns:
+            np.ndarray: IDs internos de los modelos, de mayor a menor producto escalar.
+            Los empates se resuelven por ID interno.
+        """
+        if n <= 0 or not len(self.vectors):
+            return np.empty(0, dtype=np.intp)
+        if approximate:
+            return self._search_clusters(query, n, n_probe)
+
+        best = np.empty(0, dtype=np.intp)
+        best_scores = np.empty(0)
+        for start in range(0, len(self.vectors), self.block_size):
+            block_scores = self.vectors[start:start + self.block_size] @ query
+            block_best = top_k_indices(block_scores, n)
+            rows = np.concatenate([best, block_best + start])
+            scores = np.concatenate([best_scores, block_scores[block_best]])
+            keep = merge_top_k(scores, rows, n)
+            best, best_scores = rows[keep], scores[keep]
+        return best
+
+    def build_clusters(self, n_clusters: int = None, iterations: int = 10,
+                       seed: int = 0) -> None:
+        """
+        Agrupa los modelos con k-medias para la búsqueda aproximada.
+
+        Args:
+            n_clusters (int): Número de grupos. Por defecto, la raíz cuadrada del número
+                              de modelos.
+            iterations (int): Iteraciones de k-medias.
+            seed (int): Semilla de la muestra y de los centroides iniciales.
+        """
+        n_clusters = min(len(self.vectors),
+                         n_clusters or max(1, round(np.sqrt(len(self.vectors)))))
+        if n_clusters == 0:
+            self.centroids = np.empty((0, self.vectors.shape[1]))
+            self._members = []
+            return
+
+        # Los centroides se ajustan con una muestra de SAMPLE_PER_CLUSTER modelos por grupo
+        # y después se asignan todos los modelos
+        random = np.random.default_rng(seed)
+        sample = self.vectors[np.sort(random.choice(
+            len(self.vectors), min(len(self.vectors), n_clusters * self.SAMPLE_PER_CLUSTER),
+            replace=False
+        ))]
+        centroids = sample[random.choice(len(sample), n_clusters, replace=False)]
+        for _ in range(iterations):
+            labels, distances = self._assign(sample, centroids)
+            counts = np.bincount(labels, minlength=n_clusters)
+            sums = np.column_stack([np.bincount(labels, weights=column, minlength=n_clusters)
+                                    for column in sample.T])
+            # Un grupo vacío se reinicia con los modelos más alejados de su centroide
+            empty = np.flatnonzero(counts == 0)
+            if len(empty):
+                farthest = np.argsort(-distances, kind='stable')[:len(empty)]
+                sums[empty] = sample[farthest]
+                counts[empty] = 1
+            centroids = sums / counts[:, np.newaxis]
+
+        labels = self._assign(self.vectors, centroids)[0]
+        order = np.argsort(labels, kind='stable')
+        bounds = np.searchsorted(labels[order], np.arange(n_clusters + 1))
+        self.centroids = centroids
+        self._members = [order[bounds[cluster]:bounds[cluster + 1]]
+                         for cluster in range(n_clusters)]
+
+    def _assign(self, vectors: np.ndarray, centroids: np.ndarray) -> tuple:
+        """
+        Asigna cada vector al centroide más cercano, por bloques de block_size vectores para
+        no construir la matriz de distancias completa.
+
+        Args:
+            vectors (np.ndarray): Vectores de los modelos.
+            centroids (np.ndarray): Centroides.
+
+        Returns:
+            tuple: El grupo de cada vector y la distancia al cuadrado a su centroide.
+        """
+        centroid_norms = np.einsum('ij,ij->i', centroids, centroids)
+        labels = np.empty(len(vectors), dtype=np.intp)
+        distances = np.empty(len(vectors))
+        for start in range(0, len(vectors), self.block_size):
+            block = vectors[start:start + self.block_size]
+            block_distances = centroid_norms - 2 * block @ centroids.T
+            block_labels = np.argmin(block_distances, axis=1)
+            labels[start:start + len(block)] = block_labels
+            distances[start:start + len(block)] = (
+                block_distances[np.arange(len(block)), block_labels]
+                + np.einsum('ij,ij->i', block, block)
+            )
+        return labels, distances
+
+    def _search_clusters(self, query: np.ndarray, n: int, n_probe: int = None) -> np.ndarray:
+        """
+        Búsqueda aproximada: puntúa los grupos en orden de producto escalar de su
+        centroide con la consulta, hasta haber puntuado n_probe grupos y al menos n modelos.
+
+        Args:
+            query (np.ndarray): Vector de consulta.
+            n (int): Número de modelos a devolver.
+            n_probe (int): Número mínimo de grupos a puntuar.
+
+        Returns:
+            np.ndarray: IDs internos de los modelos, de mayor a menor producto escalar.
+        """
+        if self.centroids is None:
+            self.build_clusters()
+        n_probe = n_probe or max(1, round(np.sqrt(len(self.centroids))))
+
+        members = []
+        found = 0
+        for probed, cluster in enumerate(top_k_indices(self.centroids @ query)):
+            if probed >= n_probe and found >= n:
+                break
+            members.append(self._members[cluster])
+            found += len(self._members[cluster])
+        candidates = np.concatenate(members)
+        scores = self.vectors[candidates] @ query
+        return candidates[merge_top_k(scores, candidates, n)]
@@ -0,0 +1,494 @@
+"""
+Este módulo implementa un servicio local de recomendación que mantiene los datos y los
+modelos cargados en memoria y atiende consultas JSON a través de HTTP, junto con el cliente
+que permite a las interfaces usarlo.
+"""
+
+import json
+import threading
+import time
+import urllib.error
+import urllib.request
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import pandas as pd
+from .catalog_watcher import CatalogWatcher
+from .collaborative_filter import CollaborativeFilter
+from .data_loader import DataLoader
+from .geo_utils import GeoUtils
+from .hybrid_recommender import HybridRecommender
+from .result_cache import ResultCache
+
+
+class RecommenderService:
+    """
+    RecommenderService carga una única vez el catálogo, el modelo colaborativo y el caché de
+    distancias, y los reutiliza para todas las consultas.
+
+    Las valoraciones nuevas (ver add_ratings) se incorporan al modelo colaborativo en el
+    momento y se añaden al CSV de valoraciones; si se indica retrain_interval, el modelo se
+    vuelve a entrenar completo en segundo plano con esa periodicidad y sustituye al actual
+    cuando termina.
+
+    Los cambios de coches (ver apply_catalog_changes) se aplican de forma incremental sobre
+    una copia del catálogo, que sustituye a la actual de una vez: las consultas en curso
+    terminan con el catálogo anterior y las siguientes usan el nuevo. Si se indica
+    watch_interval, el CSV de coches se vigila con esa periodicidad y sus cambios se
+    aplican de la misma forma.
+
+    Atributos:
+        cars_catalog (CarCatalog): Catálogo de coches con sus columnas codificadas.
+        ratings_path (str): Ruta al archivo CSV que contiene las valoraciones.
+        collaborative_model (CollaborativeFilter): El modelo de filtrado colaborativo.
+        geo_calculator (GeoUtils): La instancia de GeoUtils para cálculos geográficos.
+        recommender (HybridRecommender): El recomendador híbrido.
+        result_cache (ResultCache): Caché de las recomendaciones ya calculadas.
+        retrain_interval (float): Segundos mínimos entre dos entrenamientos completos, o
+                                  None para no volver a entrenar mientras el servicio está
+                                  en marcha.
+        catalog_watcher (CatalogWatcher): Vigilante del CSV de coches, o None si no se
+                                          vigila.
+    """
+    def __init__(self, cars_path='data/coches.csv', ratings_path='data/car_ratings.csv',
+                 distance_cache='data/distance_cache.csv', offline=False,
+                 retrain_interval=None, progress=None, result_cache=None,
+                 watch_interval=None):
+        """
+        Inicializa una instancia de la clase RecommenderService y carga los datos y modelos.
+
+        Args:
+            cars_path (str): Ruta al archivo CSV que contiene los datos de los coches.
+            ratings_path (str): Ruta al archivo CSV que contiene las valoraciones.
+            distance_cache (str): Ruta al archivo CSV que contiene el caché de distancias.
+            offline (bool): Si es True, las distancias solo se obtienen del caché y del
+                            nomenclátor, sin consultar el geocodificador en la red.
+            retrain_interval (float): Segundos mínimos entre dos entrenamientos completos
+                                      del modelo colaborativo con las valoraciones nuevas.
+            progress (callable): Función que recibe la fracción completada y la
+                                 descripción de cada paso de la carga (ver
+                                 BackgroundJob.progress).
+            result_cache (ResultCache): Caché de las recomendaciones. Por defecto, un caché
+                                        en memoria con el tamaño y la caducidad por defecto.
+            watch_interval (float): Segundos entre dos comprobaciones del CSV de coches, o
+                                    None para no vigilarlo.
+        """
+        progress = progress or (lambda fraction, message: None)
+        progress(0.0, "Cargando el catálogo de coches...")
+        self.cars_catalog = DataLoader(cars_path, ratings_path).load_catalog()
+        self.ratings_path = ratings_path
+        progress(0.4, "Cargando el modelo colaborativo...")
+        self.collaborative_model = CollaborativeFilter()
+        self.collaborative_model.train_model(ratings_path)
+        progress(0.8, "Cargando el caché de distancias...")
+        self.geo_calculator = GeoUtils(cache_file=distance_cache, offline=offline)
+        self.result_cache = result_cache or ResultCache()
+        self.recommender = HybridRecommender(self.collaborative_model, self.geo_calculator,
+                                             self.result_cache)
+        self.retrain_interval = retrain_interval
+        self._ratings_lock = threading.Lock()
+        self._last_training = time.monotonic()
+        self._retraining = None  # Valoraciones recibidas durante el entrenamiento en curso
+        self._catalog_lock = threading.Lock()
+        self.catalog_watcher = None
+        if watch_interval is not None:
+            self.catalog_watcher = CatalogWatcher(cars_path, self.update_catalog,
+                                                  watch_interval).start()
+
+    def recommend(self, user_id, user_input, feature_weights, user_location, top_k=10,
+                  constraints=None):
+        """
+        Recomienda coches al usuario con los datos y modelos ya cargados.
+
+        Args:
+            user_id (str): Identificador del usuario.
+            user_input (dict): Características y valores proporcionados por el usuario.
+            feature_weights (dict): Pesos asignados a cada característica.
+            user_location (str): Ubicación del usuario.
+            top_k (int): Número de coches a devolver.
+            constraints (dict): Restricciones obligatorias (ver HybridRecommender.recommend).
+
+        Returns:
+            pd.DataFrame: Los coches recomendados, ordenados por la puntuación híbrida.
+        """
+        return self.recommender.recommend(
+            user_id, dict(user_input), dict(feature_weights), user_location,
+            self.cars_catalog, top_k=top_k, constraints=constraints
+        )
+
+    def session(self, user_id, user_input, user_location, constraints=None):
+        """
+        Prepara una consulta para recomendar después con distintos pesos sin recalcularla
+        (ver HybridRecommender.session).
+
+        Args:
+            user_id (str): Identificador del usuario.
+            user_input (dict): Características y valores proporcionados por el usuario.
+            user_location (str): Ubicación del usuario.
+            constraints (dict): Restricciones obligatorias (ver HybridRecommender.recommend).
+
+        Returns:
+            RecommendationSession: La consulta preparada.
+        """
+        return self.recommender.session(user_id, dict(user_input), user_location,
+                                        self.cars_catalog, constraints=constraints)
+
+    def apply_catalog_changes(self, upserts=None, deletes=None):
+        """
+        Aplica altas, modificaciones y bajas de coches sin volver a cargar el catálogo (ver
+        CarCatalog.apply_changes). El catálogo nuevo tiene otra versión, así que las
+        recomendaciones guardadas en el caché con el anterior dejan de usarse.
+
+        Args:
+            upserts (list | pd.DataFrame): Coches nuevos o modificados, como diccionarios
+                                           con el campo 'id' y los campos que cambian.
+            deletes (list): Identificadores de los coches que se eliminan.
+
+        Returns:
+            dict: Resumen de los cambios aplicados (ver CarCatalog.apply_changes).
+
+        Raises:
+            ValueError: Si algún cambio no es válido.
+        """
+        if upserts is not None and not isinstance(upserts, pd.DataFrame):
+            upserts = pd.DataFrame(list(upserts)) if len(upserts) else None
+        with self._catalog_lock:
+            catalog, summary = self.cars_catalog.apply_changes(upserts, deletes)
+            self.cars_catalog = catalog
+        return summary
+
+    def update_catalog(self, data):
+        """
+        Sustituye los datos de los coches por una versión nueva completa, por ejemplo el
+        CSV de coches leído de nuevo, aplicando solo las diferencias con el catálogo
+        actual.
+
+        Args:
+            data (pd.DataFrame): Datos nuevos de los coches, con la columna 'id'.
+
+        Returns:
+            dict: Resumen de los cambios aplicados (ver CarCatalog.apply_changes).
+
+        Raises:
+            ValueError: Si los datos no tienen la columna 'id'.
+        """
+        with self._catalog_lock:
+            upserts, deletes = self.cars_catalog.changes_from(data)
+            catalog, summary = self.cars_catalog.apply_changes(upserts, deletes)
+            self.cars_catalog = catalog
+        return summary
+
+    def add_ratings(self, ratings):
+        """
+        Añade valoraciones nuevas: se guardan al final del CSV de valoraciones y se
+        incorporan al modelo colaborativo sin volver a entrenarlo, de modo que las
+        siguientes recomendaciones ya las tienen en cuenta. Si ha pasado retrain_interval
+        desde el último entrenamiento, se inicia uno completo en segundo plano.
+
+        Args:
+            ratings (list): Valoraciones como diccionarios con user_id, model_id y rating.
+
+        Returns:
+            dict: Resumen de las valoraciones incorporadas (ver CollaborativeFilter.fold_in).
+
+        Raises:
+            ValueError: Si alguna valoración no es válida.
+        """
+        df_ratings = pd.DataFrame(list(ratings), columns=['user_id', 'model_id', 'rating'])
+        if df_ratings.isna().any().any():
+            raise ValueError("Cada valoración debe indicar user_id, model_id y rating.")
+        lower_bound, higher_bound = self.collaborative_model.model.rating_scale
+        if not df_ratings['rating'].between(lower_bound, higher_bound).all():
+            raise ValueError(
+                f"Las calificaciones deben estar entre {lower_bound} y {higher_bound}."
+            )
+
+        with self._ratings_lock:
+            self._append_ratings(df_ratings)
+            summary = self.collaborative_model.fold_in(df_ratings)
+            if self._retraining is not None:
+                self._retraining.append(df_ratings)
+            elif (self.retrain_interval is not None and
+                  time.monotonic() - self._last_training >= self.retrain_interval):
+                self._retraining = []
+                threading.Thread(target=self._retrain, name='retrain', daemon=True).start()
+        return summary
+
+    def _append_ratings(self, df_ratings):
+        """
+        Añade valoraciones al final del CSV de valoraciones.
+
+        Args:
+            df_ratings (pd.DataFrame): Valoraciones con user_id, model_id y rating.
+        """
+        with open(self.ratings_path, 'ab+') as ratings_file:
+            # Si la última línea no termina en salto de línea, la primera valoración nueva
+            # se uniría a ella
+            if ratings_file.tell() > 0:
+                ratings_file.seek(-1, 2)
+                if ratings_file.read(1) != b'\n':
+                    ratings_file.write(b'\n')
+            ratings_file.write(df_ratings.to_csv(header=False, index=False).encode('utf-8'))
+
+    def _retrain(self):
+        """
+        Entrena un modelo colaborativo nuevo con el CSV de valoraciones completo y lo
+        pone en servicio. El CSV se lee con el cerrojo de las valoraciones adquirido, de
+        modo que ninguna valoración queda a medio escribir, y a partir de ese momento se
+        guardan las que se reciben, que se incorporan al modelo nuevo antes de sustituir al
+        actual. Si el entrenamiento falla, se sigue usando el modelo actual y el siguiente
+        envío de valoraciones puede iniciar otro.
+        """
+        model = CollaborativeFilter(self.collaborative_model.model_path)
+        try:
+            with self._ratings_lock:
+                df_ratings, signature = model.read_ratings(self.ratings_path)
+                self._retraining = []
+            model.train_from_ratings(df_ratings, signature)
+        except Exception as exception:  # pylint: disable=broad-except
+            print(f"Error al volver a entrenar el modelo colaborativo: {exception}")
+            with self._ratings_lock:
+                self._retraining = None
+            return
+
+        with self._ratings_lock:
+            for df_ratings in self._retraining:
+                model.fold_in(df_ratings)
+            self.collaborative_model = model
+            self.recommender.collaborative_model = model
+            self._retraining = None
+            self._last_training = time.monotonic()
+
+
+class RecommenderClient:
+    """
+    RecommenderClient envía las consultas a un RecommenderService que se ejecuta en otro
+    proceso, con la misma interfaz que el propio servicio.
+
+    Atributos:
+        url (str): Dirección base del servicio, por ejemplo 'http://127.0.0.1:8765'.
+        timeout (float): Tiempo máximo de espera de cada consulta, en segundos.
+    """
+    def __init__(self, url, timeout=60):
+        """
+        Inicializa una instancia de la clase RecommenderClient.
+
+        Args:
+            url (str): Dirección base del servicio.
+            timeout (float): Tiempo máximo de espera de cada consulta, en segundos.
+        """
+        self.url = url.rstrip('/')
+        self.timeout = timeout
+
+    def recommend(self, user_id, user_input, feature_weights, user_location, top_k=10,
+                  constraints=None):
+        """
+        Solicita recomendaciones al servicio.
+
+        Args:
+            user_id (str): Identificador del usuario.
+            user_input (dict): Características y valores proporcionados por el usuario.
+            feature_weights (dict): Pesos asignados a cada característica.
+            user_location (str): Ubicación del usuario.
+            top_k (int): Número de coches a devolver.
+            constraints (dict): Restricciones obligatorias (ver HybridRecommender.recommend).
+
+        Returns:
+            pd.DataFrame: Los coches recomendados, ordenados por la puntuación híbrida.
+
+        Raises:
+            ValueError: Si el servicio rechaza la consulta.
+        """
+        payload = self._post('/recommend', {
+            'user_id': user_id,
+            'user_input': user_input,
+            'feature_weights': feature_weights,
+            'user_location': user_location,
+            'top_k': top_k,
+            'constraints': constraints
+        })
+        return pd.DataFrame(payload['recommendations'], columns=payload['columns'])
+
+    def add_ratings(self, ratings):
+        """
+        Envía valoraciones nuevas al servicio.
+
+        Args:
+            ratings (list): Valoraciones como diccionarios con user_id, model_id y rating.
+
+        Returns:
+            dict: Resumen de las valoraciones incorporadas.
+
+        Raises:
+            ValueError: Si el servicio rechaza las valoraciones.
+        """
+        return self._post('/ratings', {'ratings': list(ratings)})
+
+    def apply_catalog_changes(self, upserts=None, deletes=None):
+        """
+        Envía altas, modificaciones y bajas de coches al servicio.
+
+        Args:
+            upserts (list): Coches nuevos o modificados, como diccionarios con el campo
+                            'id' y los campos que cambian.
+            deletes (list): Identificadores de los coches que se eliminan.
+
+        Returns:
+            dict: Resumen de los cambios aplicados.
+
+        Raises:
+            ValueError: Si el servicio rechaza los cambios.
+        """
+        return self._post('/catalog', {'upserts': list(upserts or []),
+                                       'deletes': list(deletes or [])})
+
+    def _post(self, path, query):
+        """
+        Envía una petición JSON al servicio.
+
+        Args:
+            path (str): Ruta de la petición, por ejemplo '/recommend'.
+            query (dict): Cuerpo de la petición.
+
+        Returns:
+            dict: La respuesta del servicio.
+
+        Raises:
+            ValueError: Si el servicio rechaza la petición.
+        """
+        body = json.dumps(query).encode('utf-8')
+        request = urllib.request.Request(
+            f"{self.url}{path}", data=body, headers={'Content-Type': 'application/json'}
+        )
+        try:
+            with urllib.request.urlopen(request, timeout=self.timeout) as response:
+                return json.loads(response.read().decode('utf-8'))
+        except urllib.error.HTTPError as exception:
+            message = json.loads(exception.read().decode('utf-8')).get('error', str(exception))
+            raise ValueError(message) from exception
+
+
+class _RecommendationHandler(BaseHTTPRequestHandler):
+    """
+    Atiende las peticiones HTTP del servicio:
+    - GET /health: comprueba que el servicio está disponible.
+    - GET /stats: devuelve los contadores del caché de recomendaciones.
+    - POST /recommend: recibe una consulta JSON y devuelve las recomendaciones en JSON.
+    - POST /ratings: recibe valoraciones nuevas y las incorpora al modelo colaborativo.
+    - POST /catalog: recibe altas, modificaciones y bajas de coches y las aplica al
+      catálogo.
+    """
+    service = None  # RecommenderService compartido por todas las peticiones
+
+    def do_GET(self):  # pylint: disable=invalid-name
+        """Responde a las comprobaciones de estado y a las consultas de contadores."""
+        if self.path == '/stats':
+            self._send_json(200, json.dumps({'result_cache': self.service.result_cache.stats()}))
+            return
+        if self.path != '/health':
+            self._send_json(404, json.dumps({'error': 'Ruta no encontrada.'}))
+            return
+        self._send_json(200, json.dumps({'status': 'ok'}))
+
+    def do_POST(self):  # pylint: disable=invalid-name
+        """Atiende una consulta de recomendación o un envío de valoraciones o coches."""
+        if self.path == '/ratings':
+            self._add_ratings()
+            return
+        if self.path == '/catalog':
+            self._apply_catalog_changes()
+            return
+        if self.path != '/recommend':
+            self._send_json(404, json.dumps({'error': 'Ruta no encontrada.'}))
+            return
+        try:
+            length = int(self.headers.get('Content-Length', 0))
+            query = json.loads(self.rfile.read(length).decode('utf-8'))
+            recommendations = self.service.recommend(
+                query.get('user_id', 'new_user'), query['user_input'],
+                query['feature_weights'], query['user_location'], query.get('top_k', 10),
+                query.get('constraints')
+            )
+        except (ValueError, KeyError, TypeError, AttributeError) as exception:
+            self._send_json(400, json.dumps({'error': f"Consulta no válida: {exception}"}))
+            return
+        except Exception as exception:  # pylint: disable=broad-except
+            self._send_internal_error(exception)
+            return
+
+        columns = json.dumps(recommendations.columns.tolist(), ensure_ascii=False)
+        rows = recommendations.to_json(orient='records', force_ascii=False)
+        self._send_json(200, f'{{"columns": {columns}, "recommendations": {rows}}}')
+
+    def _add_ratings(self):
+        """Incorpora las valoraciones recibidas al modelo colaborativo."""
+        try:
+            length = int(self.headers.get('Content-Length', 0))
+            query = json.loads(self.rfile.read(length).decode('utf-8'))
+            summary = self.service.add_ratings(query['ratings'])
+        except (ValueError, KeyError, TypeError, AttributeError) as exception:
+            self._send_json(400, json.dumps({'error': f"Valoraciones no válidas: {exception}"}))
+            return
+        except Exception as exception:  # pylint: disable=broad-except
+            self._send_internal_error(exception)
+            return
+        self._send_json(200, json.dumps(summary))
+
+    def _apply_catalog_changes(self):
+        """Aplica al catálogo los cambios de coches recibidos."""
+        try:
+            length = int(self.headers.get('Content-Length', 0))
+            query = json.loads(self.rfile.read(length).decode('utf-8'))
+            summary = self.service.apply_catalog_changes(query.get('upserts'),
+                                                         query.get('deletes'))
+        except (ValueError, KeyError, TypeError, AttributeError) as exception:
+            self._send_json(400, json.dumps({'error': f"Cambios no válidos: {exception}"}))
+            return
+        except Exception as exception:  # pylint: disable=broad-except
+            self._send_internal_error(exception)
+            return
+        self._send_json(200, json.dumps(summary))
+
+    def _send_internal_error(self, exception):
+        """
+        Responde con un error 500 en JSON cuando una petición falla por un motivo que no
+        depende de sus datos, para que el cliente reciba el error en lugar de una conexión
+        cortada.
+
+        Args:
+            exception (Exception): La excepción producida.
+        """
+        self._send_json(500, json.dumps({'error': f"Error interno del servicio: {exception}"}))
+
+    def _send_json(self, status, body):
+        """
+        Envía una respuesta JSON.
+
+        Args:
+            status (int): Código de estado HTTP.
+            body (str): Cuerpo de la respuesta ya serializado.
+        """
+        encoded = body.encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json; charset=utf-8')
+        self.send_header('Content-Length', str(len(encoded)))
+        self.end_headers()
+        self.wfile.write(encoded)
+
+    def log_message(self, format, *args):  # pylint: disable=redefined-builtin
+        """Silencia el registro de cada petición en la salida estándar."""
+
+
+def create_server(service, host='127.0.0.1', port=8765):
+    """
+    Crea el servidor HTTP del servicio. Cada petición se atiende en su propio hilo y todas
+    comparten los datos y modelos ya cargados.
+
+    Args:
+        service (RecommenderService): El servicio con los datos y modelos cargados.
+        host (str): Dirección en la que escucha el servidor.
+        port (int): Puerto en el que escucha el servidor.
+
+    Returns:
+        ThreadingHTTPServer: El servidor, listo para llamar a serve_forever().
+    """
+    handler = type('RecommendationHandler', (_RecommendationHandler,), {'service': service})
+    return ThreadingHTTPServer((host, port), handler)
@@ -0,0 +1,315 @@
+"""
+Este módulo contiene la clase ShardedCatalog, que reparte el catálogo codificado en
+fragmentos de filas guardados en memoria compartida para que un grupo de procesos los puntúe
+en paralelo sin copiar el catálogo en cada tarea.
+"""
+
+import os
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+import numpy as np
+import pandas as pd
+from .catalog import CarCatalog, CategoryEncoding
+from .content_filter import ContentFilter
+from .ranking import merge_top_k, top_k_indices
+
+_worker = None  # Catálogo compartido al que está conectado cada proceso del grupo
+
+SCORE_COLUMNS = ['similarity_score', 'distance', 'geo_score', 'collaborative_score',
+                 'hybrid_score']
+
+
+class ShardedCatalog:
+    """
+    ShardedCatalog copia una sola vez en memoria compartida las columnas del catálogo que
+    se usan al puntuar: los valores de las columnas numéricas, los códigos de cada
+    codificación y el código del modelo de cada coche. Cada proceso del grupo se conecta al
+    bloque compartido al arrancar y cada tarea recibe solo los límites de su fragmento y
+    los datos de la consulta.
+
+    La penalización geográfica y la puntuación colaborativa solo dependen de la provincia
+    y del modelo, así que se calculan en el proceso principal una vez por provincia y por
+    modelo (ver HybridRecommender.recommend_sharded) y los procesos solo las reparten.
+
+    Atributos:
+        catalog (CarCatalog): Catálogo de coches completo.
+        workers (int): Número de procesos del grupo.
+        shard_size (int): Número de coches de cada fragmento.
+        provinces (CategoryEncoding): Codificación con una fila por provincia del catálogo,
+                                      para calcular la penalización de cada provincia.
+        model_ids (list): Modelos distintos del catálogo, en orden de aparición.
+    """
+    ALIGNMENT = 64
+
+    def __init__(self, catalog: CarCatalog, workers: int = None, shard_size: int = None):
+        """
+        Inicializa una instancia de la clase ShardedCatalog, copia el catálogo en memoria
+        compartida y arranca el grupo de procesos.
+
+        Args:
+            catalog (CarCatalog): Catálogo de coches.
+            workers (int): Número de procesos. Por defecto, uno por núcleo.
+            shard_size (int): Número de coches de cada fragmento. Por defecto, el catálogo
+                              se reparte en dos fragmentos por proceso.
+        """
+        self.catalog = catalog
+        self.workers = workers or os.cpu_count() or 1
+        self.shard_size = shard_size or max(1, -(-len(catalog) // (self.workers * 2)))
+        provinces = catalog.encoding('province')
+        self.provinces = CategoryEncoding(np.arange(len(provinces.categories)),
+                                          provinces.categories)
+        # Misma factorización que CollaborativeFilter.predict_many sobre el catálogo completo
+        model_codes, model_ids = pd.factorize(np.asarray(catalog.values('model_id')))
+        self.model_ids = model_ids.tolist()
+
+        arrays, layout = self._collect_arrays(catalog, model_codes)
+        size = sum(self._aligned(array.nbytes) for array in arrays)
+        self._memory = shared_memory.SharedMemory(create=True, size=max(size, 1))
+        for array, block in zip(arrays, layout['blocks']):
+            target = np.ndarray(array.shape, dtype=array.dtype, buffer=self._memory.buf,
+                                offset=block['offset'])
+            target[:] = array
+        self._executor = ProcessPoolExecutor(max_workers=self.workers,
+                                             initializer=_attach,
+                                             initargs=(self._memory.name, layout))
+
+    def _collect_arrays(self, catalog: CarCatalog, model_codes: np.ndarray) -> tuple:
+        """
+        Reúne los arrays que se copian en memoria compartida y describe su posición.
+
+        Args:
+            catalog (CarCatalog): Catálogo de coches.
+            model_codes (np.ndarray): Código del modelo de cada coche.
+
+        Returns:
+            tuple: La lista de arrays y la descripción del bloque compartido (filas,
+            columnas, bloques, categorías de cada codificación y estadísticas).
+        """
+        arrays = []
+        blocks = []
+        offset = 0
+
+        def add(kind, name, array):
+            nonlocal offset
+            array = np.ascontiguousarray(array)
+            arrays.append(array)
+            blocks.append({'kind': kind, 'name': name, 'dtype': array.dtype.str,
+                           'offset': offset})
+            offset += self._aligned(array.nbytes)
+
+        numeric = []
+        for column in catalog.data.columns:
+            if pd.api.types.is_numeric_dtype(catalog.data[column]):
+                numeric.append(column)
+                add('values', column, catalog.values(column))
+            else:
+                catalog.encoding(column)  # Las columnas de texto solo se usan codificadas
+        categories = {}
+        for column, encoding in catalog.encodings.items():
+            add('codes', column, encoding.codes)
+            categories[column] = encoding.categories
+        add('models', None, model_codes)
+
+        layout = {'rows': len(catalog), 'columns': list(catalog.data.columns),
+                  'numeric': numeric, 'blocks': blocks, 'categories': categories,
+                  'stats': catalog.stats}
+        return arrays, layout
+
+    def _aligned(self, size: int) -> int:
+        """
+        Redondea un tamaño al múltiplo de ALIGNMENT siguiente.
+
+        Args:
+            size (int): Tamaño en bytes.
+
+        Returns:
+            int: El tamaño alineado.
+        """
+        return -(-size // self.ALIGNMENT) * self.ALIGNMENT
+
+    def __len__(self) -> int:
+        return len(self.catalog)
+
+    def shards(self) -> list:
+        """
+        Devuelve los límites de cada fragmento.
+
+        Returns:
+            list: Pares (inicio, fin) de cada fragmento, en el orden del catálogo.
+        """
+        return [(start, min(start + self.shard_size, len(self.catalog)))
+                for start in range(0, len(self.catalog), self.shard_size)]
+
+    def content_max(self, user_input: dict, feature_weights: dict) -> float:
+        """
+        Calcula en paralelo el máximo de la similitud de contenido sin normalizar.
+
+        Args:
+            user_input (dict): Características y valores proporcionados por el usuario.
+            feature_weights (dict): Pesos de las características, ya normalizados.
+
+        Returns:
+            float: El máximo en todo el catálogo (-inf si el catálogo está vacío).
+        """
+        maximums = self._executor.map(
+            _shard_content_max,
+            *zip(*[(start, stop, user_input, feature_weights)
+                   for start, stop in self.shards()])
+        )
+        return np.fmax.reduce(np.fromiter(maximums, dtype=float), initial=-np.inf)
+
+    def top_k(self, user_input: dict, feature_weights: dict, max_score: float,
+              province_scores: tuple, model_scores: np.ndarray, top_k: int = None) -> tuple:
+        """
+        Calcula en paralelo la puntuación híbrida de cada fragmento y combina los top_k de
+        cada uno en los top_k del catálogo completo, con los mismos empates que
+        top_k_indices sobre el catálogo completo.
+
+        Args:
+            user_input (dict): Características y valores proporcionados por el usuario.
+            feature_weights (dict): Pesos de las características, ya normalizados.
+            max_score (float): Máximo de la similitud sin normalizar (ver content_max).
+            province_scores (tuple): Distancia y penalización ('geo_score') de cada
+                                     provincia, en el orden de provinces.
+            model_scores (np.ndarray): Puntuación colaborativa de cada modelo, en el orden
+                                       de model_ids.
+            top_k (int): Número de coches a devolver. Si es None, se devuelven todos.
+
+        Returns:
+            tuple: Posiciones de los mejores coches en el catálogo, de mayor a menor, y
+            diccionario con sus puntuaciones por nombre de columna.
+        """
+        shards = self.shards()
+        results = list(self._executor.map(
+            _shard_top_k,
+            *zip(*[(start, stop, user_input, feature_weights, max_score, province_scores,
+                    model_scores, top_k) for start, stop in shards])
+        )) if shards else []
+        rows = np.concatenate([result[0] for result in results] or
+                              [np.empty(0, dtype=np.intp)])
+        scores = {column: np.concatenate([result[1][column] for result in results] or
+                                         [np.empty(0)])
+                  for column in SCORE_COLUMNS}
+        order = merge_top_k(scores['hybrid_score'], rows,
+                            len(rows) if top_k is None else top_k)
+        return rows[order], {column: values[order] for column, values in scores.items()}
+
+    def close(self) -> None:
+        """
+        Detiene el grupo de procesos y libera la memoria compartida.
+        """
+        self._executor.shutdown(wait=True)
+        self._memory.close()
+        self._memory.unlink()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+        return False
+
+
+def _attach(name: str, layout: dict) -> None:
+    """
+    Conecta un proceso del grupo al catálogo en memoria compartida.
+
+    Args:
+        name (str): Nombre del bloque de memoria compartida.
+        layout (dict): Descripción del bloque (ver ShardedCatalog._collect_arrays).
+    """
+    global _worker  # pylint: disable=global-statement
+    memory = shared_memory.SharedMemory(name=name)
+    arrays = {}
+    for block in layout['blocks']:
+        arrays[(block['kind'], block['name'])] = np.ndarray(
+            (layout['rows'],), dtype=np.dtype(block['dtype']), buffer=memory.buf,
+            offset=block['offset']
+        )
+    _worker = {'memory': memory, 'arrays': arrays, 'layout': layout}
+
+
+def _shard_catalog(start: int, stop: int) -> CarCatalog:
+    """
+    Construye el catálogo de un fragmento sobre la memoria compartida, sin copiar sus
+    filas. Las columnas de texto se sustituyen por sus códigos, ya que la similitud de
+    contenido solo las usa a través de sus codificaciones.
+
+    Args:
+        start (int): Primera fila del fragmento.
+        stop (int): Fila siguiente a la última del fragmento.
+
+    Returns:
+        CarCatalog: El catálogo del fragmento, con las estadísticas del catálogo completo.
+    """
+    arrays, layout = _worker['arrays'], _worker['layout']
+    data = {
+        column: arrays[('values' if column in layout['numeric'] else 'codes', column)][
+            start:stop]
+        for column in layout['columns']
+    }
+    encodings = {
+        column: CategoryEncoding(arrays[('codes', column)][start:stop], categories)
+        for column, categories in layout['categories'].items()
+    }
+    return CarCatalog(pd.DataFrame(data, copy=False), encodings=encodings,
+                      stats=layout['stats'])
+
+
+def _shard_content_max(start: int, stop: int, user_input: dict,
+                       feature_weights: dict) -> float:
+    """
+    Calcula el máximo de la similitud de contenido sin normalizar de un fragmento.
+
+    Args:
+        start (int): Primera fila del fragmento.
+        stop (int): Fila siguiente a la última del fragmento.
+        user_input (dict): Características y valores proporcionados por el usuario.
+        feature_weights (dict): Pesos de las características, ya normalizados.
+
+    Returns:
+        float: El máximo del fragmento.
+    """
+    raw_score = ContentFilter.raw_score(user_input, _shard_catalog(start, stop),
+                                        feature_weights)
+    return float(np.fmax.reduce(raw_score, initial=-np.inf))
+
+
+def _shard_top_k(start: int, stop: int, user_input: dict, feature_weights: dict,
+                 max_score: float, province_scores: tuple, model_scores: np.ndarray,
+                 top_k: int) -> tuple:
+    """
+    Calcula la puntuación híbrida de un fragmento y selecciona sus top_k mejores coches.
+
+    Args:
+        start (int): Primera fila del fragmento.
+        stop (int): Fila siguiente a la última del fragmento.
+        user_input (dict): Características y valores proporcionados por el usuario.
+        feature_weights (dict): Pesos de las características, ya normalizados.
+        max_score (float): Máximo de la similitud sin normalizar en todo el catálogo.
+        province_scores (tuple): Distancia y penalización de cada provincia.
+        model_scores (np.ndarray): Puntuación colaborativa de cada modelo.
+        top_k (int): Número de coches a seleccionar, o None para todos.
+
+    Returns:
+        tuple: Posiciones de los coches seleccionados en el catálogo completo y
+        diccionario con sus puntuaciones.
+    """
+    catalog = _shard_catalog(start, stop)
+    similarity_score = ContentFilter.normalize_score(
+        ContentFilter.raw_score(user_input, catalog, feature_weights), max_score
+    )
+    province_codes = catalog.encoding('province').codes
+    distance = province_scores[0][province_codes]
+    geo_score = province_scores[1][province_codes]
+    collaborative_score = model_scores[_worker['arrays'][('models', None)][start:stop]]
+    hybrid_score = (
+        similarity_score * 0.4 +
+        collaborative_score * 0.3 +
+        geo_score * 0.3
+    )
+    best = top_k_indices(hybrid_score, top_k)
+    scores = {'similarity_score': similarity_score, 'distance': distance,
+              'geo_score': geo_score, 'collaborative_score': collaborative_score,
+              'hybrid_score': hybrid_score}
+    return best + start, {column: scores[column][best] for column in SCORE_COLUMNS}
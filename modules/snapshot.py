@@ -0,0 +1,346 @@
+"""
+Este módulo contiene la clase ColumnarSnapshot, que guarda una copia binaria y columnar de un
+archivo CSV para que las siguientes cargas puedan mapearla en memoria en lugar de volver a
+interpretar el texto.
+"""
+
+import hashlib
+import json
+import os
+import tempfile
+import numpy as np
+import pandas as pd
+from .catalog import CatalogStats, CategoryEncoding
+
+
+class ColumnarSnapshot:
+    """
+    ColumnarSnapshot gestiona la instantánea binaria de un archivo CSV.
+
+    El archivo de la instantánea contiene una cabecera JSON seguida de un bloque binario
+    alineado por columna: los arrays numéricos con su tipo original, las columnas de texto
+    como códigos enteros más su diccionario y, opcionalmente, las codificaciones y
+    estadísticas del catálogo. La instantánea se reconstruye automáticamente cuando cambia
+    el tamaño, la fecha de modificación o el contenido (hash SHA-256) del CSV.
+
+    Atributos:
+        source_path (str): Ruta al archivo CSV original.
+        snapshot_path (str): Ruta al archivo de la instantánea.
+        encodings (dict): Codificaciones del catálogo leídas de la instantánea.
+        stats (CatalogStats): Estadísticas del catálogo leídas de la instantánea.
+        source_hash (str): Hash SHA-256 del CSV del que se construyó la instantánea leída.
+    """
+    MAGIC = b'CARSNAP1'
+    FORMAT_VERSION = 1
+    ALIGNMENT = 64
+
+    def __init__(self, source_path: str, snapshot_path: str = None):
+        """
+        Inicializa una instancia de la clase ColumnarSnapshot.
+
+        Args:
+            source_path (str): Ruta al archivo CSV original.
+            snapshot_path (str): Ruta al archivo de la instantánea.
+                                 Por defecto es la ruta del CSV con la extensión '.snap'.
+        """
+        self.source_path = source_path
+        self.snapshot_path = snapshot_path or f"{source_path}.snap"
+        self.encodings = {}
+        self.stats = None
+        self.source_hash = None
+
+    def load(self, encoded_columns=()) -> pd.DataFrame:
+        """
+        Carga los datos desde la instantánea, reconstruyéndola antes si no existe o si el
+        CSV ha cambiado. Si no se puede escribir la instantánea, se lee el CSV directamente.
+
+        Args:
+            encoded_columns (iterable): Columnas cuya codificación por diccionario se guarda
+                                        junto con los datos (ver CarCatalog.ENCODED_COLUMNS).
+
+        Returns:
+            pd.DataFrame: Los datos del CSV, con las columnas de texto como categorías.
+        """
+        header = self._read_valid_header()
+        if header is None:
+            df = pd.read_csv(self.source_path)
+            try:
+                self.write(df, encoded_columns)
+            except OSError as exception:
+                print(f"No se pudo guardar la instantánea de {self.source_path}: {exception}")
+                return df
+            header = self._read_header()
+        return self._load_columns(header)
+
+    def write(self, df: pd.DataFrame, encoded_columns=()) -> None:
+        """
+        Escribe la instantánea de un DataFrame leído del CSV original. El archivo se escribe
+        primero en un temporal y se sustituye de forma atómica.
+
+        Args:
+            df (pd.DataFrame): Datos leídos del CSV original.
+            encoded_columns (iterable): Columnas cuya codificación por diccionario se guarda.
+        """
+        buffers = []
+        columns = []
+        for name in df.columns:
+            series = df[name]
+            if pd.api.types.is_numeric_dtype(series):
+                columns.append({'name': name, 'kind': 'numeric',
+                                'data': self._add_buffer(buffers, series.to_numpy())})
+            else:
+                categorical = pd.Categorical(series)
+                columns.append({'name': name, 'kind': 'category',
+                                'data': self._add_buffer(buffers, categorical.codes),
+                                'categories': categorical.categories.tolist()})
+
+        encodings = {}
+        for name in encoded_columns:
+            if name in df.columns:
+                encoding = CategoryEncoding.from_series(df[name])
+                encodings[name] = {'data': self._add_buffer(buffers, encoding.codes),
+                                   'categories': encoding.categories}
+
+        stats = CatalogStats.from_dataframe(df)
+        header = {
+            'format_version': self.FORMAT_VERSION,
+            'source': self._source_signature(with_hash=True),
+            'rows': len(df),
+            'columns': columns,
+            'encodings': encodings,
+            'stats': {
+                name: {'dtype': np.asarray(stats.minimums[name]).dtype.str,
+                       'min': stats.minimums[name].item(), 'max': stats.maximums[name].item()}
+                for name in stats.minimums
+            }
+        }
+        header_bytes = json.dumps(header, ensure_ascii=False).encode('utf-8')
+        data_start = self._align(len(self.MAGIC) + 8 + len(header_bytes))
+
+        directory = os.path.dirname(os.path.abspath(self.snapshot_path))
+        descriptor, temp_path = tempfile.mkstemp(dir=directory, suffix='.tmp')
+        try:
+            with os.fdopen(descriptor, 'wb') as snapshot_file:
+                snapshot_file.write(self.MAGIC)
+                snapshot_file.write(len(header_bytes).to_bytes(8, 'little'))
+                snapshot_file.write(header_bytes)
+                for offset, array in buffers:
+                    snapshot_file.seek(data_start + offset)
+                    snapshot_file.write(np.ascontiguousarray(array).tobytes())
+                snapshot_file.flush()
+                os.fsync(snapshot_file.fileno())
+            os.replace(temp_path, self.snapshot_path)
+        except BaseException:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+            raise
+
+    def _add_buffer(self, buffers: list, array: np.ndarray) -> dict:
+        """
+        Reserva un bloque alineado para un array y devuelve su descripción para la cabecera.
+
+        Args:
+            buffers (list): Lista de pares (desplazamiento, array) ya reservados.
+            array (np.ndarray): Array a guardar.
+
+        Returns:
+            dict: Desplazamiento relativo y tipo del bloque.
+        """
+        offset = 0
+        if buffers:
+            last_offset, last_array = buffers[-1]
+            offset = self._align(last_offset + last_array.nbytes)
+        buffers.append((offset, array))
+        return {'offset': offset, 'dtype': array.dtype.str}
+
+    def _align(self, position: int) -> int:
+        return -(-position // self.ALIGNMENT) * self.ALIGNMENT
+
+    def _source_signature(self, with_hash: bool) -> dict:
+        """
+        Obtiene el tamaño, la fecha de modificación y, opcionalmente, el hash del CSV.
+
+        Args:
+            with_hash (bool): Si es True, calcula también el hash SHA-256 del contenido.
+
+        Returns:
+            dict: La firma del archivo CSV.
+        """
+        stat = os.stat(self.source_path)
+        signature = {'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns}
+        if with_hash:
+            signature['sha256'] = file_sha256(self.source_path)
+        return signature
+
+    def _read_header(self):
+        """
+        Lee la cabecera de la instantánea.
+
+        Returns:
+            dict: La cabecera, o None si el archivo no existe o no es una instantánea válida.
+        """
+        try:
+            with open(self.snapshot_path, 'rb') as snapshot_file:
+                if snapshot_file.read(len(self.MAGIC)) != self.MAGIC:
+                    return None
+                header_size = int.from_bytes(snapshot_file.read(8), 'little')
+                header = json.loads(snapshot_file.read(header_size).decode('utf-8'))
+        except (OSError, ValueError):
+            return None
+        if header.get('format_version') != self.FORMAT_VERSION:
+            return None
+        header['data_start'] = self._align(len(self.MAGIC) + 8 + header_size)
+        return header
+
+    def _read_valid_header(self):
+        """
+        Lee la cabecera de la instantánea y comprueba que corresponde al CSV actual.
+
+        Si el tamaño y la fecha de modificación coinciden, la instantánea se da por válida.
+        Si solo ha cambiado la fecha de modificación pero el hash del contenido coincide,
+        se reescribe la instantánea con la firma actual sin volver a leer el CSV.
+
+        Returns:
+            dict: La cabecera, o None si hay que reconstruir la instantánea.
+        """
+        header = self._read_header()
+        if header is None:
+            return None
+        stored = header['source']
+        current = self._source_signature(with_hash=False)
+        if stored['size'] == current['size'] and stored['mtime_ns'] == current['mtime_ns']:
+            return header
+        if stored['size'] != current['size'] or file_sha256(self.source_path) != stored['sha256']:
+            return None
+        try:
+            self.write(self._load_columns(header), list(header['encodings']))
+        except OSError:
+            return header
+        return self._read_header()
+
+    def open(self, encoded_columns=()) -> dict:
+        """
+        Comprueba que la instantánea corresponde al CSV actual, reconstruyéndola si hace
+        falta, y devuelve su cabecera sin mapear los datos. Permite leer la instantánea
+        por fragmentos con read_rows.
+
+        Args:
+            encoded_columns (iterable): Columnas cuya codificación se guarda si hay que
+                                        reconstruir la instantánea.
+
+        Returns:
+            dict: La cabecera de la instantánea.
+
+        Raises:
+            OSError: Si no se puede escribir la instantánea.
+        """
+        header = self._read_valid_header()
+        if header is None:
+            self.write(pd.read_csv(self.source_path), encoded_columns)
+            header = self._read_header()
+        self.stats = self._header_stats(header)
+        return header
+
+    def read_rows(self, header: dict, start: int, stop: int) -> tuple:
+        """
+        Lee un fragmento de filas de la instantánea. Solo se copian en memoria las filas
+        del fragmento; el resto del archivo sigue mapeado sin leer.
+
+        Args:
+            header (dict): Cabecera de la instantánea (ver open).
+            start (int): Primera fila del fragmento.
+            stop (int): Fila siguiente a la última del fragmento.
+
+        Returns:
+            tuple: El DataFrame del fragmento y las codificaciones de sus columnas.
+        """
+        data = {}
+        for column in header['columns']:
+            values = self._column_array(header, column['data'])[start:stop]
+            if column['kind'] == 'category':
+                values = pd.Categorical.from_codes(values, categories=column['categories'])
+            data[column['name']] = values
+        encodings = {
+            name: CategoryEncoding(self._column_array(header, block['data'])[start:stop],
+                                   block['categories'])
+            for name, block in header['encodings'].items()
+        }
+        return pd.DataFrame(data, index=pd.RangeIndex(start, stop)), encodings
+
+    def _column_array(self, header: dict, block: dict) -> np.ndarray:
+        """
+        Mapea en memoria uno de los bloques de la instantánea.
+
+        Args:
+            header (dict): Cabecera de la instantánea.
+            block (dict): Descripción del bloque (desplazamiento y tipo).
+
+        Returns:
+            np.ndarray: Los valores del bloque.
+        """
+        if not header['rows']:
+            return np.empty(0, dtype=np.dtype(block['dtype']))
+        return np.memmap(self.snapshot_path, dtype=np.dtype(block['dtype']), mode='c',
+                         offset=header['data_start'] + block['offset'],
+                         shape=(header['rows'],))
+
+    @staticmethod
+    def _header_stats(header: dict) -> CatalogStats:
+        """
+        Construye las estadísticas del catálogo guardadas en la cabecera.
+
+        Args:
+            header (dict): Cabecera de la instantánea.
+
+        Returns:
+            CatalogStats: Las estadísticas, con el tipo original de cada columna.
+        """
+        return CatalogStats(
+            {name: np.dtype(block['dtype']).type(block['min'])
+             for name, block in header['stats'].items()},
+            {name: np.dtype(block['dtype']).type(block['max'])
+             for name, block in header['stats'].items()}
+        )
+
+    def _load_columns(self, header: dict) -> pd.DataFrame:
+        """
+        Mapea en memoria los bloques de la instantánea y construye el DataFrame.
+
+        Args:
+            header (dict): Cabecera de la instantánea.
+
+        Returns:
+            pd.DataFrame: Los datos de la instantánea.
+        """
+        data = {}
+        for column in header['columns']:
+            values = self._column_array(header, column['data'])
+            if column['kind'] == 'category':
+                values = pd.Categorical.from_codes(values, categories=column['categories'])
+            data[column['name']] = values
+
+        self.encodings = {
+            name: CategoryEncoding(self._column_array(header, block['data']),
+                                   block['categories'])
+            for name, block in header['encodings'].items()
+        }
+        self.stats = self._header_stats(header)
+        self.source_hash = header['source']['sha256']
+        return pd.DataFrame(data, copy=False)
+
+
+def file_sha256(path: str) -> str:
+    """
+    Calcula el hash SHA-256 del contenido de un archivo.
+
+    Args:
+        path (str): Ruta al archivo.
+
+    Returns:
+        str: El hash en hexadecimal.
+    """
+    digest = hashlib.sha256()
+    with open(path, 'rb') as source_file:
+        for block in iter(lambda: source_file.read(1 << 20), b''):
+            digest.update(block)
+    return digest.hexdigest()
@@ -0,0 +1,139 @@
+"""
+Este módulo contiene la clase CatalogStream, que recorre un catálogo de coches por
+fragmentos de tamaño fijo, desde su instantánea binaria o desde el CSV, para poder puntuar
+catálogos que no caben completos en memoria.
+"""
+
+import os
+import numpy as np
+import pandas as pd
+from .catalog import CarCatalog, CatalogStats
+from .snapshot import ColumnarSnapshot
+
+
+class CatalogStream:
+    """
+    CatalogStream proporciona el catálogo de coches como una secuencia de fragmentos.
+
+    Cada fragmento es un CarCatalog con las filas del fragmento y las estadísticas del
+    catálogo completo, de modo que la similitud de cada coche es la misma que en el
+    catálogo completo. Las estadísticas se leen de la cabecera de la instantánea o, si se
+    lee el CSV directamente, se calculan con una pasada previa sobre el CSV que se repite
+    solo cuando el archivo cambia. En memoria solo se mantiene un fragmento cada vez.
+
+    Atributos:
+        source_path (str): Ruta al archivo CSV de coches.
+        chunk_size (int): Número de coches de cada fragmento.
+        use_snapshot (bool): Indica si se lee la instantánea binaria en lugar del CSV.
+        snapshot (ColumnarSnapshot): Instantánea binaria del CSV de coches.
+    """
+    DEFAULT_CHUNK_SIZE = 100_000
+
+    def __init__(self, source_path: str, chunk_size: int = DEFAULT_CHUNK_SIZE,
+                 use_snapshot: bool = True):
+        """
+        Inicializa una instancia de la clase CatalogStream.
+
+        Args:
+            source_path (str): Ruta al archivo CSV de coches.
+            chunk_size (int): Número de coches de cada fragmento.
+            use_snapshot (bool): Si es True, los fragmentos se leen de la instantánea
+                                 binaria, que se construye si no existe.
+
+        Raises:
+            ValueError: Si chunk_size no es positivo.
+        """
+        if chunk_size <= 0:
+            raise ValueError("El tamaño de fragmento debe ser positivo.")
+        self.source_path = source_path
+        self.chunk_size = chunk_size
+        self.use_snapshot = use_snapshot
+        self.snapshot = ColumnarSnapshot(source_path)
+        self._csv_stats = None  # Estadísticas del CSV y firma del archivo del que se leyeron
+
+    def stats(self) -> CatalogStats:
+        """
+        Devuelve las estadísticas (mínimos y máximos) del catálogo completo.
+
+        Returns:
+            CatalogStats: Las estadísticas del catálogo.
+        """
+        if self._snapshot_header() is not None:
+            return self.snapshot.stats
+        return self._scan_csv_stats()
+
+    def chunks(self):
+        """
+        Recorre el catálogo por fragmentos, en el orden del archivo.
+
+        Yields:
+            CarCatalog: Las filas de cada fragmento, indexadas por su posición en el
+            catálogo completo, con las estadísticas del catálogo completo.
+        """
+        header = self._snapshot_header()
+        if header is not None:
+            stats = self.snapshot.stats
+            for start in range(0, header['rows'], self.chunk_size):
+                data, encodings = self.snapshot.read_rows(
+                    header, start, min(start + self.chunk_size, header['rows'])
+                )
+                yield CarCatalog(data, encodings=encodings, stats=stats)
+            return
+
+        stats = self._scan_csv_stats()
+        start = 0
+        for data in self._read_csv():
+            data.index = pd.RangeIndex(start, start + len(data))
+            start += len(data)
+            yield CarCatalog(data, stats=stats)
+
+    def _snapshot_header(self):
+        """
+        Devuelve la cabecera de la instantánea, construyéndola si hace falta. Si no se
+        puede escribir la instantánea, el catálogo se lee desde el CSV a partir de entonces.
+
+        Returns:
+            dict: La cabecera de la instantánea, o None si se lee el CSV.
+        """
+        if not self.use_snapshot:
+            return None
+        try:
+            return self.snapshot.open(CarCatalog.ENCODED_COLUMNS)
+        except OSError as exception:
+            print(f"No se pudo guardar la instantánea de {self.source_path}: {exception}")
+            self.use_snapshot = False
+            return None
+
+    def _read_csv(self):
+        """
+        Lee el CSV por fragmentos.
+
+        Returns:
+            Iterador sobre los DataFrames de cada fragmento.
+        """
+        return pd.read_csv(self.source_path, chunksize=self.chunk_size)
+
+    def _scan_csv_stats(self) -> CatalogStats:
+        """
+        Calcula las estadísticas del CSV con una pasada por fragmentos. El resultado se
+        reutiliza mientras el archivo no cambie.
+
+        Returns:
+            CatalogStats: Las estadísticas del catálogo.
+        """
+        stat = os.stat(self.source_path)
+        signature = (stat.st_size, stat.st_mtime_ns)
+        if self._csv_stats is not None and self._csv_stats[0] == signature:
+            return self._csv_stats[1]
+
+        minimums, maximums = {}, {}
+        for data in self._read_csv():
+            chunk_stats = CatalogStats.from_dataframe(data)
+            # fmin y fmax ignoran los fragmentos en los que la columna solo tiene NaN
+            for column, value in chunk_stats.minimums.items():
+                minimums[column] = np.fmin(minimums.get(column, value), value)
+            for column, value in chunk_stats.maximums.items():
+                maximums[column] = np.fmax(maximums.get(column, value), value)
+        stats = CatalogStats(minimums, maximums)
+        self._csv_stats = (signature, stats)
+        return stats
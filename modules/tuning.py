@@ -0,0 +1,412 @@
+"""
+Este módulo busca los hiperparámetros del modelo colaborativo mediante validación cruzada,
+evaluando varias configuraciones del modelo SVD en paralelo, y guarda la mejor en el
+archivo que lee CollaborativeFilter.train_model.
+
+Uso:
+    python -m modules.tuning --ratings data/car_ratings.csv --search halving --configs 27
+    python -m modules.tuning --search random --configs 20 --folds 5 --workers 4
+"""
+
+import argparse
+import datetime
+import json
+import math
+import os
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+import numpy as np
+import pandas as pd
+from .collaborative_filter import CollaborativeFilter
+from .snapshot import file_sha256
+
+_worker = None  # Valoraciones compartidas a las que está conectado cada proceso
+
+
+class HyperparameterSearch:
+    """
+    HyperparameterSearch evalúa configuraciones del modelo SVD con validación cruzada.
+
+    Las valoraciones se leen y se codifican una sola vez (usuarios y modelos como códigos
+    enteros, más el pliegue de validación de cada valoración) y se copian en memoria
+    compartida, a la que se conectan todos los procesos del grupo. Las configuraciones se
+    evalúan pliegue a pliegue: cada tarea entrena y evalúa una configuración en un pliegue,
+    y tras cada pliegue se deja de evaluar (poda) toda configuración cuyo error medio
+    supera claramente al de la mejor en los mismos pliegues. Como la poda solo depende de
+    los errores y no del orden en que terminan los procesos, la búsqueda da el mismo
+    resultado con la misma semilla sea cual sea el número de procesos.
+
+    Atributos:
+        ratings_path (str): Ruta al archivo CSV de valoraciones.
+        folds (int): Número de pliegues de la validación cruzada.
+        workers (int): Número de procesos del grupo.
+        seed (int): Semilla de los pliegues, del muestreo y del entrenamiento.
+        tolerance (float): Margen relativo sobre el mejor error a partir del cual se poda
+                           una configuración.
+        rating_scale (tuple): Calificaciones mínima y máxima.
+        evaluated (int): Número de configuraciones distintas evaluadas por la última
+                         búsqueda.
+    """
+    # Espacio de búsqueda: valores posibles o intervalo logarítmico de cada hiperparámetro
+    FACTORS = [5, 10, 20, 50, 100]
+    EPOCHS = [10, 20, 30, 50]
+    LEARNING_RATES = (0.001, 0.02)
+    REGULARIZATIONS = (0.01, 1.0)
+
+    def __init__(self, ratings_path: str, folds: int = 3, workers: int = None, seed: int = 0,
+                 tolerance: float = 0.02, rating_scale: tuple = (1, 5)):
+        """
+        Inicializa una instancia de la clase HyperparameterSearch y codifica las
+        valoraciones.
+
+        Args:
+            ratings_path (str): Ruta al archivo CSV de valoraciones.
+            folds (int): Número de pliegues de la validación cruzada.
+            workers (int): Número de procesos. Por defecto, uno por núcleo.
+            seed (int): Semilla de los pliegues, del muestreo y del entrenamiento.
+            tolerance (float): Margen relativo sobre el mejor error para podar.
+            rating_scale (tuple): Calificaciones mínima y máxima.
+
+        Raises:
+            ValueError: Si hay menos de dos pliegues.
+        """
+        if folds < 2:
+            raise ValueError("La validación cruzada necesita al menos dos pliegues.")
+        self.ratings_path = ratings_path
+        self.folds = folds
+        self.workers = workers or os.cpu_count() or 1
+        self.seed = seed
+        self.tolerance = tolerance
+        self.rating_scale = tuple(rating_scale)
+        self.evaluated = 0
+        self._random = np.random.default_rng(seed)
+
+        df_ratings = pd.read_csv(ratings_path)
+        arrays = {
+            'users': pd.factorize(df_ratings['user_id'])[0].astype(np.int32),
+            'items': pd.factorize(df_ratings['model_id'])[0].astype(np.int32),
+            'ratings': df_ratings['rating'].to_numpy(dtype=float),
+            'folds': (self._random.permutation(len(df_ratings)) % folds).astype(np.int8)
+        }
+        self._rows = len(df_ratings)
+        self._memory = shared_memory.SharedMemory(
+            create=True, size=max(1, sum(array.nbytes for array in arrays.values()))
+        )
+        self._layout = {}
+        offset = 0
+        for name, array in arrays.items():
+            np.ndarray(array.shape, dtype=array.dtype, buffer=self._memory.buf,
+                       offset=offset)[:] = array
+            self._layout[name] = (array.dtype.str, offset)
+            offset += array.nbytes
+
+    def sample(self, n_configs: int, with_epochs: bool = True) -> list:
+        """
+        Muestrea configuraciones al azar del espacio de búsqueda.
+
+        Args:
+            n_configs (int): Número de configuraciones.
+            with_epochs (bool): Si es False, no se muestrea el número de épocas (lo fija
+                                la búsqueda por reducción sucesiva).
+
+        Returns:
+            list: Las configuraciones, como diccionarios de hiperparámetros de SVD.
+        """
+        configs = []
+        for _ in range(n_configs):
+            config = {
+                'n_factors': int(self._random.choice(self.FACTORS)),
+                'lr_all': float(np.exp(self._random.uniform(*np.log(self.LEARNING_RATES)))),
+                'reg_all': float(np.exp(self._random.uniform(*np.log(self.REGULARIZATIONS))))
+            }
+            if with_epochs:
+                config['n_epochs'] = int(self._random.choice(self.EPOCHS))
+            configs.append(config)
+        return configs
+
+    def random_search(self, n_configs: int = 20) -> list:
+        """
+        Evalúa configuraciones muestreadas al azar con todas sus épocas.
+
+        Args:
+            n_configs (int): Número de configuraciones.
+
+        Returns:
+            list: Resultados ordenados de mejor a peor (ver evaluate).
+        """
+        return self.evaluate(self.sample(n_configs))
+
+    def successive_halving(self, n_configs: int = 27, min_epochs: int = 5,
+                           max_epochs: int = 45, eta: int = 3) -> list:
+        """
+        Búsqueda por reducción sucesiva: todas las configuraciones se entrenan primero con
+        pocas épocas y en cada ronda solo la mejor fracción 1/eta pasa a entrenarse con eta
+        veces más épocas, hasta max_epochs. La mayor parte del tiempo se dedica así a las
+        configuraciones prometedoras.
+
+        Args:
+            n_configs (int): Número de configuraciones iniciales.
+            min_epochs (int): Épocas de la primera ronda.
+            max_epochs (int): Épocas máximas.
+            eta (int): Factor de reducción de cada ronda.
+
+        Returns:
+            list: Resultados de la última ronda ordenados de mejor a peor (ver evaluate).
+        """
+        configs = self.sample(n_configs, with_epochs=False)
+        epochs = min_epochs
+        while True:
+            results = self.evaluate([dict(config, n_epochs=epochs) for config in configs])
+            print(f"Ronda de {epochs} épocas: {len(configs)} configuraciones, "
+                  f"mejor RMSE {results[0]['rmse']:.4f}")
+            if epochs >= max_epochs or len(configs) <= 1:
+                self.evaluated = n_configs
+                return results
+            survivors = [result for result in results if not result['pruned']]
+            keep = max(1, math.ceil(len(configs) / eta))
+            configs = [{key: value for key, value in result['params'].items()
+                        if key != 'n_epochs'} for result in survivors[:keep]]
+            epochs = min(epochs * eta, max_epochs)
+
+    def evaluate(self, configs: list) -> list:
+        """
+        Evalúa varias configuraciones en paralelo con validación cruzada, pliegue a
+        pliegue. Después de cada pliegue salvo el último se podan las configuraciones cuyo
+        error medio supera en más de tolerance al menor error medio en esos pliegues.
+
+        Args:
+            configs (list): Configuraciones a evaluar.
+
+        Returns:
+            list: Un diccionario por configuración con 'params', 'rmse' (error medio de los
+            pliegues evaluados), 'fold_rmse' y 'pruned', ordenados de mejor a peor. Las
+            configuraciones podadas quedan al final.
+        """
+        results = [{'params': params, 'rmse': math.inf, 'fold_rmse': [], 'pruned': False}
+                   for params in configs]
+        with ProcessPoolExecutor(max_workers=self.workers, initializer=_attach,
+                                 initargs=(self._memory.name, self._rows, self._layout,
+                                           self.rating_scale)) as executor:
+            for fold in range(self.folds):
+                active = [result for result in results if not result['pruned']]
+                fold_rmse = executor.map(
+                    _evaluate_fold, [result['params'] for result in active],
+                    [fold] * len(active), [self.seed] * len(active)
+                )
+                for result, rmse in zip(active, fold_rmse):
+                    result['fold_rmse'].append(rmse)
+                    result['rmse'] = float(np.mean(result['fold_rmse']))
+                if fold + 1 < self.folds and active:
+                    best = min(result['rmse'] for result in active)
+                    for result in active:
+                        result['pruned'] = result['rmse'] > best * (1 + self.tolerance)
+        self.evaluated = len(configs)
+        return sorted(results, key=lambda result: (result['pruned'], result['rmse']))
+
+    def save(self, results: list, path: str = CollaborativeFilter.PARAMS_PATH) -> dict:
+        """
+        Guarda la mejor configuración en el archivo de hiperparámetros del modelo
+        colaborativo, de forma atómica, junto con el número de configuraciones evaluadas
+        por la búsqueda.
+
+        Args:
+            results (list): Resultados ordenados de mejor a peor.
+            path (str): Ruta del archivo de hiperparámetros.
+
+        Returns:
+            dict: El contenido guardado.
+        """
+        winner = results[0]
+        content = {
+            'params': winner['params'],
+            'rmse': winner['rmse'],
+            'folds': self.folds,
+            'evaluated': self.evaluated or len(results),
+            'ratings_sha256': file_sha256(self.ratings_path),
+            'created': datetime.datetime.now().isoformat(timespec='seconds')
+        }
+        directory = os.path.dirname(os.path.abspath(path))
+        descriptor, temp_path = tempfile.mkstemp(dir=directory, suffix='.tmp')
+        try:
+            with os.fdopen(descriptor, 'w', encoding='utf-8') as params_file:
+                json.dump(content, params_file, indent=2)
+            os.replace(temp_path, path)
+        except BaseException:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+            raise
+        return content
+
+    def close(self) -> None:
+        """
+        Libera la memoria compartida.
+        """
+        self._memory.close()
+        self._memory.unlink()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+        return False
+
+
+def _attach(name: str, rows: int, layout: dict, rating_scale: tuple) -> None:
+    """
+    Conecta un proceso del grupo a las valoraciones en memoria compartida.
+
+    Args:
+        name (str): Nombre del bloque de memoria compartida.
+        rows (int): Número de valoraciones.
+        layout (dict): Tipo y desplazamiento de cada array.
+        rating_scale (tuple): Calificaciones mínima y máxima.
+    """
+    global _worker  # pylint: disable=global-statement
+    memory = shared_memory.SharedMemory(name=name)
+    arrays = {array_name: np.ndarray((rows,), dtype=np.dtype(dtype), buffer=memory.buf,
+                                     offset=offset)
+              for array_name, (dtype, offset) in layout.items()}
+    _worker = {'memory': memory, 'arrays': arrays, 'rating_scale': rating_scale,
+               'n_users': int(arrays['users'].max(initial=-1)) + 1,
+               'n_items': int(arrays['items'].max(initial=-1)) + 1}
+
+
+def _build_trainset(users: np.ndarray, items: np.ndarray, ratings: np.ndarray):
+    """
+    Construye el conjunto de entrenamiento de surprise a partir de valoraciones ya
+    codificadas, sin pasar por el CSV.
+
+    Args:
+        users (np.ndarray): Código de usuario de cada valoración.
+        items (np.ndarray): Código de modelo de cada valoración.
+        ratings (np.ndarray): Calificación de cada valoración.
+
+    Returns:
+        tuple: El conjunto de entrenamiento y los arrays que traducen cada código de
+        usuario y de modelo a su ID interno (-1 si no aparece en el entrenamiento).
+    """
+    from surprise import Trainset  # pylint: disable=import-outside-toplevel
+
+    inner_users, user_codes = pd.factorize(users)
+    inner_items, item_codes = pd.factorize(items)
+    ur, ir = {}, {}
+    for user, item, rating in zip(inner_users.tolist(), inner_items.tolist(),
+                                  ratings.tolist()):
+        ur.setdefault(user, []).append((item, rating))
+        ir.setdefault(item, []).append((user, rating))
+    trainset = Trainset(ur, ir, len(user_codes), len(item_codes), len(ratings),
+                        _worker['rating_scale'],
+                        {int(code): inner for inner, code in enumerate(user_codes)},
+                        {int(code): inner for inner, code in enumerate(item_codes)})
+
+    user_map = np.full(_worker['n_users'], -1)
+    user_map[user_codes] = np.arange(len(user_codes))
+    item_map = np.full(_worker['n_items'], -1)
+    item_map[item_codes] = np.arange(len(item_codes))
+    return trainset, user_map, item_map
+
+
+def _rmse(model, inner_users: np.ndarray, inner_items: np.ndarray,
+          ratings: np.ndarray) -> float:
+    """
+    Calcula el error cuadrático medio de un modelo en las valoraciones de prueba, con las
+    mismas reglas que SVD.predict para usuarios y modelos desconocidos.
+
+    Args:
+        model (surprise.SVD): El modelo entrenado.
+        inner_users (np.ndarray): ID interno del usuario de cada valoración, o -1.
+        inner_items (np.ndarray): ID interno del modelo de cada valoración, o -1.
+        ratings (np.ndarray): Calificación de cada valoración.
+
+    Returns:
+        float: El error cuadrático medio.
+    """
+    known_users = inner_users >= 0
+    known_items = inner_items >= 0
+    both = known_users & known_items
+
+    estimates = np.full(len(ratings), model.trainset.global_mean)
+    if model.biased:
+        estimates[known_users] += model.bu[inner_users[known_users]]
+        estimates[known_items] += model.bi[inner_items[known_items]]
+        estimates[both] += np.einsum('ij,ij->i', model.qi[inner_items[both]],
+                                     model.pu[inner_users[both]])
+    else:
+        estimates[both] = np.einsum('ij,ij->i', model.qi[inner_items[both]],
+                                    model.pu[inner_users[both]])
+    estimates = np.clip(estimates, *model.trainset.rating_scale)
+    return float(np.sqrt(np.mean((estimates - ratings) ** 2)))
+
+
+def _evaluate_fold(params: dict, fold: int, seed: int) -> float:
+    """
+    Entrena una configuración con las valoraciones compartidas de todos los pliegues
+    salvo uno y la evalúa en ese pliegue.
+
+    Args:
+        params (dict): Hiperparámetros del modelo SVD.
+        fold (int): Pliegue de prueba.
+        seed (int): Semilla del entrenamiento.
+
+    Returns:
+        float: El error cuadrático medio en el pliegue.
+    """
+    from surprise import SVD  # pylint: disable=import-outside-toplevel
+
+    arrays = _worker['arrays']
+    test = arrays['folds'] == fold
+    train = ~test
+    trainset, user_map, item_map = _build_trainset(
+        arrays['users'][train], arrays['items'][train], arrays['ratings'][train]
+    )
+    model = SVD(random_state=seed, **params)
+    model.fit(trainset)
+    return _rmse(model, user_map[arrays['users'][test]], item_map[arrays['items'][test]],
+                 arrays['ratings'][test])
+
+
+def main():
+    """
+    Punto de entrada de la búsqueda de hiperparámetros.
+    """
+    parser = argparse.ArgumentParser(
+        description="Búsqueda de hiperparámetros del modelo colaborativo."
+    )
+    parser.add_argument('--ratings', default='data/car_ratings.csv',
+                        help="Archivo CSV de valoraciones.")
+    parser.add_argument('--search', choices=['halving', 'random'], default='halving',
+                        help="Estrategia de búsqueda (por defecto, reducción sucesiva).")
+    parser.add_argument('--configs', type=int, default=27,
+                        help="Número de configuraciones a evaluar.")
+    parser.add_argument('--folds', type=int, default=3, help="Pliegues de la validación.")
+    parser.add_argument('--workers', type=int,
+                        help="Procesos en paralelo (por defecto, uno por núcleo).")
+    parser.add_argument('--min-epochs', type=int, default=5,
+                        help="Épocas de la primera ronda de la reducción sucesiva.")
+    parser.add_argument('--max-epochs', type=int, default=45,
+                        help="Épocas máximas de la reducción sucesiva.")
+    parser.add_argument('--seed', type=int, default=0, help="Semilla de la búsqueda.")
+    parser.add_argument('--output', default=CollaborativeFilter.PARAMS_PATH,
+                        help="Archivo en el que se guarda la mejor configuración.")
+    args = parser.parse_args()
+
+    with HyperparameterSearch(args.ratings, args.folds, args.workers, args.seed) as search:
+        if args.search == 'halving':
+            results = search.successive_halving(args.configs, args.min_epochs,
+                                                args.max_epochs)
+        else:
+            results = search.random_search(args.configs)
+        content = search.save(results, args.output)
+
+    print(f"\n{'RMSE':>8} {'Pliegues':>8}  Hiperparámetros")
+    for result in results:
+        mark = ' (podada)' if result['pruned'] else ''
+        print(f"{result['rmse']:8.4f} {len(result['fold_rmse']):>8}  "
+              f"{json.dumps(result['params'])}{mark}")
+    print(f"\nMejor configuración guardada en {args.output}: {json.dumps(content['params'])}")
+
+
+if __name__ == '__main__':
+    main()